@@ -39,20 +39,37 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 # AUTH_USER_MODEL = 'washapp.User'
 
 MIDDLEWARE = [
+    'washapp.instrumentation.InstrumentationMiddleware',
+    'washapp.replication.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # AuthenticationMiddleware loading request.user from the cache
+    'washapp.accounts.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-process memory cache; point this at a cache every worker shares, such as
+# Redis or Memcached, and set SHARED_CACHE to cache sessions, request.user and
+# the dashboard stats
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+# Cached sessions, users and stats are only safe when a logout, password change or
+# booking change in one worker clears them for every worker, i.e. with a shared cache
+SHARED_CACHE = False
+SESSION_ENGINE = (
+    'django.contrib.sessions.backends.cached_db' if SHARED_CACHE
+    else 'django.contrib.sessions.backends.db'
+)
+
 ROOT_URLCONF = 'car_wash.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'washapp.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -70,11 +87,29 @@ WSGI_APPLICATION = 'car_wash.wsgi.application'
 # Database
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # SQLite with WAL, tuned pragmas and BEGIN IMMEDIATE transactions
+        'ENGINE': 'washapp.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Keep connections open across requests, checking them before reuse
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # Read-only copy of default, refreshed by `manage.py sync_replicas`
+    'replica': {
+        'ENGINE': 'washapp.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+# Catalog and booking reads go to a synced replica, writes and recent writers to default
+DATABASE_ROUTERS = ['washapp.replication.PrimaryReplicaRouter']
+DATABASE_REPLICAS = ['replica']
+# Seconds a visitor's reads stay on default after they wrote
+REPLICA_PIN_SECONDS = 5
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -100,9 +135,35 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
 
+# Uploads, plus the resized and WebP copies generated from them under media/derivatives/
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+# Uploads are stored once per distinct content, named by their SHA-256
+STORAGES = {
+    'default': {'BACKEND': 'washapp.uploads.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Largest image accepted by the views using washapp.uploads.image_uploads
+MAX_UPLOAD_SIZE = 5 * 1024 * 1024
+# Processes resizing uploaded images; 0 resizes inline in the uploading request
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# Email is queued as jobs and sent by `manage.py run_jobs` through JOBS_EMAIL_BACKEND,
+# many messages per SMTP connection. In development `manage.py debug_smtp` listens on
+# EMAIL_PORT and prints what it receives.
+EMAIL_BACKEND = 'washapp.jobs.QueuedEmailBackend'
+JOBS_EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_HOST = 'localhost'
+EMAIL_PORT = 1025
+DEFAULT_FROM_EMAIL = 'bookings@dirtytoclean.local'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Authentication URLs
 LOGIN_REDIRECT_URL = '/'
-LOGOUT_REDIRECT_URL = '/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/'
+
+# my_bookings pages, overridable per request with ?page_size= up to the maximum
+BOOKINGS_PAGE_SIZE = 25
+BOOKINGS_MAX_PAGE_SIZE = 100
@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from .models import ServiceProvider, User
+
+# Columns kept for request.user; the rest, e.g. address and profile_picture, load on first use
+USER_FIELDS = (
+    'id', 'username', 'first_name', 'last_name', 'email', 'user_type', 'phone',
+    'is_active', 'is_staff', 'is_superuser',
+)
+# Bounds how long a change made without save(), e.g. a queryset update(), goes unseen
+USER_CACHE_TIMEOUT = 60 * 15
+
+
+def user_key(user_id):
+    return f'washapp:user:{user_id}'
+
+
+def provider_id(user):
+    """Id of the user's ServiceProvider, None until they complete provider registration.
+
+    Free for request.user, whose record carries it; other users are looked
+    up once and remembered on the instance.
+    """
+    if not hasattr(user, '_provider_id'):
+        user._provider_id = None
+        if user.user_type == 'service_provider':
+            user._provider_id = ServiceProvider.objects.filter(user=user).values_list('id', flat=True).first()
+    return user._provider_id
+
+
+def user_record(user):
+    """What is cached of a user: the compact columns, session hash and provider id"""
+    return {
+        'values': {field: getattr(user, field) for field in USER_FIELDS},
+        'session_hash': user.get_session_auth_hash(),
+        'provider_id': provider_id(user),
+    }
+
+
+def user_from_record(record):
+    # from_db takes the values in the model's field order
+    fields = [field.attname for field in User._meta.concrete_fields if field.attname in record['values']]
+    user = User.from_db(DEFAULT_DB_ALIAS, fields, [record['values'][field] for field in fields])
+    user._provider_id = record['provider_id']
+    return user
+
+
+def get_user(request):
+    """The session's user, from the cache when possible.
+
+    A hit is accepted only with the same backend and session hash checks
+    Django makes. Misses and anything that fails those checks go through
+    django.contrib.auth.get_user, which also logs out invalid sessions,
+    and a user it returns is cached for the next request. Without
+    SHARED_CACHE every request goes through Django, as invalidating one
+    worker's cache would leave the others trusting a stale user.
+    """
+    if not getattr(settings, 'SHARED_CACHE', False):
+        return auth.get_user(request)
+    user_id = request.session.get(SESSION_KEY)
+    record = cache.get(user_key(user_id)) if user_id is not None else None
+    if record is not None:
+        backend_path = request.session.get(BACKEND_SESSION_KEY)
+        session_hash = request.session.get(HASH_SESSION_KEY)
+        if (backend_path in settings.AUTHENTICATION_BACKENDS and session_hash
+                and constant_time_compare(session_hash, record['session_hash'])):
+            user = user_from_record(record)
+            user.backend = backend_path
+            return user
+
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        cache.set(user_key(user.pk), user_record(user), USER_CACHE_TIMEOUT)
+    return user
+
+
+def invalidate_user(user_id):
+    cache.delete(user_key(user_id))
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware loading request.user through the user cache.
+
+    With SHARED_CACHE and the cached_db session engine a request by a
+    cached user makes no queries at all to authenticate, check its role or
+    find its provider.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
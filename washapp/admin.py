@@ -1,8 +1,29 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.utils.decorators import method_decorator
 from .models import *
+from .uploads import image_uploads
 
-class CustomUserAdmin(UserAdmin):
+class ImageUploadAdmin(admin.ModelAdmin):
+    """Add and change forms taking only image uploads, reporting the rejected ones"""
+
+    def report_upload_errors(self, request):
+        for error in getattr(request, 'upload_errors', []):
+            self.message_user(request, error, messages.ERROR)
+
+    @method_decorator(image_uploads)
+    def add_view(self, request, form_url='', extra_context=None):
+        response = super().add_view(request, form_url, extra_context)
+        self.report_upload_errors(request)
+        return response
+
+    @method_decorator(image_uploads)
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        response = super().change_view(request, object_id, form_url, extra_context)
+        self.report_upload_errors(request)
+        return response
+
+class CustomUserAdmin(ImageUploadAdmin, UserAdmin):
     list_display = ('username', 'email', 'user_type', 'phone', 'date_joined')
     list_filter = ('user_type', 'is_staff', 'is_active')
     fieldsets = UserAdmin.fieldsets + (
@@ -11,9 +32,11 @@ class CustomUserAdmin(UserAdmin):
 
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(ServiceCategory)
-admin.site.register(Service)
+admin.site.register(Service, ImageUploadAdmin)
 admin.site.register(ServiceProvider)
 admin.site.register(Booking)
 admin.site.register(Cart)
 admin.site.register(Review)
-admin.site.register(Payment)
\ No newline at end of file
+admin.site.register(Payment)
+admin.site.register(DailyStats)
+admin.site.register(Job)
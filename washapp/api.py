@@ -0,0 +1,264 @@
+import hashlib
+from functools import wraps
+
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.db.models import Count, Max
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+from .bookings import BOOKING_TABS, encode_key, page_query, page_size
+from .models import Booking, Service, ServiceCategory, ServiceProvider
+
+ID_CURSOR_SALT = 'washapp.api.cursor'
+
+
+def media_url(name):
+    return default_storage.url(name) if name else None
+
+
+class Resource:
+    """A read-only API collection: the fields a client may pick and how rows are paged.
+
+    ``fields`` maps each public field name to the ORM path it is read from,
+    ``convert`` turns raw column values into their JSON form where they
+    differ and ``joins`` names the related model each joined field comes
+    from, whose updated_at then feeds the ETag. Rows are paged by id unless
+    the view pages them itself.
+    """
+
+    def __init__(self, name, fields, default_fields, convert=None, joins=None):
+        self.name = name
+        self.fields = fields
+        self.default_fields = default_fields
+        self.convert = convert or {}
+        self.joins = joins or {}
+
+
+SERVICES = Resource('services', {
+    'id': 'id',
+    'name': 'name',
+    'description': 'description',
+    'price': 'price',
+    'duration': 'duration',
+    'image': 'image',
+    'category': 'category_id',
+    'category_name': 'category__name',
+    'updated_at': 'updated_at',
+}, ('id', 'name', 'price', 'duration', 'category'), convert={'image': media_url}, joins={
+    'category_name': 'category',
+})
+
+CATEGORIES = Resource('categories', {
+    'id': 'id',
+    'name': 'name',
+    'description': 'description',
+    'updated_at': 'updated_at',
+}, ('id', 'name'))
+
+PROVIDERS = Resource('providers', {
+    'id': 'id',
+    'company_name': 'company_name',
+    'address': 'address',
+    'phone': 'phone',
+    'email': 'email',
+    'is_verified': 'is_verified',
+    'rating': 'rating',
+    'rating_count': 'rating_count',
+    'updated_at': 'updated_at',
+}, ('id', 'company_name', 'rating', 'rating_count'))
+
+BOOKINGS = Resource('bookings', {
+    'id': 'id',
+    'status': 'status',
+    'booking_date': 'booking_date',
+    'booking_time': 'booking_time',
+    'service': 'service_id',
+    'service_name': 'service__name',
+    'provider': 'service_provider_id',
+    'provider_name': 'service_provider__company_name',
+    'customer': 'customer_id',
+    'vehicle_type': 'vehicle_type',
+    'vehicle_number': 'vehicle_number',
+    'special_instructions': 'special_instructions',
+    'total_amount': 'total_amount',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}, ('id', 'status', 'booking_date', 'booking_time', 'service_name', 'total_amount'), joins={
+    'service_name': 'service',
+    'provider_name': 'service_provider',
+})
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def api_view(view_func):
+    """Only GET and HEAD, and ApiError turned into a JSON error response"""
+    @wraps(view_func)
+    def wrapper_func(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return JsonResponse({'error': 'This API is read-only'}, status=405, headers={'Allow': 'GET, HEAD'})
+        try:
+            return view_func(request, *args, **kwargs)
+        except ApiError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+    return wrapper_func
+
+
+def int_param(request, name):
+    try:
+        return int(request.GET[name])
+    except ValueError:
+        raise ApiError(f'{name} must be an id')
+
+
+def selected_fields(request, resource):
+    """Field names from ?fields=a,b in the order given, the resource's defaults when absent"""
+    value = request.GET.get('fields')
+    if not value:
+        return list(resource.default_fields)
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in resource.fields]
+    if unknown or not fields:
+        raise ApiError(f'Unknown fields {", ".join(unknown)}; choose from {", ".join(resource.fields)}')
+    return fields
+
+
+def collection_etag(request, resource, queryset, fields, scope=''):
+    """Weak ETag of a listing from the newest updated_at and row count, in one query.
+
+    Any save bumps updated_at and any insert or delete the count, while the
+    query string and ``scope`` keep different pages, field selections and
+    callers apart. The newest updated_at of the related rows behind any
+    selected joined field counts too, so renaming a category changes the
+    ETag of services listed with their category_name.
+    """
+    relations = sorted({resource.joins[field] for field in fields if field in resource.joins})
+    aggregates = {f'latest_{relation}': Max(f'{relation}__updated_at') for relation in relations}
+    state = queryset.order_by().aggregate(latest=Max('updated_at'), count=Count('id'), **aggregates)
+    query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()[:12]
+    # Not commas, which separate the ETags of an If-None-Match header
+    latest = ';'.join(
+        state[key].isoformat() if state[key] else '-'
+        for key in ['latest'] + [f'latest_{relation}' for relation in relations]
+    )
+    return 'W/"%s%s:%s:%d:%s"' % (resource.name, scope, latest, state['count'], query)
+
+
+def not_modified(request, etag):
+    client_etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in client_etags}
+
+
+def serialize(resource, fields, rows):
+    """JSON-ready dicts from values_list tuples, without building model instances"""
+    converters = [resource.convert.get(field) for field in fields]
+    results = []
+    for row in rows:
+        item = {}
+        for field, convert, value in zip(fields, converters, row):
+            item[field] = convert(value) if convert else value
+        results.append(item)
+    return results
+
+
+def respond(request, resource, queryset, page, scope=''):
+    """Answer a listing: a 304 if the client's copy is current, else one page as JSON.
+
+    ``page(fields)`` returns the selected rows of the page, each followed by
+    any extra columns it asked for, and the next cursor.
+    """
+    fields = selected_fields(request, resource)
+    etag = collection_etag(request, resource, queryset, fields, scope)
+    if not_modified(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        rows, next_cursor = page(fields)
+        response = JsonResponse({'results': serialize(resource, fields, rows), 'next': next_cursor})
+    response['ETag'] = etag
+    # Clients must revalidate, which is cheap thanks to the ETag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def id_page(request, resource, queryset):
+    """Page builder paging by ascending id with a signed ?cursor="""
+    size = page_size(request.GET.get('page_size'))
+    cursor = request.GET.get('cursor')
+
+    def page(fields):
+        rows = queryset.order_by('id')
+        if cursor:
+            try:
+                rows = rows.filter(id__gt=signing.Signer(salt=ID_CURSOR_SALT).unsign_object(cursor))
+            except (signing.BadSignature, TypeError, ValueError):
+                raise ApiError('Invalid cursor')
+        columns = [resource.fields[field] for field in fields] + ['id']
+        rows = list(rows.values_list(*columns)[:size + 1])
+        next_cursor = None
+        if len(rows) > size:
+            next_cursor = signing.Signer(salt=ID_CURSOR_SALT).sign_object(rows[size - 1][-1])
+        return rows[:size], next_cursor
+
+    return page
+
+
+@api_view
+def services(request):
+    queryset = Service.objects.all()
+    if request.GET.get('category'):
+        queryset = queryset.filter(category_id=int_param(request, 'category'))
+    return respond(request, SERVICES, queryset, id_page(request, SERVICES, queryset))
+
+
+@api_view
+def categories(request):
+    queryset = ServiceCategory.objects.all()
+    return respond(request, CATEGORIES, queryset, id_page(request, CATEGORIES, queryset))
+
+
+@api_view
+def providers(request):
+    queryset = ServiceProvider.objects.all()
+    if request.GET.get('service'):
+        queryset = queryset.filter(services=int_param(request, 'service'))
+    return respond(request, PROVIDERS, queryset, id_page(request, PROVIDERS, queryset))
+
+
+@api_view
+def bookings(request):
+    """The caller's bookings in my_bookings order, optionally one ?tab= of it"""
+    if not request.user.is_authenticated:
+        raise ApiError('Authentication required', status=401)
+    queryset = Booking.objects.all()
+    if request.user.user_type == 'customer':
+        queryset = queryset.filter(customer=request.user)
+    elif request.user.user_type == 'service_provider':
+        queryset = queryset.filter(service_provider__user=request.user)
+    tab = request.GET.get('tab', 'all')
+    if tab not in BOOKING_TABS:
+        raise ApiError(f'Unknown tab; choose from {", ".join(BOOKING_TABS)}')
+    if BOOKING_TABS[tab]:
+        queryset = queryset.filter(status__in=BOOKING_TABS[tab])
+    size = page_size(request.GET.get('page_size'))
+    cursor = request.GET.get('cursor')
+
+    def page(fields):
+        columns = [BOOKINGS.fields[field] for field in fields] + ['booking_date', 'booking_time', 'id']
+        rows = queryset.order_by('-booking_date', '-booking_time', '-id').values_list(*columns)
+        try:
+            rows = list(page_query(rows, 'all', cursor, size))
+        except ValueError:
+            raise ApiError('Invalid cursor')
+        next_cursor = encode_key(*rows[size - 1][-3:]) if len(rows) > size else None
+        return rows[:size], next_cursor
+
+    response = respond(request, BOOKINGS, queryset, page, scope=f'@{request.user.id}')
+    patch_cache_control(response, private=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
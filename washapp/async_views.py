@@ -0,0 +1,84 @@
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.shortcuts import render
+
+from .accounts import provider_id
+from .bookings import BOOKING_TABS, abooking_page, atab_counts, booking_list, page_size
+from .decorators import async_login_required
+from .models import ServiceProvider
+from .rollups import aadmin_totals, rollup_tab_counts
+from .stats import acustomer_stats, alist, aprovider_stats
+from .views import (
+    EMPTY_CUSTOMER_STATS, EMPTY_PROVIDER_STATS, admin_dashboard_context,
+    customer_dashboard_context, provider_dashboard_context, recent_bookings_query,
+)
+
+# Rendering reads the session for messages, which is sync-only
+arender = sync_to_async(render)
+
+
+@async_login_required
+async def dashboard(request):
+    """Async dashboard, its queries awaited through the async ORM.
+
+    Django 4.2 runs them one at a time on the thread it shares with sync
+    code, so they do not overlap; the event loop serves other requests
+    while they run.
+    """
+    user = request.user
+
+    if user.user_type == 'customer':
+        try:
+            stats = await acustomer_stats(user.id)
+        except Exception:
+            stats = EMPTY_CUSTOMER_STATS
+        return await arender(request, 'customer_dashboard.html', customer_dashboard_context(stats))
+
+    elif user.user_type == 'service_provider':
+        provider_pk = await sync_to_async(provider_id)(user)
+        if provider_pk is not None:
+            stats = await aprovider_stats(provider_pk)
+        else:
+            stats = EMPTY_PROVIDER_STATS
+            messages.info(request, 'Please complete provider registration')
+        return await arender(request, 'provider_dashboard.html', provider_dashboard_context(provider_pk, stats))
+
+    elif user.user_type == 'admin':
+        totals = await aadmin_totals()
+        recent_bookings = await alist(recent_bookings_query())
+        return await arender(request, 'admin_dashboard.html', admin_dashboard_context(totals, recent_bookings))
+
+    return await arender(request, 'dashboard.html')
+
+
+@async_login_required
+async def my_bookings(request):
+    """Async my_bookings, awaiting the tab counts and then the first page"""
+    user = request.user
+    active_tab = request.GET.get('tab', 'all')
+    if active_tab not in BOOKING_TABS:
+        active_tab = 'all'
+    size = page_size(request.GET.get('page_size'))
+
+    try:
+        # The provider id comes with the cached user, looked up off the loop otherwise
+        bookings = await sync_to_async(booking_list)(user)
+        if user.user_type == 'admin':
+            tab_totals = rollup_tab_counts(await aadmin_totals())
+        else:
+            tab_totals = await atab_counts(bookings)
+        page, next_cursor = await abooking_page(bookings, active_tab, page_size=size)
+    except ServiceProvider.DoesNotExist:
+        tab_totals, page, next_cursor = dict.fromkeys(BOOKING_TABS, 0), [], None
+        messages.error(request, 'Please complete provider registration first')
+    except Exception as e:
+        tab_totals, page, next_cursor = dict.fromkeys(BOOKING_TABS, 0), [], None
+        messages.error(request, f'Error loading bookings: {str(e)}')
+
+    return await arender(request, 'my_bookings.html', {
+        'active_tab': active_tab,
+        'tab_counts': tab_totals,
+        'bookings': page,
+        'next_cursor': next_cursor,
+        'page_size': size,
+    })
@@ -0,0 +1,41 @@
+from django.db.backends.sqlite3 import base
+
+# Tuned for a web app: many readers alongside one writer at a time
+DEFAULT_PRAGMAS = {
+    # Readers no longer block the writer or each other
+    'journal_mode': 'WAL',
+    # Safe with WAL; only the last commits may be lost on power failure
+    'synchronous': 'NORMAL',
+    # Wait up to 5s for the write lock instead of failing at once
+    'busy_timeout': 5000,
+    # 64 MB page cache and 256 MB of the file memory-mapped
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite backend set up for concurrent requests.
+
+    Every connection gets the pragmas above, overridable through a
+    ``pragmas`` dict in the database OPTIONS, and transactions start with
+    BEGIN IMMEDIATE. A deferred transaction that reads before it writes
+    cannot wait for the write lock and fails with "database is locked"; an
+    immediate one takes the lock up front, so busy_timeout lets concurrent
+    writers queue instead.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **params.pop('pragmas', {})}
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,190 @@
+import asyncio
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Booking, ServiceProvider, User
+from .seeding import seed
+
+BENCHMARK_VIEWS = ('dashboard', 'my_bookings', 'services_list', 'book_service')
+USER_TYPES = ('customer', 'service_provider', 'admin')
+# Sync views and their async versions, compared under WSGI and ASGI
+ASYNC_VIEWS = {'dashboard': 'dashboard_async', 'my_bookings': 'my_bookings_async'}
+
+# Users and providers seeded per booking, matching 100k users / 2k providers / 1M bookings
+USERS_PER_BOOKING = 1 / 10
+PROVIDERS_PER_BOOKING = 1 / 500
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def busiest_users():
+    """The heaviest customer and provider plus an admin, keyed by user type"""
+    customer_id = (
+        Booking.objects.values('customer').annotate(n=Count('id')).order_by('-n')
+        .values_list('customer', flat=True).first()
+    )
+    provider_id = (
+        Booking.objects.values('service_provider').annotate(n=Count('id')).order_by('-n')
+        .values_list('service_provider', flat=True).first()
+    )
+    return {
+        'customer': User.objects.get(pk=customer_id),
+        'service_provider': ServiceProvider.objects.get(pk=provider_id).user,
+        'admin': User.objects.filter(user_type='admin').first(),
+    }
+
+
+def time_view(client, url, repeat):
+    """Query count of one request, then p50/p95 latency in ms over ``repeat`` more"""
+    with CaptureQueriesContext(connection) as queries:
+        status = client.get(url).status_code
+    # Read the count now, later requests reset the connection's query log
+    query_count = len(queries)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'status': status,
+        'queries': query_count,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+    }
+
+
+def run_benchmarks(sizes, repeat=20, stdout=None):
+    """Time every view for every user type at each dataset size.
+
+    The dataset grows in place from one size to the next, so ``sizes`` are
+    booking counts and must be run against a scratch database. Results are
+    keyed "<size>/<user type>/<view>".
+    """
+    log = stdout.write if stdout else (lambda message: None)
+    results = {}
+    seeded = 0
+    for size in sorted(sizes):
+        added = size - seeded
+        seed(
+            users=max(1, round(added * USERS_PER_BOOKING)),
+            providers=max(1, round(added * PROVIDERS_PER_BOOKING)),
+            bookings=added,
+            random_seed=size,
+        )
+        seeded = size
+
+        for user_type, user in busiest_users().items():
+            client = Client()
+            client.force_login(user)
+            for view in BENCHMARK_VIEWS:
+                cache.clear()
+                key = f'{size}/{user_type}/{view}'
+                results[key] = time_view(client, reverse(view), repeat)
+                log(f'{key}: {results[key]}')
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against a baseline: slower p50 beyond ``tolerance`` or more queries"""
+    regressions = []
+    for key, result in results.items():
+        expected = baseline.get(key)
+        if expected is None:
+            continue
+        if result['queries'] > expected['queries']:
+            regressions.append(f"{key}: {result['queries']} queries, baseline {expected['queries']}")
+        if result['p50_ms'] > expected['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{key}: p50 {result['p50_ms']}ms, baseline {expected['p50_ms']}ms")
+    return regressions
+
+
+def load_summary(timings, wall):
+    """Latency percentiles in ms and throughput of one concurrent run"""
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'throughput_rps': round(len(timings) / wall, 1),
+    }
+
+
+def load_wsgi(cookies, url, requests, concurrency):
+    """Drive the WSGI handler from ``concurrency`` threads, each request with a cold cache"""
+    def one(_):
+        client = Client()
+        client.cookies = cookies
+        # Otherwise all but the first request time cached stats
+        cache.clear()
+        start = time.perf_counter()
+        client.get(url)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        timings = list(pool.map(one, range(requests)))
+    return load_summary(timings, time.perf_counter() - start)
+
+
+async def load_asgi(cookies, url, requests, concurrency):
+    """Drive the ASGI handler with ``concurrency`` requests in flight on one event loop.
+
+    Each request starts with a cold cache, as in load_wsgi.
+    """
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async def one():
+        client = AsyncClient()
+        client.cookies = cookies
+        async with in_flight:
+            await cache.aclear()
+            start = time.perf_counter()
+            await client.get(url)
+            return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    timings = await asyncio.gather(*(one() for _ in range(requests)))
+    return load_summary(timings, time.perf_counter() - start)
+
+
+def run_async_comparison(size, requests=200, concurrency=10, stdout=None):
+    """Compare the sync views under WSGI with their async versions under ASGI.
+
+    Seeds ``size`` bookings into the current (scratch) database, then loads
+    each view for each user type. Results are keyed
+    "<user type>/<view>/<wsgi|asgi>".
+    """
+    log = stdout.write if stdout else (lambda message: None)
+    seed(
+        users=max(1, round(size * USERS_PER_BOOKING)),
+        providers=max(1, round(size * PROVIDERS_PER_BOOKING)),
+        bookings=size,
+        random_seed=size,
+    )
+    results = {}
+    for user_type, user in busiest_users().items():
+        client = Client()
+        client.force_login(user)
+        for sync_view, async_view in ASYNC_VIEWS.items():
+            cache.clear()
+            key = f'{user_type}/{sync_view}/wsgi'
+            results[key] = load_wsgi(client.cookies, reverse(sync_view), requests, concurrency)
+            log(f'{key}: {results[key]}')
+
+            cache.clear()
+            key = f'{user_type}/{sync_view}/asgi'
+            results[key] = async_to_sync(load_asgi)(client.cookies, reverse(async_view), requests, concurrency)
+            log(f'{key}: {results[key]}')
+    return results
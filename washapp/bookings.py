@@ -0,0 +1,148 @@
+import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Count, Q
+
+from . import accounts
+from .models import Booking, ServiceProvider
+
+# Badge colour and icon shown for each booking status
+STATUS_STYLES = {
+    'completed': ('success', 'check-circle'),
+    'pending': ('warning', 'clock'),
+    'confirmed': ('info', 'check'),
+    'in_progress': ('primary', 'spinner'),
+    'cancelled': ('danger', 'times-circle'),
+}
+DEFAULT_STATUS_STYLE = ('secondary', 'question-circle')
+
+# Statuses listed on each my_bookings tab, None meaning every status
+BOOKING_TABS = {
+    'all': None,
+    'upcoming': ('pending', 'confirmed'),
+    'completed': ('completed',),
+    'cancelled': ('cancelled',),
+}
+BOOKINGS_PAGE_SIZE = getattr(settings, 'BOOKINGS_PAGE_SIZE', 25)
+BOOKINGS_MAX_PAGE_SIZE = getattr(settings, 'BOOKINGS_MAX_PAGE_SIZE', 100)
+CURSOR_SALT = 'washapp.bookings.cursor'
+
+
+def booking_list(user, provider=None):
+    """Bookings visible to a user, with service, provider and review joined in.
+
+    Customers see their own bookings, providers the bookings assigned to them
+    and admins every booking. The provider is looked up unless passed in;
+    raises ServiceProvider.DoesNotExist for a provider who has not completed
+    registration yet.
+    """
+    bookings = Booking.objects.select_related('service', 'service_provider', 'review')
+
+    if user.user_type == 'customer':
+        bookings = bookings.filter(customer=user)
+    elif user.user_type == 'service_provider':
+        provider_id = provider.id if provider else accounts.provider_id(user)
+        if provider_id is None:
+            raise ServiceProvider.DoesNotExist('Provider registration is not complete')
+        bookings = bookings.filter(service_provider_id=provider_id)
+
+    return bookings.order_by('-booking_date', '-booking_time', '-id')
+
+
+def tab_count_aggregates():
+    return {
+        tab: Count('id', filter=Q(status__in=statuses) if statuses else None)
+        for tab, statuses in BOOKING_TABS.items()
+    }
+
+
+def tab_counts(bookings):
+    """Number of bookings on every tab, counted in one aggregate query"""
+    return bookings.order_by().aggregate(**tab_count_aggregates())
+
+
+async def atab_counts(bookings):
+    return await bookings.order_by().aaggregate(**tab_count_aggregates())
+
+
+def page_size(value):
+    """Requested page size clamped to 1..BOOKINGS_MAX_PAGE_SIZE, the default when missing or invalid"""
+    try:
+        return min(max(int(value), 1), BOOKINGS_MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return BOOKINGS_PAGE_SIZE
+
+
+def encode_cursor(booking):
+    """Signed cursor pointing just past a booking in booking_list order.
+
+    The same booking always gives the same token, and a tampered token is
+    rejected rather than silently skipping rows.
+    """
+    return encode_key(booking.booking_date, booking.booking_time, booking.id)
+
+
+def encode_key(booking_date, booking_time, pk):
+    return signing.Signer(salt=CURSOR_SALT).sign_object(
+        [booking_date.isoformat(), booking_time.isoformat(), pk]
+    )
+
+
+def decode_cursor(cursor):
+    """Read a cursor back into (booking_date, booking_time, id), raising ValueError if invalid"""
+    try:
+        booking_date, booking_time, pk = signing.Signer(salt=CURSOR_SALT).unsign_object(cursor)
+        return (
+            datetime.date.fromisoformat(booking_date),
+            datetime.time.fromisoformat(booking_time),
+            int(pk),
+        )
+    except (signing.BadSignature, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def page_query(bookings, tab, cursor=None, page_size=BOOKINGS_PAGE_SIZE):
+    """Query for one page of a tab, fetching one extra row to tell if another page follows.
+
+    Pages are cut with a keyset condition on (booking_date, booking_time, id)
+    instead of an offset, so a deep page costs the same as the first one. The
+    plain date bound lets the index seek straight to the cursor; the rest of
+    the condition only sorts out rows on that same date. ``bookings`` must be
+    ordered as booking_list returns them.
+    """
+    statuses = BOOKING_TABS[tab]
+    if statuses:
+        bookings = bookings.filter(status__in=statuses)
+    if cursor:
+        booking_date, booking_time, pk = decode_cursor(cursor)
+        bookings = bookings.filter(booking_date__lte=booking_date).filter(
+            Q(booking_date__lt=booking_date)
+            | Q(booking_date=booking_date, booking_time__lt=booking_time)
+            | Q(booking_date=booking_date, booking_time=booking_time, id__lt=pk)
+        )
+    return bookings[:page_size + 1]
+
+
+def page_result(rows, page_size):
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return add_status_styles(rows[:page_size]), next_cursor
+
+
+def booking_page(bookings, tab, cursor=None, page_size=BOOKINGS_PAGE_SIZE):
+    """One page of a tab and the cursor of the next page, or None on the last page"""
+    return page_result(list(page_query(bookings, tab, cursor, page_size)), page_size)
+
+
+async def abooking_page(bookings, tab, cursor=None, page_size=BOOKINGS_PAGE_SIZE):
+    rows = [booking async for booking in page_query(bookings, tab, cursor, page_size)]
+    return page_result(rows, page_size)
+
+
+def add_status_styles(bookings):
+    """Set status_color and status_icon on each booking for the templates"""
+    for booking in bookings:
+        booking.status_color, booking.status_icon = STATUS_STYLES.get(
+            booking.status, DEFAULT_STATUS_STYLE
+        )
+    return bookings
@@ -0,0 +1,89 @@
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Service, ServiceCategory
+
+CATALOG_VERSION_KEY = 'washapp:catalog:version'
+CATALOG_TIMEOUT = 60 * 60 * 24
+# Seconds a worker serves its own copy before checking the shared version
+CATALOG_CHECK_INTERVAL = 1.0
+
+
+class Catalog:
+    """Snapshot of every service and category at one catalog version.
+
+    Built once per version and shared read-only between requests, so nothing
+    should be modified on the objects it hands out.
+    """
+
+    def __init__(self, version, services, categories):
+        self.version = version
+        self.services = tuple(services)
+        self.categories = tuple(categories)
+
+
+# This worker's copy: (catalog, monotonic time its version was last checked)
+_local = None
+
+
+def catalog_key(version):
+    return f'washapp:catalog:{version}'
+
+
+def current_version():
+    """The shared catalog version, started from the clock if missing or evicted.
+
+    Starting from the clock rather than 1 keeps a new version from ever
+    pointing at a stale snapshot still in the cache.
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns() // 1000, None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def load_catalog(version):
+    # Snapshots live as long as their version, so never build one from a lagging replica
+    services = Service.objects.using(DEFAULT_DB_ALIAS).select_related('category').order_by('id')
+    categories = ServiceCategory.objects.using(DEFAULT_DB_ALIAS).order_by('id')
+    return Catalog(version, services, categories)
+
+
+def catalog():
+    """The current catalog, from this worker's copy, the shared cache or the database.
+
+    A worker rechecks the shared version at most once every
+    CATALOG_CHECK_INTERVAL seconds, so a change made anywhere shows up
+    everywhere within that interval.
+    """
+    global _local
+    now = time.monotonic()
+    local = _local
+    if local and now - local[1] < CATALOG_CHECK_INTERVAL:
+        return local[0]
+
+    version = current_version()
+    if local and local[0].version == version:
+        snapshot = local[0]
+    else:
+        snapshot = cache.get(catalog_key(version))
+        if snapshot is None:
+            snapshot = load_catalog(version)
+            cache.set(catalog_key(version), snapshot, CATALOG_TIMEOUT)
+    _local = (snapshot, now)
+    return snapshot
+
+
+def bump_catalog_version():
+    """Invalidate every worker's catalog after a service or category changed"""
+    global _local
+    current_version()
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # Evicted between the two calls
+        current_version()
+    _local = None
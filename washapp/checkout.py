@@ -0,0 +1,73 @@
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .jobs import enqueue
+from .models import Booking, Cart, Payment, ProviderSlot
+from .scheduling import SlotUnavailable, assign_providers, slot_rows
+
+
+class CheckoutError(Exception):
+    """The cart cannot be booked as requested; the message says why"""
+
+
+def cart_lines(user):
+    return list(Cart.objects.filter(user=user).select_related('service').order_by('id'))
+
+
+def checkout(user, booking_date, booking_time, vehicle_type, vehicle_numbers,
+             special_instructions='', payment_method='card'):
+    """Turn the user's cart into one booking and pending payment per vehicle.
+
+    Every vehicle is booked at the same date and time, each with its own
+    provider. The cart is validated and providers assigned before anything
+    is written. In one transaction the bookings are then saved one by one,
+    so the rollup, stats and reminder signals run as for any other booking.
+    Their slots and payments are inserted with bulk_create, the cart is
+    cleared and the confirmation email queued.
+    """
+    lines = cart_lines(user)
+    if not lines:
+        raise CheckoutError('Your cart is empty')
+    now = timezone.localtime()
+    if (booking_date, booking_time) < (now.date(), now.time()):
+        raise CheckoutError('That time slot has already passed, please choose one in the future')
+    if any(line.quantity < 1 for line in lines):
+        raise CheckoutError('Every cart item needs a quantity of at least 1')
+
+    services = [line.service for line in lines for _ in range(line.quantity)]
+    vehicle_numbers = [number.strip() for number in vehicle_numbers if number.strip()]
+    if len(vehicle_numbers) != len(services):
+        raise CheckoutError(f'Please enter {len(services)} vehicle numbers, one per vehicle in your cart')
+
+    try:
+        provider_ids = assign_providers(services, booking_date, booking_time)
+    except SlotUnavailable as e:
+        raise CheckoutError(str(e))
+
+    try:
+        with transaction.atomic():
+            bookings = [
+                Booking.objects.create(
+                    customer=user, service=service, service_provider_id=provider_id,
+                    booking_date=booking_date, booking_time=booking_time,
+                    vehicle_type=vehicle_type, vehicle_number=vehicle_number,
+                    special_instructions=special_instructions,
+                    total_amount=service.price, status='pending',
+                )
+                for service, provider_id, vehicle_number in zip(services, provider_ids, vehicle_numbers)
+            ]
+            ProviderSlot.objects.bulk_create(slot_rows(bookings))
+            Payment.objects.bulk_create([
+                Payment(
+                    booking=booking, amount=booking.total_amount, payment_method=payment_method,
+                    transaction_id=f'TX-{booking.id}', status='pending',
+                )
+                for booking in bookings
+            ])
+            # Only the lines checked out, not any added since they were read
+            Cart.objects.filter(id__in=[line.id for line in lines]).delete()
+            enqueue('booking_confirmation', {'booking_ids': [booking.id for booking in bookings]})
+    except IntegrityError:
+        # Another booking took one of the slots since they were checked
+        raise CheckoutError('Some of those times were just booked, please try again')
+    return bookings
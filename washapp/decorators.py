@@ -1,4 +1,8 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import user_passes_test
+from django.contrib.auth.views import redirect_to_login
 from django.shortcuts import redirect
 from django.contrib import messages
 
@@ -37,4 +41,13 @@ def unauthenticated_user(view_func):
         if request.user.is_authenticated:
             return redirect('dashboard')
         return view_func(request, *args, **kwargs)
-    return wrapper_func
\ No newline at end of file
+    return wrapper_func
+
+def async_login_required(view_func):
+    """login_required for async views, loading the user off the event loop"""
+    @wraps(view_func)
+    async def wrapper_func(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+    return wrapper_func
@@ -0,0 +1,149 @@
+import csv
+import datetime
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Booking, Payment
+
+EXPORT_BATCH_SIZE = 2000
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Export:
+    """What one export reads: its columns, its date column and its keyset order.
+
+    ``order`` must be covered by an index so every batch seeks straight to
+    where the previous one stopped.
+    """
+
+    def __init__(self, queryset, fields, date_field, order):
+        self.queryset = queryset
+        self.fields = fields
+        self.date_field = date_field
+        self.order = order
+
+
+EXPORTS = {
+    'bookings': Export(
+        Booking.objects.all(),
+        fields=[
+            'id', 'booking_date', 'booking_time', 'status', 'total_amount',
+            'customer__username', 'customer__email', 'service__name',
+            'service_provider__company_name', 'vehicle_type', 'vehicle_number', 'created_at',
+        ],
+        date_field='booking_date',
+        order=('booking_date', 'booking_time', 'id'),
+    ),
+    'payments': Export(
+        Payment.objects.all(),
+        fields=[
+            'id', 'payment_date', 'booking_id', 'amount', 'payment_method',
+            'transaction_id', 'status',
+        ],
+        date_field='payment_date',
+        order=('payment_date', 'id'),
+    ),
+}
+
+
+def filtered(export, start=None, end=None, statuses=None):
+    """The export's rows dated between two days inclusive and in the given statuses"""
+    rows = export.queryset
+    upper = 'lte'
+    if isinstance(rows.model._meta.get_field(export.date_field), models.DateTimeField):
+        # Compare with the bounds of the days so the index can still be used
+        start = start and day_start(start)
+        end = end and day_start(end + datetime.timedelta(days=1))
+        upper = 'lt'
+    if start:
+        rows = rows.filter(**{f'{export.date_field}__gte': start})
+    if end:
+        rows = rows.filter(**{f'{export.date_field}__{upper}': end})
+    if statuses:
+        rows = rows.filter(status__in=statuses)
+    return rows
+
+
+def parse_day(value):
+    """Optional YYYY-MM-DD filter value, raising ValueError if malformed"""
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f'Invalid date: {value}')
+    return day
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def after(order, row):
+    """Rows strictly after ``row`` in ascending ``order``.
+
+    The plain bound on the first column lets the index seek to the row; the
+    OR only sorts out rows sharing that first value.
+    """
+    values = [row[field] for field in order]
+    conditions = [
+        Q(**dict(zip(order[:i], values[:i])), **{f'{order[i]}__gt': values[i]})
+        for i in range(len(order))
+    ]
+    return Q(**{f'{order[0]}__gte': values[0]}) & reduce(or_, conditions)
+
+
+def export_rows(export, rows, batch_size=EXPORT_BATCH_SIZE):
+    """Yield every row as a dict, in keyset batches of ``batch_size``.
+
+    Each batch is its own short query streamed from a server-side cursor over
+    values(), so no model instances are built, memory stays flat and no
+    single query runs for the length of the whole export.
+    """
+    rows = rows.order_by(*export.order).values(*export.fields)
+    last = None
+    while True:
+        batch = rows.filter(after(export.order, last)) if last else rows
+        count = 0
+        for row in batch[:batch_size].iterator(chunk_size=batch_size):
+            count += 1
+            last = row
+            yield row
+        if count < batch_size:
+            return
+
+
+class Echo:
+    """File-like object handing back whatever is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row[field] for field in fields])
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_lines(export, rows, fmt, batch_size=EXPORT_BATCH_SIZE):
+    """Encoded lines of an export in 'csv' or 'ndjson' format"""
+    rows = export_rows(export, rows, batch_size)
+    if fmt == 'csv':
+        return csv_lines(export.fields, rows)
+    return ndjson_lines(rows)
@@ -0,0 +1,161 @@
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# Widths generated per upload directory, never larger than the original
+DERIVATIVE_WIDTHS = {
+    'services': (320, 640, 960),
+    'profile_pics': (150, 300),
+}
+DEFAULT_WIDTHS = (320, 640)
+WEBP_QUALITY = 80
+FALLBACK_QUALITY = 82
+# Bumping this moves every derivative to new URLs, e.g. after changing the widths
+PIPELINE_VERSION = 1
+MANIFEST = 'manifest.json'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def derivative_dir(name):
+    """Storage directory of an upload's derivatives.
+
+    Uploaded names are never reused, so everything below it can be served
+    with a far-future expiry.
+    """
+    return posixpath.join('derivatives', f'v{PIPELINE_VERSION}', posixpath.splitext(name)[0])
+
+
+def derivative_name(name, width, fmt):
+    return posixpath.join(derivative_dir(name), f'{width}w.{fmt}')
+
+
+def widths_for(name):
+    return DERIVATIVE_WIDTHS.get(name.split('/', 1)[0], DEFAULT_WIDTHS)
+
+
+def render_derivatives(source_path, target_dir, widths):
+    """Write WebP and JPEG or PNG resizes of an image, then a manifest listing them.
+
+    Runs in a worker process, so it only deals in file paths. The manifest
+    goes last, so its presence means every file it lists is complete.
+    """
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+    has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    fallback = 'png' if has_alpha else 'jpg'
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    # Smaller than every width: one copy at its own size
+    made = [width for width in widths if width < image.width] or [image.width]
+    os.makedirs(target_dir, exist_ok=True)
+    for width in made:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        resized.save(os.path.join(target_dir, f'{width}w.webp'), 'WEBP', quality=WEBP_QUALITY, method=4)
+        if fallback == 'png':
+            resized.save(os.path.join(target_dir, f'{width}w.png'), 'PNG', optimize=True)
+        else:
+            resized.save(os.path.join(target_dir, f'{width}w.jpg'), 'JPEG', quality=FALLBACK_QUALITY,
+                         optimize=True, progressive=True)
+
+    manifest = {'widths': made, 'fallback': fallback}
+    partial = os.path.join(target_dir, MANIFEST + '.tmp')
+    with open(partial, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(partial, os.path.join(target_dir, MANIFEST))
+    return manifest
+
+
+def generate_derivatives(name):
+    """Render the derivatives of an uploaded file in this process"""
+    return render_derivatives(
+        default_storage.path(name), default_storage.path(derivative_dir(name)), widths_for(name),
+    )
+
+
+def pool():
+    """Worker processes for resizing, started on first use.
+
+    Spawned rather than forked, so the workers share nothing with the
+    threads and database connections of the web process.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def schedule_derivatives(name):
+    """Queue the derivatives of an uploaded file, off the request path.
+
+    With IMAGE_DERIVATIVE_WORKERS = 0 they are rendered right away instead.
+    """
+    if not getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2):
+        return generate_derivatives(name)
+    future = pool().submit(
+        render_derivatives, default_storage.path(name),
+        default_storage.path(derivative_dir(name)), widths_for(name),
+    )
+    # Nobody waits on the future, so a failure would otherwise go unseen
+    future.add_done_callback(functools.partial(log_failure, name))
+    return future
+
+
+def log_failure(name, future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error('Derivatives of %s failed', name, exc_info=future.exception())
+
+
+def manifest_of(name):
+    """Widths and fallback format ready for an upload, or None while they are pending"""
+    key = f'washapp:derivatives:{PIPELINE_VERSION}:{name}'
+    manifest = cache.get(key)
+    if manifest is None:
+        try:
+            with default_storage.open(posixpath.join(derivative_dir(name), MANIFEST)) as file:
+                manifest = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+        # Derivatives never change once written
+        cache.set(key, manifest, None)
+    return manifest
+
+
+def srcsets(image):
+    """(webp srcset, fallback srcset, fallback src) of an image field, or None while pending"""
+    if not image:
+        return None
+    manifest = manifest_of(image.name)
+    if manifest is None:
+        return None
+
+    def srcset(fmt):
+        return ', '.join(
+            f'{default_storage.url(derivative_name(image.name, width, fmt))} {width}w'
+            for width in manifest['widths']
+        )
+
+    largest = max(manifest['widths'])
+    return (
+        srcset('webp'),
+        srcset(manifest['fallback']),
+        default_storage.url(derivative_name(image.name, largest, manifest['fallback'])),
+    )
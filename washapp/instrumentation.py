@@ -0,0 +1,221 @@
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.template.backends.django import DjangoTemplates
+
+from .stats import cache_counters
+
+# Upper bounds of the histogram buckets, Prometheus style
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Metrics of the request being handled in this thread or task
+_current = ContextVar('washapp_request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_time', 'template_time', 'view_start')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.view_start = None
+
+
+class Histogram:
+    """Bucket counts plus sum and count, kept per label value"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, label, value):
+        series = self.series.get(label)
+        if series is None:
+            series = self.series[label] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, name, label_name):
+        lines = []
+        for label, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{label_name}="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{label_name}="{label}"}} {total:.6f}')
+            lines.append(f'{name}_count{{{label_name}="{label}"}} {count}')
+        return lines
+
+
+_lock = threading.Lock()
+_histograms = {
+    'washapp_request_duration_seconds': Histogram(DURATION_BUCKETS),
+    'washapp_view_duration_seconds': Histogram(DURATION_BUCKETS),
+    'washapp_db_duration_seconds': Histogram(DURATION_BUCKETS),
+    'washapp_template_duration_seconds': Histogram(DURATION_BUCKETS),
+    'washapp_db_queries': Histogram(QUERY_BUCKETS),
+}
+HELP = {
+    'washapp_request_duration_seconds': 'Time spent handling the request',
+    'washapp_view_duration_seconds': 'Time spent in the view, including its queries and templates',
+    'washapp_db_duration_seconds': 'Time spent executing SQL',
+    'washapp_template_duration_seconds': 'Time spent rendering templates',
+    'washapp_db_queries': 'SQL queries executed per request',
+}
+
+
+def record(url_name, total, view, metrics):
+    with _lock:
+        _histograms['washapp_request_duration_seconds'].observe(url_name, total)
+        _histograms['washapp_view_duration_seconds'].observe(url_name, view)
+        _histograms['washapp_db_duration_seconds'].observe(url_name, metrics.db_time)
+        _histograms['washapp_template_duration_seconds'].observe(url_name, metrics.template_time)
+        _histograms['washapp_db_queries'].observe(url_name, metrics.queries)
+
+
+def reset_metrics():
+    with _lock:
+        for histogram in _histograms.values():
+            histogram.series.clear()
+
+
+def prometheus_text():
+    """All request histograms and stats cache counters in Prometheus text format"""
+    lines = []
+    with _lock:
+        for name, histogram in _histograms.items():
+            lines.append(f'# HELP {name} {HELP[name]}')
+            lines.append(f'# TYPE {name} histogram')
+            lines += histogram.render(name, 'view')
+
+    lines.append('# HELP washapp_cache_lookups_total Dashboard stats cache lookups')
+    lines.append('# TYPE washapp_cache_lookups_total counter')
+    for key, value in sorted(cache_counters().items()):
+        cache_name, _, result = key.rpartition('_')
+        lines.append(f'washapp_cache_lookups_total{{cache="{cache_name}",result="{result}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def install_query_timer(connection):
+    """Time every query on the connection; a no-op outside instrumented requests.
+
+    Installed on each connection as it opens rather than per request, so
+    queries the async ORM runs in a worker thread are counted too.
+    """
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def time_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.queries += 1
+
+
+class InstrumentedTemplate:
+    """Backend template wrapper that adds its render time to the current request"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend whose top-level renders are timed.
+
+    Includes and extends render inside the top-level template, so they are
+    counted once as part of it.
+    """
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name))
+
+
+def server_timing(total, view, metrics):
+    return ', '.join([
+        f'total;dur={total * 1000:.2f}',
+        f'view;dur={view * 1000:.2f}',
+        f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"',
+        f'tpl;dur={metrics.template_time * 1000:.2f}',
+    ])
+
+
+class InstrumentationMiddleware:
+    """Times each request, its SQL and its template rendering.
+
+    The numbers go out in a Server-Timing header and into per-URL-name
+    histograms served by the metrics view. Place it first in MIDDLEWARE so
+    the total covers the other middleware too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, start)
+
+    def finish(self, request, response, metrics, start):
+        end = time.perf_counter()
+        total = end - start
+        view = end - metrics.view_start if metrics.view_start is not None else 0.0
+        match = request.resolver_match
+        url_name = (match.view_name if match else None) or 'unresolved'
+        record(url_name, total, view, metrics)
+        response['Server-Timing'] = server_timing(total, view, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.view_start = time.perf_counter()
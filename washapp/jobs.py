@@ -0,0 +1,309 @@
+import os
+import random
+import socket
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Booking, Job
+
+# Seconds before the first retry, doubling on each further attempt up to the cap
+RETRY_BASE = 10
+RETRY_CAP = 60 * 60
+# A running job not finished after this long is assumed lost with its worker
+STALE_AFTER = timedelta(minutes=15)
+
+# kind -> (handler, batch); batch handlers get a list of jobs in one call
+HANDLERS = {}
+
+
+def handler(kind, batch=False):
+    """Register a job handler.
+
+    A plain handler is called with one payload per job. A batch handler is
+    called with every claimed job of its kind at once and returns a dict of
+    job id to exception for those that failed.
+    """
+    def decorator(func):
+        HANDLERS[kind] = (func, batch)
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, delay=0, max_attempts=5):
+    """Queue a job; inside a transaction it only becomes visible on commit"""
+    if kind not in HANDLERS:
+        raise ValueError(f'No handler registered for job kind {kind!r}')
+    return Job.objects.create(
+        kind=kind, payload=payload or {}, max_attempts=max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, so failed jobs do not retry in lockstep"""
+    delay = min(RETRY_BASE * 2 ** (attempts - 1), RETRY_CAP)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim(worker, limit=50):
+    """Mark up to ``limit`` due jobs as running by ``worker`` and return them.
+
+    Jobs left running by a worker that died are picked up again once they
+    are STALE_AFTER old. The select and update run in one write transaction,
+    which on SQLite starts with BEGIN IMMEDIATE, so two workers never claim
+    the same job.
+    """
+    now = timezone.now()
+    due = Q(status='queued', run_at__lte=now) | Q(status='running', locked_at__lt=now - STALE_AFTER)
+    with transaction.atomic():
+        ids = list(Job.objects.filter(due).order_by('run_at', 'id').values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        Job.objects.filter(id__in=ids).update(status='running', locked_by=worker, locked_at=now)
+    return list(Job.objects.filter(id__in=ids, locked_by=worker).order_by('run_at', 'id'))
+
+
+def finish(jobs, errors):
+    """Record the outcome of run jobs, rescheduling failures with backoff"""
+    now = timezone.now()
+    done = [job.id for job in jobs if job.id not in errors]
+    if done:
+        Job.objects.filter(id__in=done).update(status='done', locked_by='', locked_at=None, last_error='')
+    for job in jobs:
+        error = errors.get(job.id)
+        if error is None:
+            continue
+        job.attempts += 1
+        job.last_error = ''.join(traceback.format_exception(error))[-4000:]
+        job.status = 'failed' if job.attempts >= job.max_attempts else 'queued'
+        job.run_at = now + retry_delay(job.attempts)
+        job.locked_by, job.locked_at = '', None
+        job.save(update_fields=['attempts', 'last_error', 'status', 'run_at', 'locked_by', 'locked_at'])
+
+
+def run_jobs(kind, jobs):
+    """Run claimed jobs of one kind, returning {job id: exception} for the failures"""
+    func, batch = HANDLERS.get(kind, (None, False))
+    if func is None:
+        return {job.id: LookupError(f'No handler registered for job kind {kind!r}') for job in jobs}
+    try:
+        if batch:
+            return func(jobs)
+        errors = {}
+        for job in jobs:
+            try:
+                func(job.payload)
+            except Exception as e:
+                errors[job.id] = e
+        return errors
+    except Exception as e:
+        return {job.id: e for job in jobs}
+
+
+def run_jobs_in_thread(kind, jobs):
+    try:
+        return run_jobs(kind, jobs)
+    finally:
+        # Pool threads keep their own connections, closed here between batches
+        close_old_connections()
+
+
+def work_once(worker, executor=None, batch_size=50):
+    """Claim one batch, run each kind of job in it, record the results.
+
+    Kinds run side by side on ``executor`` if given, one after another in
+    this thread if not. Returns the number of jobs run.
+    """
+    jobs = claim(worker, batch_size)
+    by_kind = {}
+    for job in jobs:
+        by_kind.setdefault(job.kind, []).append(job)
+    errors = {}
+    if executor is None:
+        for kind, kind_jobs in by_kind.items():
+            errors.update(run_jobs(kind, kind_jobs))
+    else:
+        futures = [executor.submit(run_jobs_in_thread, kind, kind_jobs) for kind, kind_jobs in by_kind.items()]
+        for future in futures:
+            errors.update(future.result())
+    finish(jobs, errors)
+    return len(jobs)
+
+
+def work(threads=4, batch_size=50, poll_interval=1.0, once=False, stop=None, log=None):
+    """Run jobs until ``stop`` is set, or until the queue is empty with ``once``.
+
+    ``threads`` of 0 runs every job in the calling thread.
+    """
+    worker = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    stop = stop or threading.Event()
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='washapp-job') if threads else None
+    total = 0
+    try:
+        while not stop.is_set():
+            count = work_once(worker, executor, batch_size)
+            total += count
+            if count and log:
+                log(f'Ran {count} jobs')
+            if not count:
+                if once:
+                    break
+                stop.wait(poll_interval)
+    finally:
+        if executor:
+            executor.shutdown()
+    return total
+
+
+# Email
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """Email backend that queues messages for the job worker instead of sending them.
+
+    The worker delivers them through JOBS_EMAIL_BACKEND, many messages per
+    SMTP connection, so no request waits on the mail server.
+    """
+
+    def send_messages(self, email_messages):
+        queued = [message for message in email_messages if not message.attachments]
+        for message in queued:
+            enqueue('send_email', message_payload(message))
+        # Attachments are not serialized into jobs, those messages go out right away
+        direct = [message for message in email_messages if message.attachments]
+        if direct:
+            delivery_connection().send_messages(direct)
+        return len(email_messages)
+
+
+def message_payload(message):
+    return {
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': message.to,
+        'cc': message.cc,
+        'bcc': message.bcc,
+        'reply_to': message.reply_to,
+        'headers': message.extra_headers,
+        'alternatives': getattr(message, 'alternatives', []),
+        'content_subtype': message.content_subtype,
+    }
+
+
+def message_from_payload(payload, connection):
+    message = EmailMultiAlternatives(
+        payload['subject'], payload['body'], payload['from_email'], payload['to'],
+        bcc=payload['bcc'], cc=payload['cc'], reply_to=payload['reply_to'],
+        headers=payload['headers'], connection=connection,
+        alternatives=[tuple(alternative) for alternative in payload['alternatives']],
+    )
+    message.content_subtype = payload['content_subtype']
+    return message
+
+
+def delivery_connection():
+    return get_connection(
+        getattr(settings, 'JOBS_EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend'),
+        fail_silently=False,
+    )
+
+
+def deliver(messages):
+    """Send (key, message) pairs over one connection, returning {key: exception} for failures.
+
+    Each message is sent on its own so one bad recipient only fails its own
+    job. If the connection cannot be opened everything fails and is retried.
+    """
+    errors = {}
+    connection = delivery_connection()
+    with connection:
+        for key, message in messages:
+            try:
+                message.connection = connection
+                connection.send_messages([message])
+            except Exception as e:
+                errors[key] = e
+    return errors
+
+
+@handler('send_email', batch=True)
+def send_emails(jobs):
+    return deliver([(job.id, message_from_payload(job.payload, None)) for job in jobs])
+
+
+def booking_rows(ids):
+    """Bookings by id with what the emails show, from the primary so a new one is never missed"""
+    return (
+        Booking.objects.using(DEFAULT_DB_ALIAS)
+        .select_related('customer', 'service', 'service_provider')
+        .in_bulk(ids)
+    )
+
+
+@handler('booking_confirmation', batch=True)
+def send_booking_confirmations(jobs):
+    """Email customers their new bookings, one message per job and one connection for all"""
+    ids = {booking_id for job in jobs for booking_id in job.payload['booking_ids']}
+    bookings = booking_rows(ids)
+    messages = []
+    errors = {}
+    for job in jobs:
+        missing = [pk for pk in job.payload['booking_ids'] if pk not in bookings]
+        if missing:
+            errors[job.id] = Booking.DoesNotExist(f'Bookings {missing} not found')
+            continue
+        booked = [bookings[pk] for pk in job.payload['booking_ids']]
+        if not booked or not booked[0].customer.email:
+            continue
+        lines = [
+            f'- {b.service.name} with {b.service_provider.company_name} on '
+            f'{b.booking_date:%d %b %Y} at {b.booking_time:%H:%M}, vehicle {b.vehicle_number}'
+            for b in booked
+        ]
+        messages.append((job.id, EmailMessage(
+            'Your Dirty to Clean booking' + ('s' if len(booked) > 1 else ''),
+            'Thanks for booking with Dirty to Clean:\n\n' + '\n'.join(lines) + '\n',
+            to=[booked[0].customer.email],
+        )))
+    if messages:
+        errors.update(deliver(messages))
+    return errors
+
+
+@handler('booking_notice', batch=True)
+def send_booking_notices(jobs):
+    """Email reminders of upcoming bookings and notices of expired ones, over one connection"""
+    bookings = booking_rows({job.payload['booking_id'] for job in jobs})
+    messages = []
+    errors = {}
+    for job in jobs:
+        booking = bookings.get(job.payload['booking_id'])
+        if booking is None:
+            errors[job.id] = Booking.DoesNotExist(f'Booking {job.payload["booking_id"]} not found')
+            continue
+        if not booking.customer.email:
+            continue
+        when = (
+            f'{booking.service.name} with {booking.service_provider.company_name} on '
+            f'{booking.booking_date:%d %b %Y} at {booking.booking_time:%H:%M}'
+        )
+        if job.payload['notice'] == 'reminder':
+            hours = job.payload['hours']
+            subject = f'Your car wash is in {hours} hour' + ('s' if hours != 1 else '')
+            body = f'A reminder of your booking: {when}, vehicle {booking.vehicle_number}.\n'
+        else:
+            subject = 'Your booking was not confirmed'
+            body = f'Your provider did not confirm {when} in time, so it has been cancelled.\n'
+        messages.append((job.id, EmailMessage(subject, body, to=[booking.customer.email])))
+    if messages:
+        errors.update(deliver(messages))
+    return errors
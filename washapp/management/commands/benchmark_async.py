@@ -0,0 +1,38 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from washapp.benchmarks import run_async_comparison
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare latency and throughput of the sync dashboard and my_bookings views under WSGI '
+        'with their async versions under ASGI, on a seeded scratch database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10000, help='Bookings to seed')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per view and server')
+        parser.add_argument('--concurrency', type=int, default=10, help='Requests in flight at once')
+        parser.add_argument('--output', help='Also write the results to this file')
+
+    def handle(self, *args, **options):
+        # Never seed into the real database, nor read from replicas of it
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(DATABASE_REPLICAS=[]):
+                results = run_async_comparison(
+                    options['size'], options['requests'], options['concurrency'], stdout=self.stdout,
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2, sort_keys=True))
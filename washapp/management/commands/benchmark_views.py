@@ -0,0 +1,63 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from washapp.benchmarks import compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the main views for each user type at several dataset sizes on a scratch '
+        'database, and compare query counts and latency against a stored baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000',
+                            help='Comma separated booking counts to benchmark at')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per view')
+        parser.add_argument('--baseline', default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'),
+                            help='Baseline results file')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Write these results as the new baseline instead of comparing')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p50 slowdown over the baseline, as a fraction')
+        parser.add_argument('--output', help='Also write the results to this file')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be a comma separated list of integers')
+
+        # Never seed into the real database, nor read from replicas of it
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(DATABASE_REPLICAS=[]):
+                results = run_benchmarks(sizes, options['repeat'], stdout=self.stdout)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2, sort_keys=True))
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f'Saved baseline to {baseline_path}'))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(f'No baseline at {baseline_path}, nothing to compare'))
+            return
+
+        regressions = compare(results, json.loads(baseline_path.read_text()), options['tolerance'])
+        if regressions:
+            raise CommandError('Benchmark regressions:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,27 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from washapp.models import Service, User
+from washapp.uploads import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Delete uploaded blobs no service image or profile picture refers to'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Keep blobs written less than this many seconds ago',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='List the blobs without deleting them')
+
+    def handle(self, *args, **options):
+        referenced = set(Service.objects.values_list('image', flat=True))
+        referenced |= set(User.objects.values_list('profile_picture', flat=True))
+        removed = collect_garbage(
+            default_storage, referenced, min_age=options['min_age'], dry_run=options['dry_run'],
+        )
+        for name in removed:
+            self.stdout.write(name)
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(removed)} unreferenced blobs'))
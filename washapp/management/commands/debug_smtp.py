@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from washapp.smtp_debug import DebuggingSMTPServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local SMTP server that prints the messages it receives instead of sending them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+
+    def handle(self, *args, **options):
+        def show(sender, recipients, message):
+            self.stdout.write(f'From {sender} to {", ".join(recipients)}: {message["Subject"]}')
+            self.stdout.write(message.get_body(('plain', 'html')).get_content())
+
+        server = DebuggingSMTPServer((options['host'], options['port']), on_message=show)
+        self.stdout.write(self.style.SUCCESS(f'Debugging SMTP server on {options["host"]}:{options["port"]}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
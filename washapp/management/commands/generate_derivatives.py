@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from washapp.images import manifest_of, schedule_derivatives
+from washapp.models import Service, User
+
+
+class Command(BaseCommand):
+    help = 'Generate resized and WebP copies of service images and profile pictures that lack them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate existing derivatives too')
+
+    def handle(self, *args, **options):
+        names = set(Service.objects.exclude(image='').exclude(image=None).values_list('image', flat=True))
+        names |= set(
+            User.objects.exclude(profile_picture='').exclude(profile_picture=None)
+            .values_list('profile_picture', flat=True)
+        )
+        if not options['force']:
+            names = {name for name in names if manifest_of(name) is None}
+
+        jobs = [schedule_derivatives(name) for name in sorted(names)]
+        for job in jobs:
+            # Inline when IMAGE_DERIVATIVE_WORKERS is 0, a future otherwise
+            if hasattr(job, 'result'):
+                job.result()
+        self.stdout.write(self.style.SUCCESS(f'Generated derivatives of {len(jobs)} images'))
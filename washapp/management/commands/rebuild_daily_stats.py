@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from washapp.rollups import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the DailyStats rollups behind the admin dashboard from booking and user history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows fetched and inserted per round trip',
+        )
+
+    def handle(self, *args, **options):
+        days = rebuild_daily_stats(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt daily stats for {days} days'))
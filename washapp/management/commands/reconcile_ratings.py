@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from washapp.ratings import reconcile_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute every provider rating sum, count and average from their reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Providers fetched and updated per round trip',
+        )
+
+    def handle(self, *args, **options):
+        changed = reconcile_ratings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Reconciled ratings, {changed} providers corrected'))
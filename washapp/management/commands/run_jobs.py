@@ -0,0 +1,43 @@
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand
+
+from washapp.jobs import work
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs, such as outgoing email, until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Job kinds run at once per process, 0 runs them in turn')
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes to run')
+        parser.add_argument('--batch-size', type=int, default=50, help='Jobs claimed per round')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Stop once the queue is empty')
+
+    def handle(self, *args, **options):
+        # Extra processes are plain copies of this command; claiming keeps them apart
+        children = [
+            subprocess.Popen([
+                sys.executable, sys.argv[0], 'run_jobs',
+                '--threads', str(options['threads']),
+                '--batch-size', str(options['batch_size']),
+                '--poll-interval', str(options['poll_interval']),
+                *(['--once'] if options['once'] else []),
+            ])
+            for _ in range(options['processes'] - 1)
+        ]
+        try:
+            total = work(
+                options['threads'], options['batch_size'], options['poll_interval'], options['once'],
+                log=self.stdout.write,
+            )
+        except KeyboardInterrupt:
+            total = None
+        finally:
+            for child in children:
+                child.wait()
+        if total is not None:
+            self.stdout.write(self.style.SUCCESS(f'Ran {total} jobs'))
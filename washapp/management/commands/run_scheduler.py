@@ -0,0 +1,28 @@
+import threading
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from washapp.reminders import Scheduler
+
+
+class Command(BaseCommand):
+    help = 'Send booking reminders and cancel bookings left pending past their slot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=30.0,
+                            help='Most seconds between looks for bookings changed elsewhere')
+        parser.add_argument('--once', action='store_true', help='Run what is due now, then stop')
+
+    def handle(self, *args, **options):
+        scheduler = Scheduler()
+        if options['once']:
+            scheduler.start()
+            ran = scheduler.tick()
+            self.stdout.write(self.style.SUCCESS(f'Ran {ran} deadlines, {len(scheduler.timers)} waiting'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Scheduler started at {timezone.now():%Y-%m-%d %H:%M:%S}'))
+        try:
+            scheduler.run(threading.Event(), options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from washapp.seeding import seed
+
+
+class Command(BaseCommand):
+    help = 'Seed a realistic synthetic dataset of users, providers, bookings, reviews and payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Customers to create')
+        parser.add_argument('--providers', type=int, default=20, help='Service providers to create')
+        parser.add_argument('--bookings', type=int, default=10000, help='Bookings to create')
+        parser.add_argument('--review-rate', type=float, default=0.5,
+                            help='Share of completed bookings that get a review')
+        parser.add_argument('--payment-rate', type=float, default=0.9,
+                            help='Share of completed bookings that get a payment')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for repeatable datasets')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['providers'] < 1:
+            raise CommandError('At least one customer and one provider are needed')
+        created = seed(
+            users=options['users'],
+            providers=options['providers'],
+            bookings=options['bookings'],
+            review_rate=options['review_rate'],
+            payment_rate=options['payment_rate'],
+            batch_size=options['batch_size'],
+            random_seed=options['seed'],
+            stdout=self.stdout,
+        )
+        summary = ', '.join(f'{count} {name}' for name, count in created.items())
+        self.stdout.write(self.style.SUCCESS(f'Seeded {summary}'))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from washapp.replication import sync_replicas
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database onto every replica in DATABASE_REPLICAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            help='Keep syncing, waiting this many seconds between rounds',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            synced = sync_replicas()
+            self.stdout.write(self.style.SUCCESS(f'Synced {len(synced)} replicas: {", ".join(synced)}'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
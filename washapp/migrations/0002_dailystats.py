@@ -0,0 +1,84 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:05
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+STATUS_COLUMNS = {
+    'pending': 'pending_bookings',
+    'confirmed': 'confirmed_bookings',
+    'in_progress': 'in_progress_bookings',
+    'completed': 'completed_bookings',
+    'cancelled': 'cancelled_bookings',
+}
+USER_TYPE_COLUMNS = {
+    'customer': 'new_customers',
+    'service_provider': 'new_providers',
+    'admin': 'new_admins',
+}
+
+
+def rebuild_daily_stats(apps, schema_editor):
+    """Roll up the bookings and users made before the rollup existed"""
+    Booking = apps.get_model('washapp', 'Booking')
+    User = apps.get_model('washapp', 'User')
+    DailyStats = apps.get_model('washapp', 'DailyStats')
+    rows = defaultdict(DailyStats)
+
+    bookings = (
+        Booking.objects.order_by()
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'status')
+        .annotate(count=Count('id'), revenue=Sum('total_amount', filter=Q(status='completed')))
+    )
+    for row in bookings.iterator(chunk_size=1000):
+        stats = rows[row['day']]
+        if row['status'] in STATUS_COLUMNS:
+            setattr(stats, STATUS_COLUMNS[row['status']], row['count'])
+        stats.revenue += row['revenue'] or 0
+
+    users = (
+        User.objects.order_by()
+        .annotate(day=TruncDate('date_joined'))
+        .values('day', 'user_type')
+        .annotate(count=Count('id'))
+    )
+    for row in users.iterator(chunk_size=1000):
+        if row['user_type'] in USER_TYPE_COLUMNS:
+            setattr(rows[row['day']], USER_TYPE_COLUMNS[row['user_type']], row['count'])
+
+    for day, stats in rows.items():
+        stats.date = day
+    DailyStats.objects.bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('washapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pending_bookings', models.IntegerField(default=0)),
+                ('confirmed_bookings', models.IntegerField(default=0)),
+                ('in_progress_bookings', models.IntegerField(default=0)),
+                ('completed_bookings', models.IntegerField(default=0)),
+                ('cancelled_bookings', models.IntegerField(default=0)),
+                ('new_customers', models.IntegerField(default=0)),
+                ('new_providers', models.IntegerField(default=0)),
+                ('new_admins', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'daily stats',
+            },
+        ),
+        migrations.RunPython(rebuild_daily_stats, migrations.RunPython.noop),
+    ]
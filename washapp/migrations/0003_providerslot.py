@@ -0,0 +1,52 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+
+def reserve_existing_bookings(apps, schema_editor):
+    """Claim slots for bookings made before slot reservation existed"""
+    Booking = apps.get_model('washapp', 'Booking')
+    ProviderSlot = apps.get_model('washapp', 'ProviderSlot')
+    bookings = (
+        Booking.objects.exclude(status='cancelled')
+        .values_list('id', 'service_provider_id', 'booking_date', 'booking_time', 'service__duration')
+    )
+    slots = []
+    for booking_id, provider_id, booking_date, booking_time, duration in bookings.iterator():
+        start = (booking_time.hour * 60 + booking_time.minute) // SLOT_MINUTES
+        end = min(start + max(1, -(-duration // SLOT_MINUTES)), SLOTS_PER_DAY)
+        slots += [
+            ProviderSlot(service_provider_id=provider_id, booking_id=booking_id, date=booking_date, slot=slot)
+            for slot in range(start, end)
+        ]
+    # Bookings that already overlap keep whichever claimed the slot first
+    ProviderSlot.objects.bulk_create(slots, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('washapp', '0002_dailystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='washapp.booking')),
+                ('service_provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='washapp.serviceprovider')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='providerslot',
+            constraint=models.UniqueConstraint(fields=('service_provider', 'date', 'slot'), name='unique_provider_slot'),
+        ),
+        migrations.RunPython(reserve_existing_bookings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('washapp', '0003_providerslot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['customer', 'booking_date', 'booking_time'], name='booking_customer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['customer', 'status', 'booking_date', 'booking_time'], name='booking_customer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['customer', 'created_at'], name='booking_customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['service_provider', 'booking_date', 'booking_time'], name='booking_provider_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['booking_date', 'booking_time'], name='booking_date_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['created_at'], name='booking_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['booking', 'rating'], name='review_booking_rating_idx'),
+        ),
+    ]
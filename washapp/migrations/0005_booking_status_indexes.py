@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('washapp', '0004_booking_review_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['service_provider', 'status', 'booking_date', 'booking_time'], name='booking_provider_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'booking_date', 'booking_time'], name='booking_status_date_idx'),
+        ),
+    ]
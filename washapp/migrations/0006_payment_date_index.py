@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('washapp', '0005_booking_status_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:18
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def count_existing_reviews(apps, schema_editor):
+    """Fill the rating totals from the reviews written before they existed"""
+    ServiceProvider = apps.get_model('washapp', 'ServiceProvider')
+    Review = apps.get_model('washapp', 'Review')
+    totals = (
+        Review.objects.values('booking__service_provider')
+        .annotate(rating_sum=Sum('rating'), rating_count=Count('id'))
+        .order_by()
+    )
+    providers = []
+    for row in totals.iterator():
+        providers.append(ServiceProvider(
+            pk=row['booking__service_provider'],
+            rating_sum=row['rating_sum'],
+            rating_count=row['rating_count'],
+            rating=(Decimal(row['rating_sum']) / row['rating_count']).quantize(Decimal('0.01')),
+        ))
+    ServiceProvider.objects.bulk_update(providers, ['rating_sum', 'rating_count', 'rating'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('washapp', '0006_payment_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='serviceprovider',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='serviceprovider',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_existing_reviews, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('washapp', '0007_provider_rating_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='servicecategory',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='serviceprovider',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
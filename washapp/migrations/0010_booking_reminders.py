@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('washapp', '0009_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='reminders_sent',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['updated_at'], name='booking_updated_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 import datetime
 
@@ -38,6 +39,13 @@ class User(AbstractUser):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded type so rollups can tell when it changes
+        instance._loaded_user_type = dict(zip(field_names, values)).get('user_type')
+        return instance
+
     def __str__(self):
         return self.username
 
@@ -45,6 +53,7 @@ class User(AbstractUser):
 class ServiceCategory(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.name
@@ -57,6 +66,7 @@ class Service(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     duration = models.IntegerField(default=30)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.name
@@ -70,10 +80,17 @@ class ServiceProvider(models.Model):
     services = models.ManyToManyField(Service)
     is_verified = models.BooleanField(default=False)
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.0)
+    # Running totals behind rating, kept current by the review signals
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.company_name
 
+# Booking columns that decide which provider slots it holds
+SCHEDULE_FIELDS = ('status', 'service_provider_id', 'service_id', 'booking_date', 'booking_time')
+
 class Booking(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -94,6 +111,57 @@ class Booking(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every save, behind the API's ETags
+    updated_at = models.DateTimeField(auto_now=True)
+    # How many of the reminders in reminders.REMINDER_OFFSETS have gone out
+    reminders_sent = models.PositiveSmallIntegerField(default=0)
+    
+    class Meta:
+        indexes = [
+            # Booking lists, newest first, and the status tabs of a customer
+            models.Index(fields=['customer', 'booking_date', 'booking_time'], name='booking_customer_date_idx'),
+            models.Index(fields=['customer', 'status', 'booking_date', 'booking_time'], name='booking_customer_status_idx'),
+            # Recent bookings on the customer dashboard
+            models.Index(fields=['customer', 'created_at'], name='booking_customer_created_idx'),
+            # Provider lists and status tabs, today's schedule and slot occupancy
+            models.Index(fields=['service_provider', 'booking_date', 'booking_time'], name='booking_provider_date_idx'),
+            models.Index(fields=['service_provider', 'status', 'booking_date', 'booking_time'], name='booking_provider_status_idx'),
+            # Admin lists, their status tabs and recent bookings
+            models.Index(fields=['booking_date', 'booking_time'], name='booking_date_time_idx'),
+            models.Index(fields=['status', 'booking_date', 'booking_time'], name='booking_status_date_idx'),
+            models.Index(fields=['created_at'], name='booking_created_idx'),
+            # Changes the reminder scheduler has not seen yet
+            models.Index(fields=['updated_at'], name='booking_updated_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded status and amount so rollups can apply the difference
+        loaded = dict(zip(field_names, values))
+        instance._loaded_status = loaded.get('status')
+        instance._loaded_total_amount = loaded.get('total_amount')
+        # the provider, whose stats also change if it is reassigned
+        instance._loaded_service_provider_id = loaded.get('service_provider_id')
+        # and what its slots depend on, so they can follow a reschedule
+        instance._loaded_schedule = tuple(loaded.get(field) for field in SCHEDULE_FIELDS)
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """Save the row and, through post_save, move its slots in one transaction.
+
+        A reactivation or reschedule into a slot that is already taken
+        raises IntegrityError and leaves the row as it was.
+        """
+        loaded = {name: value for name, value in vars(self).items() if name.startswith('_loaded_')}
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        try:
+            with transaction.atomic(using=using):
+                super().save(*args, **kwargs)
+        except Exception:
+            # The handlers that ran already moved these on, but their writes were rolled back
+            vars(self).update(loaded)
+            raise
     
     def __str__(self):
         return f"Booking #{self.id}"
@@ -111,10 +179,111 @@ class Review(models.Model):
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Lets provider rating averages read ratings from the index alone
+            models.Index(fields=['booking', 'rating'], name='review_booking_rating_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded rating so the provider's totals can apply the difference
+        instance._loaded_rating = dict(zip(field_names, values)).get('rating')
+        return instance
+
 class Payment(models.Model):
     booking = models.ForeignKey(Booking, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     payment_method = models.CharField(max_length=50)
     transaction_id = models.CharField(max_length=100)
     status = models.CharField(max_length=20, default='pending')
-    payment_date = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    payment_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Date-ordered payment exports
+            models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ]
+
+class DailyStats(models.Model):
+    """Per-day rollup of bookings and sign-ups behind the admin dashboard.
+
+    Bookings count towards the day they were created on, users towards the
+    day they joined. Rows are kept current by signals and can be rebuilt from
+    history with the rebuild_daily_stats command.
+    """
+    date = models.DateField(unique=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pending_bookings = models.IntegerField(default=0)
+    confirmed_bookings = models.IntegerField(default=0)
+    in_progress_bookings = models.IntegerField(default=0)
+    completed_bookings = models.IntegerField(default=0)
+    cancelled_bookings = models.IntegerField(default=0)
+    new_customers = models.IntegerField(default=0)
+    new_providers = models.IntegerField(default=0)
+    new_admins = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'daily stats'
+
+    def __str__(self):
+        return f"Stats for {self.date}"
+
+
+class ProviderSlot(models.Model):
+    """One reserved slot of a provider's day, held by a booking.
+
+    The unique constraint on (service_provider, date, slot) is what stops two
+    concurrent requests from booking the same provider at overlapping times.
+    """
+    service_provider = models.ForeignKey(ServiceProvider, on_delete=models.CASCADE)
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='slots')
+    date = models.DateField()
+    slot = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['service_provider', 'date', 'slot'],
+                name='unique_provider_slot',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.service_provider} {self.date} slot {self.slot}"
+
+
+class Job(models.Model):
+    """A unit of background work, run by the run_jobs command.
+
+    Queued jobs whose run_at has passed are claimed in batches by workers;
+    a failure puts the job back with a later run_at until max_attempts is
+    reached.
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Workers claiming the jobs that are due
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
@@ -0,0 +1,69 @@
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.middleware.csrf import get_token
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from .catalog import catalog
+
+PAGE_CACHE_TIMEOUT = 60 * 10
+# Per-visitor parts left as holes in the cached copy and filled on every hit
+CSRF_HOLE = 'washapp-csrf-hole'
+NAVBAR_HOLE = '<!-- washapp-navbar-hole -->'
+
+
+def page_variant(user):
+    """Which cached copy a visitor gets: anonymous or their user type"""
+    return user.user_type if user.is_authenticated else 'anonymous'
+
+
+def page_key(request, variant):
+    # The catalog version is part of the key so pages listing services follow it
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'washapp:page:{catalog().version}:{variant}:{path}'
+
+
+def render_cached(request, template_name, context=None, timeout=PAGE_CACHE_TIMEOUT):
+    """Render a public page once per visitor variant and serve later hits from the cache.
+
+    The navbar and CSRF token differ between visitors of the same variant,
+    so they are stored as holes and filled in per request, the navbar from
+    its own fragment cache. Responses carry an ETag and conditional GETs get
+    a 304. The ETag is weak on pages with a CSRF token, as every visitor
+    gets a different token in an otherwise identical page. Requests with
+    pending messages and anything but GET are rendered normally.
+    """
+    if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+        return render(request, template_name, context)
+
+    key = page_key(request, page_variant(request.user))
+    page = cache.get(key)
+    if page is None:
+        body = render_to_string(template_name, {
+            **(context or {}), 'csrf_token': CSRF_HOLE, 'navbar_hole': NAVBAR_HOLE,
+        }, request)
+        page = (body, hashlib.sha1(body.encode()).hexdigest(), CSRF_HOLE in body)
+        cache.set(key, page, timeout)
+    body, digest, has_csrf = page
+
+    navbar = render_to_string('navbar.html', request=request)
+    etag = '"%s"' % hashlib.sha1(f'{digest}:{navbar}'.encode()).hexdigest()
+    if has_csrf:
+        etag = 'W/' + etag
+    # If-None-Match uses the weak comparison, ignoring W/ on either side
+    client_etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in client_etags}:
+        response = HttpResponseNotModified()
+    else:
+        body = body.replace(NAVBAR_HOLE, navbar, 1)
+        if has_csrf:
+            body = body.replace(CSRF_HOLE, get_token(request))
+        response = HttpResponse(body)
+    response['ETag'] = etag
+    patch_vary_headers(response, ['Cookie'])
+    return response
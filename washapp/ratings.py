@@ -0,0 +1,88 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Now
+from django.utils import timezone
+
+from .models import Review, ServiceProvider
+
+
+def rating_of(rating_sum, rating_count):
+    """Average rating rounded as stored on ServiceProvider.rating"""
+    if not rating_count:
+        return Decimal('0.00')
+    return (Decimal(rating_sum) / rating_count).quantize(Decimal('0.01'))
+
+
+def apply_rating_delta(provider_id, sum_delta, count_delta):
+    """Adjust a provider's rating counters and average in one UPDATE.
+
+    The new average is computed from the updated counters inside the same
+    statement, so concurrent reviews never overwrite each other's changes.
+    """
+    if not sum_delta and not count_delta:
+        return
+    rating_sum = F('rating_sum') + sum_delta
+    rating_count = F('rating_count') + count_delta
+    ServiceProvider.objects.filter(pk=provider_id).update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating=Coalesce(
+            Cast(rating_sum, FloatField()) / NullIf(rating_count, 0),
+            Value(0.0),
+            output_field=FloatField(),
+        ),
+        # update() skips auto_now
+        updated_at=Now(),
+    )
+
+
+def record_review_saved(review, provider_id, created):
+    if created:
+        apply_rating_delta(provider_id, int(review.rating), 1)
+    else:
+        loaded = getattr(review, '_loaded_rating', None)
+        if loaded is None:
+            # Saved without being loaded first, the old rating is unknown
+            reconcile_ratings(ServiceProvider.objects.filter(pk=provider_id))
+        else:
+            apply_rating_delta(provider_id, int(review.rating) - loaded, 0)
+    review._loaded_rating = int(review.rating)
+
+
+def record_review_deleted(review, provider_id):
+    rating = getattr(review, '_loaded_rating', None)
+    apply_rating_delta(provider_id, -(rating if rating is not None else int(review.rating)), -1)
+
+
+def reconcile_ratings(providers=None, batch_size=1000):
+    """Recompute the rating counters of ``providers`` (all by default) from their reviews.
+
+    Fixes drift left by bulk inserts or edits that bypassed the signals.
+    Returns the number of providers whose counters changed.
+    """
+    providers = ServiceProvider.objects.all() if providers is None else providers
+    totals = {
+        row['booking__service_provider']: (row['rating_sum'], row['rating_count'])
+        for row in Review.objects.filter(booking__service_provider__in=providers.values('pk'))
+        .values('booking__service_provider')
+        .annotate(rating_sum=Sum('rating'), rating_count=Count('id'))
+        .order_by()
+    }
+
+    changed = []
+    fields = ['rating_sum', 'rating_count', 'rating']
+    rows = providers.only(*fields).order_by('pk').iterator(chunk_size=batch_size)
+    now = timezone.now()
+    for provider in rows:
+        rating_sum, rating_count = totals.get(provider.pk, (0, 0))
+        rating = rating_of(rating_sum, rating_count)
+        if (provider.rating_sum, provider.rating_count, provider.rating) != (rating_sum, rating_count, rating):
+            provider.rating_sum, provider.rating_count, provider.rating = rating_sum, rating_count, rating
+            provider.updated_at = now
+            changed.append(provider)
+
+    with transaction.atomic():
+        ServiceProvider.objects.bulk_update(changed, fields + ['updated_at'], batch_size=batch_size)
+    return len(changed)
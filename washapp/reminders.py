@@ -0,0 +1,227 @@
+import heapq
+import threading
+import weakref
+from datetime import datetime, timedelta
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from .jobs import enqueue
+from .models import Booking
+
+# Reminders go out this long before a booking starts, earliest first
+REMINDER_OFFSETS = (timedelta(hours=24), timedelta(hours=1))
+# Bookings still expecting reminders; pending ones are also cancelled once their slot starts
+REMINDED_STATUSES = ('pending', 'confirmed')
+# How far ahead bookings are held in memory; longer than the earliest reminder
+HORIZON = timedelta(days=2)
+# Changes are re-read this far back, in case a transaction committed after a later one
+POLL_OVERLAP = timedelta(seconds=30)
+
+COLUMNS = ('id', 'status', 'booking_date', 'booking_time', 'created_at', 'reminders_sent')
+
+# Schedulers running in this process, kept in step by the booking signals
+_schedulers = weakref.WeakSet()
+
+
+def starts_at(booking_date, booking_time):
+    return timezone.make_aware(datetime.combine(booking_date, booking_time))
+
+
+def next_deadline(status, booking_date, booking_time, created_at, reminders_sent, now):
+    """(when, action, reminder index) of a booking's next deadline, None if it has none left.
+
+    A reminder whose successor is already due is skipped, as are reminders
+    that fell before the booking was made, so a late booking only gets
+    the reminders still ahead of it.
+    """
+    if status not in REMINDED_STATUSES:
+        return None
+    start = starts_at(booking_date, booking_time)
+    if start > now:
+        for index in range(reminders_sent, len(REMINDER_OFFSETS)):
+            when = start - REMINDER_OFFSETS[index]
+            later = index + 1 < len(REMINDER_OFFSETS) and start - REMINDER_OFFSETS[index + 1] <= now
+            if when >= created_at and not later:
+                return when, 'remind', index
+    if status == 'pending':
+        return start, 'expire', None
+    return None
+
+
+class Timers:
+    """Deadlines in a heap, earliest first, with at most one live entry per booking.
+
+    Changing a booking's deadline pushes a new entry and leaves the old one
+    in the heap to be skipped when it comes up, so every change is O(log n).
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.live = {}
+
+    def __len__(self):
+        return len(self.live)
+
+    def set(self, booking_id, deadline):
+        if deadline is None:
+            self.live.pop(booking_id, None)
+            return
+        if self.live.get(booking_id) == deadline:
+            return
+        self.live[booking_id] = deadline
+        heapq.heappush(self.heap, (deadline[0], booking_id, deadline))
+        if len(self.heap) > 2 * len(self.live) + 64:
+            # Mostly dead entries, rebuild from the live ones
+            self.heap = [(deadline[0], pk, deadline) for pk, deadline in self.live.items()]
+            heapq.heapify(self.heap)
+
+    def pop_due(self, now):
+        """(booking id, deadline) of every live deadline at or before ``now``"""
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, booking_id, deadline = heapq.heappop(self.heap)
+            if self.live.get(booking_id) == deadline:
+                del self.live[booking_id]
+                due.append((booking_id, deadline))
+        return due
+
+    def next_at(self):
+        while self.heap and self.live.get(self.heap[0][1]) != self.heap[0][2]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+
+class Scheduler:
+    """Booking reminders and expiry of unconfirmed bookings, due times kept in memory.
+
+    Bookings are loaded a day at a time as they come within HORIZON, each
+    with one indexed range query, and changes are picked up from the
+    updated_at index, so the booking table is never scanned. Saves and
+    deletes in this process update the timers directly through signals.
+    Every read is from the primary: a lagging replica would re-arm
+    deadlines that were just handled and hide changes from the poll.
+    """
+
+    def __init__(self, horizon=HORIZON):
+        self.horizon = horizon
+        self.timers = Timers()
+        self.loaded_until = None
+        self.seen = None
+        self.lock = threading.Lock()
+
+    def track(self, booking_id, status, booking_date, booking_time, created_at, reminders_sent, now=None):
+        deadline = None
+        # Later bookings are picked up with their day once it comes within the horizon
+        if self.loaded_until is not None and booking_date <= self.loaded_until:
+            deadline = next_deadline(
+                status, booking_date, booking_time, created_at, reminders_sent, now or timezone.now(),
+            )
+        with self.lock:
+            self.timers.set(booking_id, deadline)
+
+    def track_rows(self, queryset, now):
+        for row in queryset.values_list(*COLUMNS):
+            self.track(*row, now=now)
+
+    def start(self, now=None):
+        """Load every booking with a deadline up to the horizon"""
+        now = now or timezone.now()
+        self.seen = now
+        first = (now - max(REMINDER_OFFSETS)).date()
+        self.loaded_until = first - timedelta(days=1)
+        # Pending bookings whose slot passed while no scheduler was running
+        self.track_rows(
+            Booking.objects.using(DEFAULT_DB_ALIAS).filter(status='pending', booking_date__lt=first), now,
+        )
+        self.extend(now)
+        _schedulers.add(self)
+
+    def extend(self, now):
+        """Load the days that have come within the horizon since the last call"""
+        last = (now + self.horizon).date()
+        while self.loaded_until < last:
+            self.loaded_until += timedelta(days=1)
+            day = Booking.objects.using(DEFAULT_DB_ALIAS).filter(
+                status__in=REMINDED_STATUSES, booking_date=self.loaded_until,
+            )
+            self.track_rows(day, now)
+
+    def poll(self, now):
+        """Apply bookings changed by other processes since the last poll"""
+        changed = Booking.objects.using(DEFAULT_DB_ALIAS).filter(
+            updated_at__gte=self.seen - POLL_OVERLAP, booking_date__lte=self.loaded_until,
+        )
+        self.seen = now
+        self.track_rows(changed, now)
+
+    def tick(self, now=None):
+        """Catch up with the clock and the database, then run what is due. Returns the count run."""
+        now = now or timezone.now()
+        self.extend(now)
+        self.poll(now)
+        with self.lock:
+            due = self.timers.pop_due(now)
+        for booking_id, (_, action, index) in due:
+            if action == 'remind':
+                send_reminder(booking_id, index)
+            else:
+                expire(booking_id, now)
+            row = Booking.objects.using(DEFAULT_DB_ALIAS).filter(id=booking_id).values_list(*COLUMNS).first()
+            if row:
+                self.track(*row, now=now)
+        return len(due)
+
+    def seconds_until_next(self, now=None):
+        with self.lock:
+            next_at = self.timers.next_at()
+        if next_at is None:
+            return None
+        return max(0.0, (next_at - (now or timezone.now())).total_seconds())
+
+    def run(self, stop, poll_interval=30.0):
+        """Tick until ``stop`` is set, sleeping until the next deadline or poll"""
+        self.start()
+        while not stop.is_set():
+            self.tick()
+            wait = self.seconds_until_next()
+            stop.wait(poll_interval if wait is None else min(wait, poll_interval))
+
+
+def send_reminder(booking_id, index):
+    """Mark reminder ``index`` sent and queue its email, unless it already went out"""
+    with transaction.atomic():
+        claimed = Booking.objects.using(DEFAULT_DB_ALIAS).filter(
+            id=booking_id, status__in=REMINDED_STATUSES, reminders_sent__lte=index,
+        ).update(reminders_sent=index + 1)
+        if claimed:
+            hours = int(REMINDER_OFFSETS[index].total_seconds() // 3600)
+            enqueue('booking_notice', {'booking_id': booking_id, 'notice': 'reminder', 'hours': hours})
+    return bool(claimed)
+
+
+def expire(booking_id, now):
+    """Cancel a booking still pending once its slot has started, through save() so the signals run.
+
+    The write transaction keeps a confirmation from landing between the
+    check and the save.
+    """
+    with transaction.atomic():
+        booking = Booking.objects.using(DEFAULT_DB_ALIAS).filter(id=booking_id, status='pending').first()
+        if booking is None or starts_at(booking.booking_date, booking.booking_time) > now:
+            return False
+        booking.status = 'cancelled'
+        booking.save()
+        enqueue('booking_notice', {'booking_id': booking_id, 'notice': 'expired'})
+    return True
+
+
+def booking_saved(booking):
+    for scheduler in list(_schedulers):
+        scheduler.track(*(getattr(booking, column) for column in COLUMNS))
+
+
+def booking_deleted(booking):
+    for scheduler in list(_schedulers):
+        with scheduler.lock:
+            scheduler.timers.set(booking.id, None)
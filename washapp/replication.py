@@ -0,0 +1,149 @@
+import os
+import random
+import sqlite3
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Models whose reads may be served by a replica; everything else stays on the primary
+REPLICATED_MODELS = {'washapp.service', 'washapp.servicecategory', 'washapp.booking'}
+# Cookie keeping a visitor on the primary for a while after they wrote
+PIN_COOKIE = 'washapp_primary'
+
+# Read routing state of the request being handled in this thread or task
+_current = ContextVar('washapp_replica_pin', default=None)
+
+
+class ReplicaPin:
+    __slots__ = ('pinned', 'wrote', 'safe')
+
+    def __init__(self, pinned=False, safe=True):
+        self.pinned = pinned
+        self.wrote = False
+        # GET and HEAD only; anything else may save what it reads
+        self.safe = safe
+
+    @classmethod
+    def for_request(cls, request):
+        return cls(PIN_COOKIE in request.COOKIES, request.method in ('GET', 'HEAD', 'OPTIONS'))
+
+
+def replicated(model):
+    return model._meta.label_lower in REPLICATED_MODELS
+
+
+def replicas():
+    """Configured replica aliases that have been synced at least once"""
+    return [
+        alias for alias in getattr(settings, 'DATABASE_REPLICAS', ())
+        if os.path.exists(connections[alias].settings_dict['NAME'])
+    ]
+
+
+class PrimaryReplicaRouter:
+    """Send catalog and booking reads of safe requests to a replica, everything else to the primary.
+
+    Only GET and HEAD requests passing through ReplicaPinMiddleware read
+    from a replica, so management commands, job workers and form posts that
+    save what they read always see the primary. Reads also stay on the
+    primary inside a transaction on it, in a request that already wrote a
+    replicated model, and for a visitor pinned after a recent write, so a
+    visitor always sees their own changes however far the replicas lag.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not replicated(model) or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        pin = _current.get()
+        if pin is None or not pin.safe or pin.pinned or pin.wrote:
+            return DEFAULT_DB_ALIAS
+        aliases = replicas()
+        return random.choice(aliases) if aliases else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        pin = _current.get()
+        if pin is not None and replicated(model):
+            pin.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas are full copies of the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema along with the data from sync_replicas
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinMiddleware:
+    """Pin a visitor's reads to the primary for REPLICA_PIN_SECONDS after they wrote.
+
+    The pin travels in a cookie, so it covers the redirect and pages that
+    follow a booking or status change whichever worker serves them.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        pin = ReplicaPin.for_request(request)
+        token = _current.set(pin)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(response, pin)
+
+    async def __acall__(self, request):
+        pin = ReplicaPin.for_request(request)
+        token = _current.set(pin)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(response, pin)
+
+    def finish(self, response, pin):
+        if pin.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5),
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+def copy_database(source, target):
+    """Copy a whole SQLite database between two sqlite3 connections.
+
+    Uses the online backup API, so the source stays writable and readers of
+    the target see either the old or the new copy, never a mix.
+    """
+    source.backup(target)
+
+
+def sync_replicas():
+    """Bring every configured replica up to date with the primary; returns the aliases synced"""
+    primary = connections[DEFAULT_DB_ALIAS]
+    primary.ensure_connection()
+    synced = []
+    for alias in getattr(settings, 'DATABASE_REPLICAS', ()):
+        name = connections[alias].settings_dict['NAME']
+        # Test mirrors share the primary's database
+        if str(name) == str(primary.settings_dict['NAME']):
+            continue
+        target = sqlite3.connect(name)
+        try:
+            copy_database(primary.connection, target)
+        finally:
+            target.close()
+        synced.append(alias)
+    return synced
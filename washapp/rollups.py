@@ -0,0 +1,166 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .bookings import BOOKING_TABS
+from .models import Booking, DailyStats, User
+
+# DailyStats column counting bookings in each status
+STATUS_COLUMNS = {status: f'{status}_bookings' for status, _ in Booking.STATUS_CHOICES}
+
+# DailyStats column counting new users of each type
+USER_TYPE_COLUMNS = {
+    'customer': 'new_customers',
+    'service_provider': 'new_providers',
+    'admin': 'new_admins',
+}
+
+
+def apply_deltas(day, deltas):
+    """Add the given amounts to the columns of one day's rollup row"""
+    deltas = {column: delta for column, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    DailyStats.objects.get_or_create(date=day)
+    DailyStats.objects.filter(date=day).update(
+        **{column: F(column) + delta for column, delta in deltas.items()}
+    )
+
+
+def booking_deltas(status, amount, sign):
+    """Rollup changes for adding (sign=1) or removing (sign=-1) one booking"""
+    deltas = defaultdict(int)
+    if status in STATUS_COLUMNS:
+        deltas[STATUS_COLUMNS[status]] += sign
+    if status == 'completed':
+        deltas['revenue'] = sign * Decimal(amount or 0)
+    return deltas
+
+
+def record_booking_saved(booking, created):
+    """Move a booking between rollup columns when it is created or its status changes"""
+    old_status = None if created else getattr(booking, '_loaded_status', None)
+    old_amount = None if created else getattr(booking, '_loaded_total_amount', None)
+    if not created and old_status is None:
+        # Instance was not loaded from the database, nothing to diff against
+        return
+    if old_status == booking.status and old_amount == booking.total_amount:
+        return
+
+    deltas = booking_deltas(booking.status, booking.total_amount, 1)
+    if old_status is not None:
+        for column, delta in booking_deltas(old_status, old_amount, -1).items():
+            deltas[column] += delta
+    apply_deltas(timezone.localdate(booking.created_at), deltas)
+
+    booking._loaded_status = booking.status
+    booking._loaded_total_amount = booking.total_amount
+
+
+def record_booking_deleted(booking):
+    apply_deltas(
+        timezone.localdate(booking.created_at),
+        booking_deltas(booking.status, booking.total_amount, -1),
+    )
+
+
+def record_user_saved(user, created):
+    """Count a new user, or move an existing one to its new type"""
+    old_type = None if created else getattr(user, '_loaded_user_type', None)
+    if not created and (old_type is None or old_type == user.user_type):
+        return
+
+    deltas = defaultdict(int)
+    if user.user_type in USER_TYPE_COLUMNS:
+        deltas[USER_TYPE_COLUMNS[user.user_type]] += 1
+    if old_type in USER_TYPE_COLUMNS:
+        deltas[USER_TYPE_COLUMNS[old_type]] -= 1
+    apply_deltas(timezone.localdate(user.date_joined), deltas)
+    user._loaded_user_type = user.user_type
+
+
+def record_user_deleted(user):
+    if user.user_type in USER_TYPE_COLUMNS:
+        apply_deltas(timezone.localdate(user.date_joined), {USER_TYPE_COLUMNS[user.user_type]: -1})
+
+
+def admin_totals_aggregates():
+    return dict(
+        total_revenue=Sum('revenue'),
+        total_customers=Sum('new_customers'),
+        total_providers=Sum('new_providers'),
+        total_admins=Sum('new_admins'),
+        **{column: Sum(column) for column in STATUS_COLUMNS.values()},
+    )
+
+
+def admin_totals_result(totals):
+    totals = {key: value or 0 for key, value in totals.items()}
+    totals['total_users'] = (
+        totals['total_customers'] + totals['total_providers'] + totals.pop('total_admins')
+    )
+    totals['total_bookings'] = sum(totals[column] for column in STATUS_COLUMNS.values())
+    return totals
+
+
+def admin_totals():
+    """All-time admin dashboard numbers summed over the daily rollup rows"""
+    return admin_totals_result(DailyStats.objects.aggregate(**admin_totals_aggregates()))
+
+
+async def aadmin_totals():
+    return admin_totals_result(await DailyStats.objects.aaggregate(**admin_totals_aggregates()))
+
+
+def rollup_tab_counts(totals=None):
+    """my_bookings tab counts over every booking, read from the daily rollups"""
+    totals = totals or admin_totals()
+    return {
+        tab: sum(totals[STATUS_COLUMNS[status]] for status in statuses) if statuses else totals['total_bookings']
+        for tab, statuses in BOOKING_TABS.items()
+    }
+
+
+def rebuild_daily_stats(batch_size=1000):
+    """Recompute every rollup row from the Booking and User tables.
+
+    The per-day totals are grouped in the database and streamed back in
+    chunks of ``batch_size``, so no booking or user row is ever loaded and
+    memory grows with the number of days only. Returns the number of days
+    written.
+    """
+    rows = defaultdict(lambda: DailyStats())
+
+    bookings = (
+        Booking.objects.order_by()
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'status')
+        .annotate(count=Count('id'), revenue=Sum('total_amount', filter=Q(status='completed')))
+    )
+    for row in bookings.iterator(chunk_size=batch_size):
+        stats = rows[row['day']]
+        if row['status'] in STATUS_COLUMNS:
+            setattr(stats, STATUS_COLUMNS[row['status']], row['count'])
+        stats.revenue += row['revenue'] or 0
+
+    users = (
+        User.objects.order_by()
+        .annotate(day=TruncDate('date_joined'))
+        .values('day', 'user_type')
+        .annotate(count=Count('id'))
+    )
+    for row in users.iterator(chunk_size=batch_size):
+        if row['user_type'] in USER_TYPE_COLUMNS:
+            setattr(rows[row['day']], USER_TYPE_COLUMNS[row['user_type']], row['count'])
+
+    for day, stats in rows.items():
+        stats.date = day
+
+    with transaction.atomic():
+        DailyStats.objects.all().delete()
+        DailyStats.objects.bulk_create(rows.values(), batch_size=batch_size)
+    return len(rows)
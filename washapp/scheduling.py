@@ -0,0 +1,156 @@
+import math
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+
+from .models import SCHEDULE_FIELDS, Booking, ProviderSlot, ServiceProvider
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+# Bookings in these statuses no longer hold their provider's time
+RELEASED_STATUSES = ('cancelled',)
+
+
+class SlotUnavailable(Exception):
+    """No provider offering the service is free for the requested slot"""
+
+
+def slot_range(booking_time, duration):
+    """Indexes of the day slots covered by a booking, clipped at midnight"""
+    start = (booking_time.hour * 60 + booking_time.minute) // SLOT_MINUTES
+    end = start + max(1, math.ceil(duration / SLOT_MINUTES))
+    return range(start, min(end, SLOTS_PER_DAY))
+
+
+def slot_mask(booking_time, duration):
+    """Bitmap of the day slots covered by a booking"""
+    slots = slot_range(booking_time, duration)
+    return ((1 << len(slots)) - 1) << slots.start
+
+
+def occupancy_index(provider_ids, booking_date):
+    """Occupied-slot bitmap of each provider's day, built from one query.
+
+    Providers without bookings that day map to an empty bitmap, so a free
+    check is a single AND whatever the size of the booking history. Read
+    from the primary, as a lagging replica would hand out taken slots.
+    """
+    index = dict.fromkeys(provider_ids, 0)
+    bookings = (
+        Booking.objects.using(DEFAULT_DB_ALIAS).filter(service_provider_id__in=index, booking_date=booking_date)
+        .exclude(status__in=RELEASED_STATUSES)
+        .values_list('service_provider_id', 'booking_time', 'service__duration')
+    )
+    for provider_id, booking_time, duration in bookings:
+        index[provider_id] |= slot_mask(booking_time, duration)
+    return index
+
+
+def free_providers(service, booking_date, booking_time):
+    """Ids of providers offering the service who are free at that time, least loaded first"""
+    provider_ids = ServiceProvider.objects.using(DEFAULT_DB_ALIAS).filter(services=service).values_list('id', flat=True)
+    index = occupancy_index(provider_ids, booking_date)
+    wanted = slot_mask(booking_time, service.duration)
+    free = [provider_id for provider_id, mask in index.items() if not mask & wanted]
+    return sorted(free, key=lambda provider_id: (bin(index[provider_id]).count('1'), provider_id))
+
+
+def assign_providers(services, booking_date, booking_time):
+    """Pick a provider for each of ``services``, all booked at the same time.
+
+    One query finds who offers what and one more their day's occupancy,
+    however many services there are. Each pick is the least-loaded free
+    provider, whose slots are then taken before the next pick. Returns
+    provider ids in the order of ``services``, raising SlotUnavailable with
+    the first service no provider is left for.
+    """
+    offered_by = {}
+    offers = ServiceProvider.services.through.objects.using(DEFAULT_DB_ALIAS).filter(
+        service_id__in={service.id for service in services}
+    ).values_list('service_id', 'serviceprovider_id')
+    for service_id, provider_id in offers:
+        offered_by.setdefault(service_id, []).append(provider_id)
+    index = occupancy_index({p for ids in offered_by.values() for p in ids}, booking_date)
+
+    assigned = []
+    for service in services:
+        wanted = slot_mask(booking_time, service.duration)
+        free = [p for p in offered_by.get(service.id, ()) if not index[p] & wanted]
+        if not free:
+            raise SlotUnavailable(f'No provider is left for {service.name} at the selected time')
+        provider_id = min(free, key=lambda p: (bin(index[p]).count('1'), p))
+        index[provider_id] |= wanted
+        assigned.append(provider_id)
+    return assigned
+
+
+def reserve_slots(booking):
+    """Claim the booking's slots, raising IntegrityError if any is already taken"""
+    ProviderSlot.objects.bulk_create(slot_rows([booking]))
+
+
+def book_slot(service, booking_date, booking_time, **booking_fields):
+    """Create a booking with the least-loaded provider free at the requested time.
+
+    Each attempt creates the booking and its slot rows in one transaction; a
+    concurrent request that got to a slot first makes the insert fail on the
+    unique constraint, and the next free provider is tried instead.
+    """
+    for provider_id in free_providers(service, booking_date, booking_time):
+        try:
+            with transaction.atomic():
+                booking = Booking.objects.create(
+                    service=service, service_provider_id=provider_id,
+                    booking_date=booking_date, booking_time=booking_time,
+                    **booking_fields,
+                )
+                reserve_slots(booking)
+            return booking
+        except IntegrityError:
+            continue
+    raise SlotUnavailable('No provider is available at the selected time')
+
+
+def slot_rows(bookings):
+    """ProviderSlot rows claiming the slots of saved bookings with their services loaded"""
+    return [
+        ProviderSlot(
+            service_provider_id=booking.service_provider_id, booking=booking,
+            date=booking.booking_date, slot=slot,
+        )
+        for booking in bookings
+        for slot in slot_range(booking.booking_time, booking.service.duration)
+    ]
+
+
+def release_slots(booking):
+    ProviderSlot.objects.filter(booking=booking).delete()
+
+
+def move_slots(booking, created):
+    """Keep a saved booking's slots in step with its status, provider, service, date and time.
+
+    Cancelling releases them, reactivating takes them again and a
+    reschedule swaps the old ones for the new in one savepoint, raising
+    IntegrityError if any new one is already taken. New bookings get their
+    slots from book_slot or checkout.
+    """
+    schedule = tuple(getattr(booking, field) for field in SCHEDULE_FIELDS)
+    loaded = None if created else getattr(booking, '_loaded_schedule', None)
+    if loaded is not None and None in loaded:
+        # Loaded without some of the columns, nothing to diff against
+        loaded = None
+    held = booking.status not in RELEASED_STATUSES
+    was_held = loaded is not None and loaded[0] not in RELEASED_STATUSES
+
+    if created:
+        pass
+    elif not held:
+        if loaded is None or was_held:
+            release_slots(booking)
+    elif loaded is not None and (not was_held or loaded[1:] != schedule[1:]):
+        with transaction.atomic():
+            if was_held:
+                release_slots(booking)
+            reserve_slots(booking)
+    booking._loaded_schedule = schedule
@@ -0,0 +1,153 @@
+import datetime
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from .models import Booking, Payment, Review, Service, ServiceCategory, ServiceProvider, User
+from .ratings import reconcile_ratings
+from .rollups import rebuild_daily_stats
+
+CATALOG = {
+    'Exterior': [('Basic Wash', 15, 20), ('Foam Wash', 25, 30), ('Wax & Polish', 45, 60)],
+    'Interior': [('Vacuum', 20, 30), ('Deep Clean', 60, 90), ('Leather Care', 40, 45)],
+    'Detailing': [('Full Detail', 150, 180), ('Headlight Restore', 35, 30), ('Ceramic Coat', 300, 240)],
+}
+VEHICLE_TYPES = ['Sedan', 'SUV', 'Hatchback', 'Pickup', 'Van']
+# Rough status mix of a live system
+STATUS_WEIGHTS = {'pending': 10, 'confirmed': 10, 'in_progress': 2, 'completed': 65, 'cancelled': 13}
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed_catalog():
+    """Categories and services, reusing any that already exist"""
+    services = []
+    for category_name, entries in CATALOG.items():
+        category, _ = ServiceCategory.objects.get_or_create(name=category_name)
+        for name, price, duration in entries:
+            service, _ = Service.objects.get_or_create(
+                category=category, name=name,
+                defaults={'description': f'{name} service', 'price': Decimal(price), 'duration': duration},
+            )
+            services.append(service)
+    return services
+
+
+def seed_users(count, user_type, prefix, batch_size, password):
+    """Bulk create users and return their ids"""
+    ids = []
+    start = User.objects.count()
+    users = (
+        User(
+            username=f'{prefix}{start + i}', email=f'{prefix}{start + i}@example.com',
+            password=password, user_type=user_type,
+        )
+        for i in range(count)
+    )
+    for batch in batched(users, batch_size):
+        ids += [user.id for user in User.objects.bulk_create(batch)]
+    return ids
+
+
+def seed_providers(user_ids, services, rng, batch_size):
+    """One ServiceProvider per user, each offering a random subset of the catalog.
+
+    Returns the ids of the providers offering each service.
+    """
+    providers = []
+    for batch in batched(user_ids, batch_size):
+        providers += ServiceProvider.objects.bulk_create([
+            ServiceProvider(
+                user_id=user_id, company_name=f'Provider {user_id}', address='Main St',
+                phone='555-0100', email=f'provider{user_id}@example.com', is_verified=True,
+            )
+            for user_id in batch
+        ])
+
+    Through = ServiceProvider.services.through
+    offered_by = {service.id: [] for service in services}
+    links = []
+    for provider in providers:
+        for service in rng.sample(services, rng.randint(1, len(services))):
+            offered_by[service.id].append(provider.id)
+            links.append(Through(serviceprovider_id=provider.id, service_id=service.id))
+    for batch in batched(links, batch_size):
+        Through.objects.bulk_create(batch)
+    return offered_by
+
+
+def seed(users=1000, providers=20, bookings=10000, review_rate=0.5, payment_rate=0.9,
+         batch_size=5000, random_seed=0, stdout=None):
+    """Insert a realistic dataset with bulk inserts and return what was created.
+
+    Bookings are generated and inserted one batch at a time, so memory stays
+    flat however many are requested. Reviews and payments are attached to a
+    share of the completed bookings. Rollups and provider ratings are rebuilt
+    at the end since bulk inserts skip the signals that normally maintain them.
+    """
+    rng = random.Random(random_seed)
+    log = stdout.write if stdout else (lambda message: None)
+    password = make_password('password')
+
+    services = seed_catalog()
+    customer_ids = seed_users(users, 'customer', 'customer', batch_size, password)
+    provider_user_ids = seed_users(providers, 'service_provider', 'provider', batch_size, password)
+    offered_by = seed_providers(provider_user_ids, services, rng, batch_size)
+    services = [service for service in services if offered_by[service.id]]
+    seed_users(max(1, users // 10000), 'admin', 'admin', batch_size, password)
+    log(f'Seeded {len(customer_ids)} customers and {len(provider_user_ids)} providers')
+
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+    today = timezone.localdate()
+    created = {'bookings': 0, 'reviews': 0, 'payments': 0}
+
+    def generate():
+        for i in range(bookings):
+            service = rng.choice(services)
+            yield Booking(
+                customer_id=rng.choice(customer_ids),
+                service_id=service.id,
+                service_provider_id=rng.choice(offered_by[service.id]),
+                booking_date=today + datetime.timedelta(days=rng.randint(-365, 60)),
+                booking_time=datetime.time(rng.randint(7, 19), rng.choice((0, 15, 30, 45))),
+                vehicle_type=rng.choice(VEHICLE_TYPES),
+                vehicle_number=f'SEED-{i}',
+                status=rng.choices(statuses, weights)[0],
+                total_amount=service.price,
+            )
+
+    for batch in batched(generate(), batch_size):
+        batch = Booking.objects.bulk_create(batch)
+        completed = [b for b in batch if b.status == 'completed']
+        reviews = Review.objects.bulk_create([
+            Review(booking_id=b.id, customer_id=b.customer_id, rating=rng.choices(range(1, 6), (1, 1, 3, 10, 15))[0])
+            for b in completed if rng.random() < review_rate
+        ])
+        payments = Payment.objects.bulk_create([
+            Payment(
+                booking_id=b.id, amount=b.total_amount, payment_method='card',
+                transaction_id=f'TX-{b.id}', status='completed',
+            )
+            for b in completed if rng.random() < payment_rate
+        ])
+        created['bookings'] += len(batch)
+        created['reviews'] += len(reviews)
+        created['payments'] += len(payments)
+        log(f'Seeded {created["bookings"]}/{bookings} bookings')
+
+    rebuild_daily_stats(batch_size=batch_size)
+    reconcile_ratings(batch_size=batch_size)
+    created.update(customers=len(customer_ids), providers=len(provider_user_ids))
+    return created
@@ -0,0 +1,140 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.functions import Now
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import accounts, images, instrumentation, ratings, reminders, rollups, scheduling
+from .catalog import bump_catalog_version
+from .models import Booking, Review, Service, ServiceCategory, ServiceProvider, User
+from .stats import invalidate_customer_stats, invalidate_provider_stats
+
+
+@receiver([post_save, post_delete], sender=Booking)
+def booking_changed(sender, instance, **kwargs):
+    """Drop cached numbers that the saved or deleted booking feeds into"""
+    invalidate_customer_stats(instance.customer_id)
+    invalidate_provider_stats(instance.service_provider_id)
+    # A reassigned booking leaves its previous provider's numbers too
+    loaded = getattr(instance, '_loaded_service_provider_id', None)
+    if loaded is not None and loaded != instance.service_provider_id:
+        invalidate_provider_stats(loaded)
+    instance._loaded_service_provider_id = instance.service_provider_id
+
+
+def review_provider_id(review):
+    return Booking.objects.filter(pk=review.booking_id).values_list(
+        'service_provider_id', flat=True
+    ).first()
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, raw=False, **kwargs):
+    """Fold the review into its provider's rating and drop the provider's cached stats"""
+    provider_id = review_provider_id(instance)
+    if provider_id is None:
+        return
+    if not raw:
+        ratings.record_review_saved(instance, provider_id, created)
+    invalidate_provider_stats(provider_id)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    provider_id = review_provider_id(instance)
+    if provider_id is None:
+        return
+    ratings.record_review_deleted(instance, provider_id)
+    invalidate_provider_stats(provider_id)
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        rollups.record_booking_saved(instance, created)
+
+
+@receiver(post_save, sender=Booking)
+def booking_slots_moved(sender, instance, created, raw=False, **kwargs):
+    """Release, retake or move the booking's slots as its status or time changes"""
+    if not raw:
+        scheduling.move_slots(instance, created)
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    rollups.record_booking_deleted(instance)
+
+
+@receiver(post_save, sender=Booking)
+def booking_rescheduled(sender, instance, raw=False, **kwargs):
+    """Move the booking's reminder and expiry timers in any scheduler running here"""
+    if not raw:
+        reminders.booking_saved(instance)
+
+
+@receiver(post_delete, sender=Booking)
+def booking_unscheduled(sender, instance, **kwargs):
+    reminders.booking_deleted(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        rollups.record_user_saved(instance, created)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    rollups.record_user_deleted(instance)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    """Drop the cached request.user after profile saves, password changes and logins"""
+    accounts.invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=ServiceProvider)
+def provider_changed(sender, instance, **kwargs):
+    # The cached user carries its provider id
+    accounts.invalidate_user(instance.user_id)
+
+
+@receiver(m2m_changed, sender=ServiceProvider.services.through)
+def provider_services_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Bump updated_at of providers gaining or losing services, behind the API's ?service= ETags"""
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        providers = ServiceProvider.objects.filter(pk=instance.pk)
+    elif reverse and action in ('post_add', 'post_remove'):
+        providers = ServiceProvider.objects.filter(pk__in=pk_set)
+    elif reverse and action == 'pre_clear':
+        # Once cleared there is no telling which providers offered the service
+        providers = ServiceProvider.objects.filter(services=instance)
+    else:
+        return
+    providers.update(updated_at=Now())
+
+
+@receiver([post_save, post_delete], sender=Service)
+@receiver([post_save, post_delete], sender=ServiceCategory)
+def catalog_changed(sender, **kwargs):
+    # After commit, so no worker can cache the old rows under the new version
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=User)
+def image_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Queue resized and WebP copies of a new service image or profile picture"""
+    field = 'image' if sender is Service else 'profile_picture'
+    image = getattr(instance, field)
+    if raw or not image or (update_fields is not None and field not in update_fields):
+        return
+    if images.manifest_of(image.name) is None:
+        transaction.on_commit(lambda: images.schedule_derivatives(image.name))
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    instrumentation.install_query_timer(connection)
@@ -0,0 +1,86 @@
+import socketserver
+import threading
+from email import message_from_bytes, policy
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of SMTP for Django's backend: greet, take messages, quit"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 washapp debugging SMTP')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                sender, recipients = command.partition(':')[2].strip(' <>'), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipient = command.partition(':')[2].strip(' <>')
+                if recipient in server.reject:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(recipient)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for data_line in iter(self.rfile.readline, b''):
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(data_line[1:] if data_line.startswith(b'..') else data_line)
+                message = message_from_bytes(b''.join(data), policy=policy.default)
+                server.received(sender, recipients, message)
+                self.reply('250 OK')
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class DebuggingSMTPServer(socketserver.ThreadingTCPServer):
+    """Local SMTP stand-in that keeps what it receives instead of delivering it.
+
+    ``messages`` holds (sender, recipients, message) in arrival order and
+    ``connections`` counts SMTP sessions, so tests can check batching.
+    Recipients in ``reject`` are refused, to exercise failures.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), on_message=None, reject=()):
+        super().__init__(address, SMTPHandler)
+        self.lock = threading.Lock()
+        self.messages = []
+        self.connections = 0
+        self.on_message = on_message
+        self.reject = set(reject)
+
+    def received(self, sender, recipients, message):
+        with self.lock:
+            self.messages.append((sender, recipients, message))
+        if self.on_message:
+            self.on_message(sender, recipients, message)
+
+    def start(self):
+        """Serve from a background thread; returns the (host, port) bound"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address
@@ -0,0 +1,196 @@
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+
+from .models import Booking
+
+UPCOMING_STATUSES = ('pending', 'confirmed')
+CUSTOMER_STATS_TIMEOUT = 60 * 15
+PROVIDER_STATS_TIMEOUT = 60 * 15
+
+# Hit and miss counts of the stats caches in this process, for monitoring
+_counters = Counter()
+_counters_lock = threading.Lock()
+
+
+async def alist(queryset):
+    """Evaluate a queryset through the async ORM"""
+    return [row async for row in queryset]
+
+
+def count_cache_lookup(name, hit):
+    with _counters_lock:
+        _counters[f'{name}_{"hits" if hit else "misses"}'] += 1
+
+
+def cache_counters():
+    """Snapshot of the hit and miss counters, e.g. {'provider_stats_hits': 3}"""
+    with _counters_lock:
+        return dict(_counters)
+
+
+def customer_stats_key(customer_id):
+    return f'washapp:customer-stats:{customer_id}'
+
+
+def customer_stats_queries(customer_id):
+    """The aggregate, next-booking and recent-bookings queries behind a customer's stats"""
+    # Cached until the next booking change, so read from the primary rather than a lagging replica
+    bookings = Booking.objects.using(DEFAULT_DB_ALIAS).filter(customer_id=customer_id)
+    aggregates = dict(
+        total_bookings=Count('id'),
+        upcoming_bookings=Count('id', filter=Q(status__in=UPCOMING_STATUSES)),
+        completed_bookings=Count('id', filter=Q(status='completed')),
+        total_spent=Sum('total_amount', filter=Q(status='completed')),
+    )
+    with_service = bookings.select_related('service')
+    upcoming = with_service.filter(status__in=UPCOMING_STATUSES).order_by('booking_date', 'booking_time')
+    recent = with_service.order_by('-created_at')[:5]
+    return bookings, aggregates, upcoming, recent
+
+
+def customer_stats_result(stats, next_booking, recent_bookings):
+    stats['total_spent'] = stats['total_spent'] or 0
+    stats['next_booking'] = next_booking
+    stats['recent_bookings'] = list(recent_bookings)
+    return stats
+
+
+def compute_customer_stats(customer_id):
+    """Dashboard numbers for one customer from a single conditional aggregate"""
+    bookings, aggregates, upcoming, recent = customer_stats_queries(customer_id)
+    return customer_stats_result(bookings.aggregate(**aggregates), upcoming.first(), recent)
+
+
+async def acompute_customer_stats(customer_id):
+    """compute_customer_stats through the async ORM.
+
+    Django 4.2 runs async queries one at a time on the thread shared with
+    sync code, so the three queries do not overlap; awaiting them only
+    frees the event loop for other requests meanwhile.
+    """
+    bookings, aggregates, upcoming, recent = customer_stats_queries(customer_id)
+    return customer_stats_result(
+        await bookings.aaggregate(**aggregates), await upcoming.afirst(), await alist(recent),
+    )
+
+
+def customer_stats(customer_id):
+    """Cached dashboard numbers for one customer, recomputed after invalidation.
+
+    Only cached with SHARED_CACHE: an invalidation clears the cache of the
+    process that made the change, and a per-process cache would leave the
+    other workers showing the old numbers.
+    """
+    if not getattr(settings, 'SHARED_CACHE', False):
+        return compute_customer_stats(customer_id)
+    key = customer_stats_key(customer_id)
+    stats = cache.get(key)
+    count_cache_lookup('customer_stats', stats is not None)
+    if stats is None:
+        stats = compute_customer_stats(customer_id)
+        cache.set(key, stats, CUSTOMER_STATS_TIMEOUT)
+    return stats
+
+
+async def acustomer_stats(customer_id):
+    if not getattr(settings, 'SHARED_CACHE', False):
+        return await acompute_customer_stats(customer_id)
+    key = customer_stats_key(customer_id)
+    stats = await cache.aget(key)
+    count_cache_lookup('customer_stats', stats is not None)
+    if stats is None:
+        stats = await acompute_customer_stats(customer_id)
+        await cache.aset(key, stats, CUSTOMER_STATS_TIMEOUT)
+    return stats
+
+
+def invalidate_customer_stats(customer_id):
+    # After commit, so a dashboard reading in between cannot cache the old numbers again
+    transaction.on_commit(lambda: cache.delete(customer_stats_key(customer_id)))
+
+
+def provider_stats_key(provider_id, day):
+    return f'washapp:provider-stats:{provider_id}:{day.isoformat()}'
+
+
+def provider_stats_queries(provider_id, day):
+    """The aggregate and today's-schedule queries behind a provider's stats.
+
+    Booking counts and the review average come from a single grouped query;
+    reviews join in through the one-to-one link so no booking is counted twice.
+    """
+    # Cached until the next booking change, so read from the primary rather than a lagging replica
+    bookings = Booking.objects.using(DEFAULT_DB_ALIAS).filter(service_provider_id=provider_id)
+    aggregates = dict(
+        total_bookings=Count('id'),
+        today_bookings=Count('id', filter=Q(booking_date=day)),
+        pending_bookings=Count('id', filter=Q(status='pending')),
+        completed_bookings=Count('id', filter=Q(status='completed')),
+        avg_rating=Avg('review__rating'),
+    )
+    today_schedule = (
+        bookings.select_related('service', 'customer')
+        .filter(booking_date=day, status__in=UPCOMING_STATUSES)
+        .order_by('booking_time')
+    )
+    return bookings, aggregates, today_schedule
+
+
+def provider_stats_result(stats, today_schedule):
+    stats['avg_rating'] = stats['avg_rating'] or 0.0
+    stats['today_schedule'] = list(today_schedule)
+    return stats
+
+
+def compute_provider_stats(provider_id, day):
+    """Dashboard numbers for one provider on one day"""
+    bookings, aggregates, today_schedule = provider_stats_queries(provider_id, day)
+    return provider_stats_result(bookings.aggregate(**aggregates), today_schedule)
+
+
+async def acompute_provider_stats(provider_id, day):
+    """compute_provider_stats through the async ORM, one query after the other"""
+    bookings, aggregates, today_schedule = provider_stats_queries(provider_id, day)
+    return provider_stats_result(await bookings.aaggregate(**aggregates), await alist(today_schedule))
+
+
+def provider_stats(provider_id, day=None):
+    """Cached dashboard numbers for one provider, keyed by provider and day.
+
+    Only cached with SHARED_CACHE, as the reminder scheduler and job
+    workers change bookings from processes of their own.
+    """
+    day = day or timezone.localdate()
+    if not getattr(settings, 'SHARED_CACHE', False):
+        return compute_provider_stats(provider_id, day)
+    key = provider_stats_key(provider_id, day)
+    stats = cache.get(key)
+    count_cache_lookup('provider_stats', stats is not None)
+    if stats is None:
+        stats = compute_provider_stats(provider_id, day)
+        cache.set(key, stats, PROVIDER_STATS_TIMEOUT)
+    return stats
+
+
+async def aprovider_stats(provider_id, day=None):
+    day = day or timezone.localdate()
+    if not getattr(settings, 'SHARED_CACHE', False):
+        return await acompute_provider_stats(provider_id, day)
+    key = provider_stats_key(provider_id, day)
+    stats = await cache.aget(key)
+    count_cache_lookup('provider_stats', stats is not None)
+    if stats is None:
+        stats = await acompute_provider_stats(provider_id, day)
+        await cache.aset(key, stats, PROVIDER_STATS_TIMEOUT)
+    return stats
+
+
+def invalidate_provider_stats(provider_id, day=None):
+    key = provider_stats_key(provider_id, day or timezone.localdate())
+    transaction.on_commit(lambda: cache.delete(key))
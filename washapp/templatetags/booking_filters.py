@@ -1,8 +1,22 @@
 from django import template
 
+from washapp.bookings import BOOKING_TABS
+
 register = template.Library()
 
 @register.filter
 def filter_by_status(bookings, statuses):
-    status_list = [s.strip() for s in statuses.split(",")]
+    """Bookings on a my_bookings tab, e.g. "upcoming", or with any of the comma-separated statuses.
+
+    Fetched lists such as a tab page are filtered in memory without a query;
+    querysets get a status filter.
+    """
+    if statuses in BOOKING_TABS:
+        status_list = BOOKING_TABS[statuses]
+        if status_list is None:
+            return bookings
+    else:
+        status_list = [s.strip() for s in statuses.split(",")]
+    if isinstance(bookings, (list, tuple)):
+        return [booking for booking in bookings if booking.status in status_list]
     return bookings.filter(status__in=status_list)
@@ -0,0 +1,28 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from washapp.images import srcsets
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, sizes='100vw', **attrs):
+    """A <picture> offering the WebP and resized derivatives of an image field.
+
+    Falls back to the original upload until its derivatives are ready.
+    Extra keyword arguments become attributes of the <img>, e.g.
+    {% responsive_image service.image sizes="33vw" alt=service.name class="card-img-top" %}
+    """
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    sets = srcsets(image)
+    if sets is None:
+        return format_html('<img src="{}"{}>', image.url, flatatt(attrs))
+    webp, fallback, src = sets
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        webp, sizes, src, fallback, sizes, flatatt(attrs),
+    )
@@ -1,3 +1,1752 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.utils import ConnectionHandler, load_backend
+from django.http import HttpResponse
+from django.core import mail
+from django.core.management import call_command
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import catalog as catalog_module, images, jobs, pagecache, replication
+from .bookings import BOOKING_TABS, BOOKINGS_PAGE_SIZE, booking_list, decode_cursor, encode_cursor
+from .catalog import bump_catalog_version, catalog
+from .checkout import CheckoutError, checkout
+from .exports import EXPORTS, export_rows
+from .instrumentation import reset_metrics
+from .models import *
+from .reminders import Scheduler
+from .replication import PIN_COOKIE, PrimaryReplicaRouter, ReplicaPinMiddleware, copy_database, sync_replicas
+from .rollups import admin_totals
+from .smtp_debug import DebuggingSMTPServer
+from .scheduling import SlotUnavailable, assign_providers, book_slot, free_providers, slot_mask
+from .seeding import seed
+from .stats import cache_counters, compute_customer_stats
+from .templatetags.booking_filters import filter_by_status
+from .uploads import BLOB_NAME, collect_garbage, image_uploads
+
+
+def create_catalog():
+    """One category, one service and one provider offering it"""
+    category = ServiceCategory.objects.create(name='Exterior')
+    service = Service.objects.create(
+        category=category, name='Basic Wash', description='Outside wash',
+        price=Decimal('20.00'), duration=30,
+    )
+    provider_user = User.objects.create_user(
+        username='provider', password='pass', user_type='service_provider'
+    )
+    provider = ServiceProvider.objects.create(
+        user=provider_user, company_name='Clean Cars', address='1 Main St',
+        phone='555-0100', email='provider@example.com',
+    )
+    provider.services.add(service)
+    return service, provider
+
+
+def seed_bookings(customer, service, provider, count):
+    """Bulk create bookings cycling through every status, reviewing completed ones"""
+    statuses = [status for status, _ in Booking.STATUS_CHOICES]
+    start = datetime.date(2025, 1, 1)
+    bookings = Booking.objects.bulk_create([
+        Booking(
+            customer=customer, service=service, service_provider=provider,
+            booking_date=start + datetime.timedelta(days=i % 365),
+            booking_time=datetime.time(8 + i % 10),
+            vehicle_type='Sedan', vehicle_number=f'ABC-{i}',
+            status=statuses[i % len(statuses)], total_amount=service.price,
+        )
+        for i in range(count)
+    ])
+    Review.objects.bulk_create([
+        Review(booking=booking, customer=customer, rating=5)
+        for booking in bookings if booking.status == 'completed'
+    ])
+    return bookings
+
+
+class MyBookingsQueryCountTests(TestCase):
+    # Session, user, provider lookup, tab counts and the active tab's page
+    QUERY_BUDGET = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service, cls.provider = create_catalog()
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.admin = User.objects.create_user(username='admin', password='pass', user_type='admin')
+        seed_bookings(cls.customer, cls.service, cls.provider, 300)
+
+    def assert_within_budget(self, user):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('my_bookings'))
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), self.QUERY_BUDGET)
+        return response
+
+    def test_customer_bookings_query_count_is_constant(self):
+        response = self.assert_within_budget(self.customer)
+        self.assertEqual(response.context['tab_counts']['all'], 300)
+        self.assertEqual(len(response.context['bookings']), BOOKINGS_PAGE_SIZE)
+
+    def test_provider_bookings_query_count_is_constant(self):
+        self.assert_within_budget(self.provider.user)
+
+    def test_admin_bookings_query_count_is_constant(self):
+        self.assert_within_budget(self.admin)
+
+
+class MyBookingsTabTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        service, provider = create_catalog()
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        seed_bookings(cls.customer, service, provider, 300)
+
+    def setUp(self):
+        self.client.force_login(self.customer)
+
+    def test_only_active_tab_is_rendered(self):
+        response = self.client.get(reverse('my_bookings'), {'tab': 'completed'})
+        self.assertEqual(response.context['active_tab'], 'completed')
+        self.assertTrue(all(b.status == 'completed' for b in response.context['bookings']))
+        self.assertEqual(response.context['tab_counts']['completed'], 60)
+
+    def test_cursor_walks_every_booking_of_a_tab_once(self):
+        url = reverse('my_bookings_tab', args=['upcoming'])
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(url, {'cursor': cursor} if cursor else {})
+            seen += [b.id for b in response.context['bookings']]
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                break
+        expected = Booking.objects.filter(
+            customer=self.customer, status__in=['pending', 'confirmed']
+        ).order_by('-booking_date', '-booking_time', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_deep_page_costs_the_same_as_first_page(self):
+        url = reverse('my_bookings_tab', args=['all'])
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(url)
+        for _ in range(5):
+            response = self.client.get(url, {'cursor': response.context['next_cursor']})
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get(url, {'cursor': response.context['next_cursor']})
+        self.assertEqual(len(first), len(deep))
+
+    def test_bad_tab_and_cursor_are_rejected(self):
+        self.assertEqual(self.client.get('/my-bookings/archived/').status_code, 404)
+        url = reverse('my_bookings_tab', args=['all'])
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 400)
+
+
+class ProviderAdminBookingPagesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        service, cls.provider = create_catalog()
+        customer = User.objects.create_user(username='customer', password='pass')
+        cls.admin = User.objects.create_user(username='admin', password='pass', user_type='admin')
+        seed_bookings(customer, service, cls.provider, 120)
+
+    def walk(self, user, tab, size):
+        self.client.force_login(user)
+        url = reverse('my_bookings_tab', args=[tab])
+        seen, params = [], {'page_size': size}
+        while True:
+            response = self.client.get(url, params)
+            self.assertLessEqual(len(response.context['bookings']), size)
+            seen += [b.id for b in response.context['bookings']]
+            if response.context['next_cursor'] is None:
+                return seen
+            params['cursor'] = response.context['next_cursor']
+
+    def test_provider_and_admin_tabs_page_through_every_booking_once(self):
+        for user in (self.provider.user, self.admin):
+            for tab, statuses in BOOKING_TABS.items():
+                with self.subTest(user=user.username, tab=tab):
+                    expected = Booking.objects.filter(status__in=statuses or [s for s, _ in Booking.STATUS_CHOICES])
+                    expected = expected.order_by('-booking_date', '-booking_time', '-id').values_list('id', flat=True)
+                    self.assertEqual(self.walk(user, tab, 7), list(expected))
+
+    def test_page_size_is_clamped(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('my_bookings'), {'page_size': 10})
+        self.assertEqual(len(response.context['bookings']), 10)
+        response = self.client.get(reverse('my_bookings'), {'page_size': 'lots'})
+        self.assertEqual(len(response.context['bookings']), BOOKINGS_PAGE_SIZE)
+        response = self.client.get(reverse('my_bookings'), {'page_size': 0})
+        self.assertEqual(len(response.context['bookings']), 1)
+
+    def test_cursor_is_stable_and_tamper_proof(self):
+        booking, other = Booking.objects.order_by('id')[:2]
+        self.assertEqual(encode_cursor(booking), encode_cursor(Booking.objects.get(pk=booking.pk)))
+        self.assertEqual(decode_cursor(encode_cursor(booking))[2], booking.pk)
+        # Another booking's position under this booking's signature
+        signature = encode_cursor(booking).rsplit(':', 1)[1]
+        forged = encode_cursor(other).rsplit(':', 1)[0] + ':' + signature
+        with self.assertRaises(ValueError):
+            decode_cursor(forged)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('my_bookings_tab', args=['all']), {'cursor': forged})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SHARED_CACHE=True)
+class CustomerDashboardStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.service, cls.provider = create_catalog()
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.bookings = seed_bookings(cls.customer, cls.service, cls.provider, 50)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.customer)
+
+    def test_stats_come_from_one_aggregate(self):
+        stats = compute_customer_stats(self.customer.id)
+        self.assertEqual(stats['total_bookings'], 50)
+        self.assertEqual(stats['upcoming_bookings'], 20)
+        self.assertEqual(stats['completed_bookings'], 10)
+        self.assertEqual(stats['total_spent'], Decimal('200.00'))
+        self.assertIn(stats['next_booking'].status, ('pending', 'confirmed'))
+
+    def test_cached_dashboard_skips_booking_queries(self):
+        self.client.get(reverse('dashboard'))
+        # Only the session is loaded on a cache hit, the user comes from the cache too
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['total_bookings'], 50)
+
+    def test_booking_save_and_delete_invalidate_stats_on_commit(self):
+        self.client.get(reverse('dashboard'))
+        booking = Booking.objects.filter(customer=self.customer, status='pending').first()
+        booking.status = 'completed'
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.save()
+            # Until the commit a dashboard request still gets the cached numbers
+            response = self.client.get(reverse('dashboard'))
+            self.assertEqual(response.context['completed_bookings'], 10)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['completed_bookings'], 11)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['total_bookings'], 49)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_per_process_cache_is_not_used(self):
+        self.client.get(reverse('dashboard'))
+        # Session, user and the three stats queries on every request
+        with self.assertNumQueries(5):
+            self.client.get(reverse('dashboard'))
+        Booking.objects.filter(customer=self.customer, status='pending').update(status='cancelled')
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['upcoming_bookings'], 10)
+
+
+@override_settings(SHARED_CACHE=True)
+class ProviderDashboardStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.service, cls.provider = create_catalog()
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        seed_bookings(cls.customer, cls.service, cls.provider, 50)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.provider.user)
+
+    def test_cached_dashboard_only_loads_the_session(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['total_bookings'], 50)
+        self.assertEqual(response.context['avg_rating'], 5)
+        misses = cache_counters().get('provider_stats_misses', 0)
+        hits = cache_counters().get('provider_stats_hits', 0)
+        # The user and its provider id come from the cache too
+        with self.assertNumQueries(1):
+            self.client.get(reverse('dashboard'))
+        self.assertEqual(cache_counters()['provider_stats_hits'], hits + 1)
+        self.assertEqual(cache_counters()['provider_stats_misses'], misses)
+
+    def test_booking_and_review_changes_invalidate_provider_stats(self):
+        self.client.get(reverse('dashboard'))
+        booking = Booking.objects.filter(service_provider=self.provider, status='pending').first()
+        booking.status = 'completed'
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.save()
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['pending_bookings'], 9)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(booking=booking, customer=self.customer, rating=1)
+        response = self.client.get(reverse('dashboard'))
+        self.assertLess(response.context['avg_rating'], 5)
+
+    def test_reassigning_a_booking_invalidates_the_previous_provider(self):
+        self.client.get(reverse('dashboard'))
+        other_user = User.objects.create_user(username='other', password='pass', user_type='service_provider')
+        other = ServiceProvider.objects.create(
+            user=other_user, company_name='Other', address='', phone='', email='other@example.com',
+        )
+        booking = Booking.objects.filter(service_provider=self.provider).first()
+        booking.service_provider = other
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.save()
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['total_bookings'], 49)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_changes_from_other_processes_show_without_a_shared_cache(self):
+        self.client.get(reverse('dashboard'))
+        # As reminders.expire() or a job worker would, with no signal reaching this process
+        Booking.objects.filter(service_provider=self.provider, status='pending').update(status='cancelled')
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['pending_bookings'], 0)
+
+    def test_cache_metrics_are_admin_only(self):
+        self.assertEqual(self.client.get(reverse('cache_metrics')).status_code, 302)
+        admin = User.objects.create_user(username='admin', password='pass', user_type='admin')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('cache_metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.json(), dict)
+
+
+class DailyStatsRollupTests(TestCase):
+    def setUp(self):
+        self.service, self.provider = create_catalog()
+        self.customer = User.objects.create_user(username='customer', password='pass')
+
+    def book(self, status='pending'):
+        return Booking.objects.create(
+            customer=self.customer, service=self.service, service_provider=self.provider,
+            booking_date=datetime.date(2025, 1, 1), booking_time=datetime.time(9),
+            vehicle_type='Sedan', vehicle_number='ABC-1',
+            status=status, total_amount=self.service.price,
+        )
+
+    def test_status_changes_update_rollups_incrementally(self):
+        first, second = self.book(), self.book()
+        booking = Booking.objects.get(pk=first.pk)
+        booking.status = 'completed'
+        booking.save()
+        second.delete()
+
+        totals = admin_totals()
+        self.assertEqual(totals['total_bookings'], 1)
+        self.assertEqual(totals['pending_bookings'], 0)
+        self.assertEqual(totals['completed_bookings'], 1)
+        self.assertEqual(totals['total_revenue'], Decimal('20.00'))
+        self.assertEqual(totals['total_customers'], 1)
+        self.assertEqual(totals['total_providers'], 1)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        seed_bookings(self.customer, self.service, self.provider, 40)
+        self.book('completed')
+        call_command('rebuild_daily_stats', batch_size=7, stdout=StringIO())
+
+        totals = admin_totals()
+        self.assertEqual(totals['total_bookings'], Booking.objects.count())
+        self.assertEqual(totals['pending_bookings'], Booking.objects.filter(status='pending').count())
+        self.assertEqual(totals['total_revenue'], Decimal('180.00'))
+        self.assertEqual(totals['total_users'], User.objects.count())
+
+        booking = Booking.objects.filter(status='pending').first()
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertEqual(admin_totals()['cancelled_bookings'], 9)
+
+
+class SlotAllocationTests(TestCase):
+    def setUp(self):
+        self.service, self.first = create_catalog()
+        second_user = User.objects.create_user(
+            username='provider2', password='pass', user_type='service_provider'
+        )
+        self.second = ServiceProvider.objects.create(
+            user=second_user, company_name='Shiny', address='2 Main St',
+            phone='555-0101', email='shiny@example.com',
+        )
+        self.second.services.add(self.service)
+        self.customer = User.objects.create_user(username='customer', password='pass')
+        self.day = datetime.date(2025, 6, 1)
+
+    def book(self, hour, minute=0):
+        return book_slot(
+            self.service, self.day, datetime.time(hour, minute),
+            customer=self.customer, vehicle_type='Sedan', vehicle_number='ABC-1',
+            total_amount=self.service.price,
+        )
+
+    def test_slot_mask_covers_the_service_duration(self):
+        self.assertEqual(slot_mask(datetime.time(0, 0), 30), 0b11)
+        self.assertEqual(slot_mask(datetime.time(0, 20), 10), 0b10)
+        self.assertEqual(slot_mask(datetime.time(23, 45), 60), 1 << 95)
+
+    def test_overlapping_bookings_go_to_different_providers(self):
+        first = self.book(9)
+        second = self.book(9, 15)
+        self.assertNotEqual(first.service_provider_id, second.service_provider_id)
+        with self.assertRaises(SlotUnavailable):
+            self.book(9, 0)
+        # Back-to-back with the first booking is fine
+        self.assertIsNotNone(self.book(9, 30))
+
+    def test_least_loaded_provider_is_picked(self):
+        self.book(8)
+        self.book(12)
+        third = self.book(15)
+        loads = Counter(Booking.objects.values_list('service_provider_id', flat=True))
+        self.assertEqual(sorted(loads.values()), [1, 2])
+        self.assertIsNotNone(third)
+
+    def test_cancelling_releases_the_slot(self):
+        self.book(10)
+        booking = self.book(10)
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertIsNotNone(self.book(10))
+
+    def slots_of(self, booking):
+        return list(ProviderSlot.objects.filter(booking=booking).values_list('service_provider_id', 'date', 'slot'))
+
+    def test_reactivating_a_cancelled_booking_takes_its_slots_back(self):
+        booking = self.book(10)
+        booking.status = 'cancelled'
+        booking.save()
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.status = 'confirmed'
+        booking.save()
+        provider = booking.service_provider_id
+        self.assertEqual(self.slots_of(booking), [(provider, self.day, 40), (provider, self.day, 41)])
+
+        # Unless someone else booked the time in between
+        booking.status = 'cancelled'
+        booking.save()
+        self.book(10)
+        self.book(10)
+        booking.status = 'pending'
+        with self.assertRaises(IntegrityError):
+            booking.save()
+        self.assertEqual(Booking.objects.get(pk=booking.pk).status, 'cancelled')
+        self.assertEqual(self.slots_of(booking), [])
+        self.assertEqual(DailyStats.objects.get().pending_bookings, 2)
+
+    def test_rescheduling_moves_the_slots(self):
+        booking = Booking.objects.get(pk=self.book(10).pk)
+        booking.booking_date = self.day + datetime.timedelta(days=1)
+        booking.booking_time = datetime.time(12)
+        booking.save()
+        provider = booking.service_provider_id
+        self.assertEqual(self.slots_of(booking), [(provider, booking.booking_date, 48), (provider, booking.booking_date, 49)])
+        # The old time is free for both providers again
+        self.assertNotEqual(self.book(10).service_provider_id, self.book(10).service_provider_id)
+
+        booking.service_provider = self.first if provider == self.second.id else self.second
+        booking.save()
+        self.assertEqual(self.slots_of(booking)[0][0], booking.service_provider_id)
+
+    def test_rescheduling_into_a_taken_slot_changes_nothing(self):
+        booking = Booking.objects.get(pk=self.book(10).pk)
+        self.book(12)
+        self.book(12)
+        slots = self.slots_of(booking)
+        booking.booking_time = datetime.time(12)
+        with self.assertRaises(IntegrityError):
+            booking.save()
+        self.assertEqual(Booking.objects.get(pk=booking.pk).booking_time, datetime.time(10))
+        self.assertEqual(self.slots_of(booking), slots)
+
+        # The instance still diffs against what is stored
+        booking.booking_time = datetime.time(14)
+        booking.save()
+        self.assertEqual([slot for _, _, slot in self.slots_of(booking)], [56, 57])
+
+    def test_stale_index_cannot_double_book(self):
+        taken = self.book(11)
+        # Pretend another request reserved the slot after the index was read
+        with mock.patch('washapp.scheduling.occupancy_index', lambda ids, day: dict.fromkeys(ids, 0)):
+            booking = self.book(11)
+        self.assertNotEqual(booking.service_provider_id, taken.service_provider_id)
+        self.assertEqual(ProviderSlot.objects.filter(date=self.day, slot=44).count(), 2)
+
+    def test_book_service_view_reports_a_full_slot(self):
+        self.client.force_login(self.customer)
+        data = {
+            'service_id': self.service.id, 'booking_date': '2025-06-01', 'booking_time': '14:00',
+            'vehicle_type': 'SUV', 'vehicle_number': 'XYZ-9',
+        }
+        for _ in range(2):
+            self.assertRedirects(self.client.post(reverse('book_service'), data), reverse('my_bookings'))
+        response = self.client.post(reverse('book_service'), data)
+        self.assertRedirects(response, reverse('book_service'), fetch_redirect_response=False)
+        self.assertEqual(Booking.objects.count(), 2)
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN every query the booking views issue and reject full table scans"""
+
+    # Tables that grow with traffic; the catalog and rollup tables stay small
+    WATCHED_TABLES = {'washapp_booking', 'washapp_review', 'washapp_providerslot', 'washapp_payment'}
+    SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service, cls.provider = create_catalog()
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.admin = User.objects.create_user(username='admin', password='pass', user_type='admin')
+        seed_bookings(cls.customer, cls.service, cls.provider, 100)
+
+    def setUp(self):
+        cache.clear()
+
+    def captured_selects(self, user):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('dashboard'))
+            self.client.get(reverse('my_bookings'))
+            for tab in ('upcoming', 'completed', 'cancelled'):
+                response = self.client.get(reverse('my_bookings_tab', args=[tab]))
+                if response.context['next_cursor']:
+                    self.client.get(
+                        reverse('my_bookings_tab', args=[tab]),
+                        {'cursor': response.context['next_cursor']},
+                    )
+            self.client.post(reverse('book_service'), {
+                'service_id': self.service.id, 'booking_date': '2025-03-01',
+                'booking_time': '10:00', 'vehicle_type': 'SUV', 'vehicle_number': 'XYZ-9',
+            })
+        return [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            details = [row[-1] for row in cursor.fetchall()]
+        scans = []
+        for detail in details:
+            match = self.SCAN.match(detail)
+            if not match or match.group(1) not in self.WATCHED_TABLES:
+                continue
+            # An ordered index walk cut short by LIMIT is fine, anything else reads every row
+            if 'USING' in match.group(2) and ' LIMIT ' in sql:
+                continue
+            scans.append(detail)
+        return scans
+
+    def assert_no_full_scans(self, user):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on SQLite only')
+        for sql in self.captured_selects(user):
+            with self.subTest(sql=sql[:120]):
+                self.assertEqual(self.full_scans(sql), [])
+
+    def test_customer_queries_use_indexes(self):
+        self.assert_no_full_scans(self.customer)
+
+    def test_provider_queries_use_indexes(self):
+        self.assert_no_full_scans(self.provider.user)
+
+    def test_admin_queries_use_indexes(self):
+        self.assert_no_full_scans(self.admin)
+
+    def test_reminder_scheduler_queries_use_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on SQLite only')
+        with CaptureQueriesContext(connection) as queries:
+            scheduler = Scheduler()
+            scheduler.start()
+            scheduler.tick(timezone.now() + datetime.timedelta(days=3))
+        for sql in [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]:
+            with self.subTest(sql=sql[:120]):
+                self.assertEqual(self.full_scans(sql), [])
+
+
+class SeedDataTests(TestCase):
+    def test_seed_creates_consistent_dataset(self):
+        created = seed(users=30, providers=3, bookings=500, batch_size=64, random_seed=1)
+        self.assertEqual(Booking.objects.count(), 500)
+        self.assertEqual(created['bookings'], 500)
+        self.assertEqual(User.objects.filter(user_type='customer').count(), 30)
+        self.assertEqual(Review.objects.exclude(booking__status='completed').count(), 0)
+        self.assertEqual(Payment.objects.count(), created['payments'])
+        # Every booking goes to a provider offering its service
+        self.assertFalse(Booking.objects.exclude(service__serviceprovider=models.F('service_provider')).exists())
+        self.assertEqual(admin_totals()['total_bookings'], 500)
+
+
+class BookingFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        service, provider = create_catalog()
+        customer = User.objects.create_user(username='customer', password='pass')
+        seed_bookings(customer, service, provider, 20)
+
+    def test_filter_walks_fetched_lists_without_queries(self):
+        bookings = list(Booking.objects.order_by('-booking_date'))
+        with self.assertNumQueries(0):
+            upcoming = filter_by_status(bookings, 'pending, confirmed')
+            self.assertEqual(filter_by_status(bookings, 'upcoming'), upcoming)
+            self.assertIs(filter_by_status(bookings, 'all'), bookings)
+        self.assertEqual(upcoming, [b for b in bookings if b.status in ('pending', 'confirmed')])
+
+    def test_filter_still_accepts_querysets(self):
+        cancelled = filter_by_status(Booking.objects.all(), 'cancelled')
+        self.assertEqual(cancelled.count(), 4)
+
+
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        service, provider = create_catalog()
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        seed_bookings(cls.customer, service, provider, 5)
+
+    def setUp(self):
+        reset_metrics()
+        self.client.force_login(self.customer)
+
+    def test_server_timing_header_reports_queries_and_durations(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('my_bookings'))
+        timing = response['Server-Timing']
+        for metric in ('total;dur=', 'view;dur=', 'db;dur=', 'tpl;dur='):
+            self.assertIn(metric, timing)
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+
+    def test_metrics_are_admin_only_prometheus_histograms(self):
+        self.client.get(reverse('my_bookings'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+
+        admin = User.objects.create_user(username='admin', password='pass', user_type='admin')
+        self.client.force_login(admin)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE washapp_request_duration_seconds histogram', body)
+        self.assertIn('washapp_request_duration_seconds_count{view="my_bookings"} 1', body)
+        self.assertIn('washapp_db_queries_bucket{view="my_bookings",le="+Inf"} 1', body)
+        self.assertIn('washapp_cache_lookups_total', body)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        service, provider = create_catalog()
+        customer = User.objects.create_user(username='customer', password='pass')
+        cls.admin = User.objects.create_user(username='admin', password='pass', user_type='admin')
+        bookings = seed_bookings(customer, service, provider, 40)
+        # Same-day, same-time bookings so batches have to break ties on id
+        bookings += seed_bookings(customer, service, provider, 20)
+        Payment.objects.bulk_create([
+            Payment(booking=b, amount=b.total_amount, payment_method='card', transaction_id=f'TX-{b.id}')
+            for b in bookings
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_batches_visit_every_row_once_in_order(self):
+        for name, export in EXPORTS.items():
+            with self.subTest(export=name):
+                rows = list(export_rows(export, export.queryset, batch_size=7))
+                expected = export.queryset.order_by(*export.order).values_list('id', flat=True)
+                self.assertEqual([row['id'] for row in rows], list(expected))
+
+    def test_csv_export_streams_filtered_bookings(self):
+        response = self.client.get(reverse('export_data', args=['bookings']), {
+            'start': '2025-01-05', 'end': '2025-01-20', 'status': 'pending,completed',
+        })
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(','), EXPORTS['bookings'].fields)
+        expected = Booking.objects.filter(
+            booking_date__range=('2025-01-05', '2025-01-20'), status__in=['pending', 'completed'],
+        )
+        self.assertEqual(len(lines) - 1, expected.count())
+
+    def test_ndjson_export_of_payments(self):
+        response = self.client.get(reverse('export_data', args=['payments']), {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 60)
+        self.assertEqual(set(rows[0]), set(EXPORTS['payments'].fields))
+
+    def test_bad_requests_and_non_admins_are_rejected(self):
+        url = reverse('export_data', args=['bookings'])
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': '2025-13-01'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'end': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_data', args=['users'])).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+
+class ProviderRatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.service, cls.provider = create_catalog()
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.bookings = Booking.objects.bulk_create([
+            Booking(
+                customer=cls.customer, service=cls.service, service_provider=cls.provider,
+                booking_date=datetime.date(2025, 1, i + 1), booking_time=datetime.time(10),
+                vehicle_type='Sedan', vehicle_number=f'R-{i}', status='completed',
+                total_amount=cls.service.price,
+            )
+            for i in range(3)
+        ])
+
+    def assert_rating(self, rating_sum, rating_count, rating):
+        self.provider.refresh_from_db()
+        self.assertEqual((self.provider.rating_sum, self.provider.rating_count), (rating_sum, rating_count))
+        self.assertEqual(self.provider.rating, Decimal(rating))
+
+    def review(self, booking, rating):
+        return Review.objects.update_or_create(
+            booking=booking, defaults={'customer': self.customer, 'rating': rating},
+        )[0]
+
+    def test_reviews_update_running_totals(self):
+        self.review(self.bookings[0], '5')
+        self.review(self.bookings[1], '2')
+        self.assert_rating(7, 2, '3.50')
+
+        # Editing through update_or_create applies only the difference
+        self.review(self.bookings[1], '4')
+        self.assert_rating(9, 2, '4.50')
+
+        Review.objects.get(booking=self.bookings[0]).delete()
+        self.assert_rating(4, 1, '4.00')
+        Review.objects.all().delete()
+        self.assert_rating(0, 0, '0.00')
+
+    def test_new_review_does_not_aggregate_history(self):
+        self.review(self.bookings[0], '5')
+        with CaptureQueriesContext(connection) as queries:
+            self.review(self.bookings[1], '3')
+        self.assertFalse(any('AVG(' in q['sql'] or 'SUM(' in q['sql'] for q in queries.captured_queries))
+
+    def test_reconcile_fixes_drift(self):
+        self.review(self.bookings[0], '5')
+        Review.objects.bulk_create([Review(booking=self.bookings[1], customer=self.customer, rating=1)])
+        ServiceProvider.objects.filter(pk=self.provider.pk).update(rating_count=7)
+
+        out = StringIO()
+        call_command('reconcile_ratings', stdout=out)
+        self.assertIn('1 providers corrected', out.getvalue())
+        self.assert_rating(6, 2, '3.00')
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.service, cls.provider = create_catalog()
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+
+    def setUp(self):
+        cache.clear()
+        catalog_module._local = None
+        self.client.force_login(self.customer)
+
+    def test_catalog_views_share_one_snapshot(self):
+        self.client.get(reverse('services_list'))
+        # Session and user only, for every catalog page
+        for name in ('home', 'services_list', 'book_service'):
+            with self.subTest(view=name), self.assertNumQueries(2):
+                response = self.client.get(reverse(name))
+            self.assertEqual([s.name for s in response.context['services']], ['Basic Wash'])
+
+    def test_changes_bump_the_version_for_every_worker(self):
+        self.assertEqual(len(catalog().services), 1)
+        version = catalog().version
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.create(
+                category=self.service.category, name='Foam Wash', description='Foam',
+                price=Decimal('25.00'), duration=30,
+            )
+        self.assertGreater(catalog().version, version)
+        self.assertEqual(len(catalog().services), 2)
+
+    def test_other_workers_pick_up_a_new_version_from_the_cache(self):
+        catalog()
+        # Another worker renames the category and bumps the shared version
+        with mock.patch.object(catalog_module, '_local', None):
+            with self.captureOnCommitCallbacks(execute=True):
+                ServiceCategory.objects.filter(pk=self.service.category_id).update(name='Outside')
+                bump_catalog_version()
+        # Served from this worker's copy until the check interval passes
+        self.assertEqual(catalog().categories[0].name, 'Exterior')
+        with mock.patch.object(catalog_module.time, 'monotonic', return_value=time.monotonic() + 5):
+            self.assertEqual(catalog().categories[0].name, 'Outside')
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalog()
+        cls.alice = User.objects.create_user(username='alice', password='pass')
+        cls.bob = User.objects.create_user(username='bob', password='pass')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_hits_skip_the_database(self):
+        first = self.client.get(reverse('about'))
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('about'))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertFalse(second['ETag'].startswith('W/'))
+
+    def test_matching_etag_gets_not_modified(self):
+        etag = self.client.get(reverse('home'))['ETag']
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_users_of_one_type_share_the_page_but_keep_their_navbar(self):
+        self.client.force_login(self.alice)
+        alice_page = self.client.get(reverse('about'))
+        self.client.force_login(self.bob)
+        with mock.patch('washapp.pagecache.render_to_string', wraps=pagecache.render_to_string) as rendered:
+            bob_page = self.client.get(reverse('about'))
+        # Only the navbar is rendered for bob, the page comes from alice's copy
+        self.assertEqual([c.args[0] for c in rendered.call_args_list], ['navbar.html'])
+        self.assertContains(alice_page, 'alice')
+        self.assertContains(bob_page, 'bob')
+        self.assertNotContains(bob_page, 'alice')
+        self.assertNotEqual(alice_page['ETag'], bob_page['ETag'])
+
+    def test_navbar_fragment_is_cached(self):
+        self.client.force_login(self.alice)
+        self.client.get(reverse('services_list'))
+        self.assertIsNotNone(cache.get(make_template_fragment_key('navbar', ['services_list', 'alice'])))
+
+    def test_csrf_token_is_filled_in_per_visitor(self):
+        csrf_client = Client(enforce_csrf_checks=True)
+        response = csrf_client.get(reverse('contact'))
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertNotContains(response, pagecache.CSRF_HOLE)
+        token = re.search(rb'name="csrfmiddlewaretoken" value="([^"]+)"', response.content).group(1)
+        # The filled-in token passes the CSRF check
+        response = csrf_client.post(reverse('contact'), {'csrfmiddlewaretoken': token.decode()})
+        self.assertNotEqual(response.status_code, 403)
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        service, cls.provider = create_catalog()
+        cls.customer = User.objects.create_user(username='customer', password='pass')
+        cls.admin = User.objects.create_user(username='admin', password='pass', user_type='admin')
+        seed_bookings(cls.customer, service, cls.provider, 60)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_both(self, user, sync_name, async_name, params=None):
+        """The same page through the sync view and, with a cold cache, the async one"""
+        self.client.force_login(user)
+        self.async_client.cookies = self.client.cookies
+        sync_response = self.client.get(reverse(sync_name), params or {})
+        cache.clear()
+
+        async def fetch():
+            return await self.async_client.get(reverse(async_name), params or {})
+        async_response = async_to_sync(fetch)()
+        return sync_response, async_response
+
+    def assert_same_context(self, sync_response, async_response, keys):
+        self.assertEqual(async_response.status_code, 200)
+        for key in keys:
+            with self.subTest(key=key):
+                self.assertEqual(sync_response.context[key], async_response.context[key])
+
+    def test_async_dashboards_match_sync(self):
+        cases = {
+            self.customer: ['total_bookings', 'upcoming_bookings', 'total_spent', 'next_booking', 'recent_bookings'],
+            self.provider.user: ['total_bookings', 'pending_bookings', 'avg_rating', 'today_schedule'],
+            self.admin: ['total_bookings', 'total_users', 'total_revenue', 'recent_bookings'],
+        }
+        for user, keys in cases.items():
+            sync_response, async_response = self.get_both(user, 'dashboard', 'dashboard_async')
+            self.assert_same_context(sync_response, async_response, keys)
+
+    def test_async_my_bookings_matches_sync(self):
+        for user in (self.customer, self.provider.user, self.admin):
+            sync_response, async_response = self.get_both(
+                user, 'my_bookings', 'my_bookings_async', {'tab': 'completed', 'page_size': 5},
+            )
+            self.assert_same_context(sync_response, async_response, ['tab_counts', 'bookings', 'next_cursor'])
+
+    async def test_async_views_require_login(self):
+        response = await self.async_client.get(reverse('dashboard_async'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.LOGIN_URL, response.url)
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    """Concurrent read-then-write transactions on a scratch database file"""
+
+    THREADS = 8
+    TRANSACTIONS = 15
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'writes.sqlite3')
+
+    def wrapper(self, engine):
+        handler = ConnectionHandler({'default': {'ENGINE': engine, 'NAME': self.path}})
+        return load_backend(engine).DatabaseWrapper(handler.settings['default'], alias='bench')
+
+    def run_writers(self, engine):
+        """Run the writers against a fresh file, returning (commits, lock errors)"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        setup = self.wrapper(engine)
+        setup.cursor().execute('CREATE TABLE counter (n INTEGER)')
+        setup.close()
+        results = Counter()
+
+        def writer():
+            db = self.wrapper(engine)
+            for _ in range(self.TRANSACTIONS):
+                try:
+                    # The read-then-write shape of book_slot
+                    db._start_transaction_under_autocommit()
+                    with db.cursor() as cursor:
+                        cursor.execute('SELECT COUNT(*) FROM counter')
+                        time.sleep(0.001)
+                        cursor.execute('INSERT INTO counter VALUES (1)')
+                        cursor.execute('COMMIT')
+                    results['commits'] += 1
+                except OperationalError:
+                    db.cursor().execute('ROLLBACK')
+                    results['errors'] += 1
+            db.close()
+
+        threads = [threading.Thread(target=writer) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results['commits'], results['errors']
+
+    def test_pragmas_are_applied(self):
+        db = self.wrapper('washapp.backends.sqlite3')
+        with db.cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)
+        db.close()
+
+    def test_concurrent_writers_queue_instead_of_failing(self):
+        commits, errors = self.run_writers('washapp.backends.sqlite3')
+        self.assertEqual(errors, 0)
+        self.assertEqual(commits, self.THREADS * self.TRANSACTIONS)
+
+
+@mock.patch('washapp.replication.replicas', return_value=['replica'])
+class ReplicaRoutingTests(SimpleTestCase):
+    router = PrimaryReplicaRouter()
+
+    def handle(self, cookies=None, write=False, method='get', models=(Service,)):
+        """Run a request through ReplicaPinMiddleware, returning (response, read alias of each model)"""
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        seen = {}
+
+        def view(request):
+            if write:
+                self.router.db_for_write(Booking)
+            seen['read'] = [self.router.db_for_read(model) for model in models]
+            return HttpResponse()
+
+        response = ReplicaPinMiddleware(view)(request)
+        return response, seen['read'][0] if len(models) == 1 else seen['read']
+
+    def test_catalog_and_booking_reads_of_safe_requests_go_to_the_replica(self, replicas):
+        _, reads = self.handle(models=(Service, ServiceCategory, Booking, User))
+        self.assertEqual(reads, ['replica', 'replica', 'replica', 'default'])
+        self.assertEqual(self.router.db_for_write(Booking), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'washapp'))
+
+    def test_posts_and_reads_outside_requests_stay_on_the_primary(self, replicas):
+        self.assertEqual(self.handle(method='post')[1], 'default')
+        # Management commands and job workers
+        self.assertEqual(self.router.db_for_read(Booking), 'default')
+
+    def test_write_pins_the_rest_of_the_request_and_the_visitor(self, replicas):
+        response, read = self.handle()
+        self.assertEqual(read, 'replica')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        response, read = self.handle(write=True)
+        self.assertEqual(read, 'default')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        # The next request, e.g. following the redirect after booking
+        response, read = self.handle(cookies={PIN_COOKIE: '1'})
+        self.assertEqual(read, 'default')
+
+    def test_no_synced_replica_falls_back_to_primary(self, replicas):
+        replicas.return_value = []
+        self.assertEqual(self.handle(models=(Booking,))[1], 'default')
+
+
+class LaggingReplicaTests(TransactionTestCase):
+    """A replica file that really is behind the primary, not the test mirror"""
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        replica = connections['replica']
+        replica.close()
+        name = mock.patch.dict(replica.settings_dict, {'NAME': os.path.join(directory.name, 'replica.sqlite3')})
+        name.start()
+        self.addCleanup(name.stop)
+        self.addCleanup(replica.close)
+
+        service, provider = create_catalog()
+        customer = User.objects.create(username='customer')
+        self.booking = Booking.objects.create(
+            customer=customer, service=service, service_provider=provider,
+            booking_date=datetime.date(2030, 1, 1), booking_time=datetime.time(9),
+            vehicle_type='Sedan', vehicle_number='LAG-1', total_amount=service.price,
+        )
+        self.assertEqual(sync_replicas(), ['replica'])
+        Booking.objects.filter(pk=self.booking.pk).update(status='confirmed')
+
+    def status_read_by(self, method):
+        seen = {}
+
+        def view(request):
+            seen['status'] = Booking.objects.get(pk=self.booking.pk).status
+            return HttpResponse()
+
+        ReplicaPinMiddleware(view)(getattr(RequestFactory(), method)('/'))
+        return seen['status']
+
+    def test_only_safe_requests_read_the_lagging_replica(self):
+        self.assertEqual(Booking.objects.using('replica').get(pk=self.booking.pk).status, 'pending')
+        self.assertEqual(self.status_read_by('get'), 'pending')
+        self.assertEqual(self.status_read_by('post'), 'confirmed')
+        # Outside a request, as in run_jobs or run_scheduler
+        self.assertEqual(Booking.objects.get(pk=self.booking.pk).status, 'confirmed')
+
+    def test_scheduler_reads_the_primary_even_inside_a_safe_request(self):
+        token = replication._current.set(replication.ReplicaPin())
+        self.addCleanup(replication._current.reset, token)
+        # The slot has started: pending on the replica, but confirmed on the primary
+        now = timezone.make_aware(datetime.datetime(2030, 1, 1, 9, 1))
+        scheduler = Scheduler()
+        scheduler.start(now)
+        self.assertEqual(scheduler.tick(now), 0)
+        self.assertIsNone(scheduler.seconds_until_next(now))
+
+    def test_provider_assignment_sees_bookings_the_replica_has_not(self):
+        Booking.objects.create(
+            customer=self.booking.customer, service=self.booking.service,
+            service_provider=self.booking.service_provider,
+            booking_date=datetime.date(2030, 1, 1), booking_time=datetime.time(11),
+            vehicle_type='Sedan', vehicle_number='LAG-3', total_amount=self.booking.total_amount,
+        )
+        token = replication._current.set(replication.ReplicaPin())
+        self.addCleanup(replication._current.reset, token)
+        service = self.booking.service
+        self.assertEqual(free_providers(service, datetime.date(2030, 1, 1), datetime.time(11)), [])
+        with self.assertRaises(SlotUnavailable):
+            assign_providers([service], datetime.date(2030, 1, 1), datetime.time(11))
+
+    @override_settings(JOBS_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_job_worker_reads_bookings_the_replica_has_not_seen(self):
+        customer = User.objects.create(username='late', email='late@example.com')
+        booking = Booking.objects.create(
+            customer=customer, service=self.booking.service, service_provider=self.booking.service_provider,
+            booking_date=datetime.date(2030, 1, 2), booking_time=datetime.time(9),
+            vehicle_type='Sedan', vehicle_number='LAG-2', total_amount=self.booking.total_amount,
+        )
+        jobs.enqueue('booking_confirmation', {'booking_ids': [booking.id]})
+        token = replication._current.set(replication.ReplicaPin())
+        self.addCleanup(replication._current.reset, token)
+        jobs.work(threads=0, once=True)
+        self.assertEqual([message.to for message in mail.outbox], [['late@example.com']])
+
+
+class ReplicaSyncTests(TestCase):
+    def test_reads_inside_a_transaction_stay_on_the_primary(self):
+        with mock.patch('washapp.replication.replicas', return_value=['replica']):
+            self.assertEqual(PrimaryReplicaRouter().db_for_read(Booking), 'default')
+
+    def test_test_mirror_is_not_synced_onto_itself(self):
+        self.assertEqual(sync_replicas(), [])
+
+    def test_copy_database_refreshes_open_readers(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        primary = sqlite3.connect(os.path.join(directory.name, 'primary.sqlite3'))
+        primary.execute('PRAGMA journal_mode = WAL')
+        primary.execute('CREATE TABLE booking (id INTEGER PRIMARY KEY)')
+        primary.execute('INSERT INTO booking VALUES (1)')
+        primary.commit()
+
+        replica_path = os.path.join(directory.name, 'replica.sqlite3')
+        target = sqlite3.connect(replica_path)
+        copy_database(primary, target)
+        reader = sqlite3.connect(replica_path)
+        self.assertEqual(reader.execute('SELECT COUNT(*) FROM booking').fetchone()[0], 1)
+
+        primary.execute('INSERT INTO booking VALUES (2)')
+        primary.commit()
+        copy_database(primary, target)
+        self.assertEqual(reader.execute('SELECT COUNT(*) FROM booking').fetchone()[0], 2)
+        for db in (reader, target, primary):
+            db.close()
+
+
+def image_upload(name, size, mode='RGB'):
+    buffer = BytesIO()
+    Image.new(mode, size, 'navy').save(buffer, 'PNG' if mode == 'RGBA' else 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name, MEDIA_URL='/media/', IMAGE_DERIVATIVE_WORKERS=0)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.service, _ = create_catalog()
+
+    def upload(self, size, mode='RGB'):
+        self.service.image = image_upload('wash.png' if mode == 'RGBA' else 'wash.jpg', size, mode)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.save()
+        return self.service.image.name
+
+    def render(self):
+        return Template(
+            '{% load images %}{% responsive_image service.image sizes="33vw" alt=service.name %}'
+        ).render(Context({'service': self.service}))
+
+    def test_upload_gets_webp_and_resized_copies(self):
+        name = self.upload((1200, 800))
+        self.assertEqual(images.manifest_of(name), {'widths': [320, 640, 960], 'fallback': 'jpg'})
+        with Image.open(images.default_storage.path(images.derivative_name(name, 640, 'webp'))) as webp:
+            self.assertEqual((webp.format, webp.size), ('WEBP', (640, 427)))
+        with Image.open(images.default_storage.path(images.derivative_name(name, 320, 'jpg'))) as jpeg:
+            self.assertEqual(jpeg.size, (320, 213))
+
+    def test_small_and_transparent_images_are_not_upscaled(self):
+        name = self.upload((200, 100), mode='RGBA')
+        self.assertEqual(images.manifest_of(name), {'widths': [200], 'fallback': 'png'})
+
+    def test_srcset_uses_deterministic_urls(self):
+        self.service.image = image_upload('wash.jpg', (1200, 800))
+        self.service.save()
+        # Before the commit the derivatives are still pending
+        self.assertIn(f'<img src="/media/{self.service.image.name}"', self.render())
+
+        name = self.upload((1200, 800))
+        base = f'/media/derivatives/v{images.PIPELINE_VERSION}/services/{name[len("services/"):-4]}'
+        html = self.render()
+        self.assertIn(f'<source type="image/webp" srcset="{base}/320w.webp 320w, {base}/640w.webp 640w', html)
+        self.assertIn(f'src="{base}/960w.jpg"', html)
+        self.assertIn('sizes="33vw"', html)
+        self.assertIn('loading="lazy"', html)
+
+    def test_process_pool_renders_off_the_request_path(self):
+        name = self.upload((1200, 800))
+        with override_settings(IMAGE_DERIVATIVE_WORKERS=1):
+            job = images.schedule_derivatives(name)
+            self.addCleanup(setattr, images, '_pool', None)
+            self.addCleanup(images.pool().shutdown)
+            self.assertEqual(job.result(timeout=60)['widths'], [320, 640, 960])
+
+    def test_failed_derivatives_are_logged(self):
+        name = self.upload((1200, 800))
+        job = Future()
+        with override_settings(IMAGE_DERIVATIVE_WORKERS=1), mock.patch.object(images, 'pool') as pool:
+            pool.return_value.submit.return_value = job
+            self.assertIs(images.schedule_derivatives(name), job)
+        with self.assertLogs('washapp.images', 'ERROR') as logs:
+            job.set_exception(OSError('cannot identify image file'))
+        self.assertIn(name, logs.output[0])
+        self.assertIn('cannot identify image file', logs.output[0])
+
+    def test_login_does_not_requeue_profile_pictures(self):
+        user = User.objects.create_user(username='pic', password='pass')
+        user.profile_picture = image_upload('me.jpg', (400, 400))
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.save()
+        self.assertEqual(len(callbacks), 1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.save(update_fields=['last_login'])
+        self.assertEqual(callbacks, [])
+
+
+class UploadStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media = directory.name
+        media = override_settings(MEDIA_ROOT=self.media, IMAGE_DERIVATIVE_WORKERS=0)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user(username='uploader', password='pass')
+        self.client.login(username='uploader', password='pass')
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media)
+            for root, _, names in os.walk(self.media) if 'derivatives' not in root for name in names
+        )
+
+    def post_picture(self, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('profile'), {'email': 'u@example.com', 'profile_picture': upload})
+        self.user.refresh_from_db()
+        return [str(message) for message in get_messages(response.wsgi_request)]
+
+    def test_identical_uploads_share_one_blob(self):
+        service, _ = create_catalog()
+        other = Service.objects.create(category=service.category, name='Wax', description='', price=10)
+        data = image_upload('a.jpg', (64, 64)).read()
+        for target, filename in ((service, 'stock.jpg'), (other, 'copy of stock.JPG')):
+            target.image = SimpleUploadedFile(filename, data)
+            target.save()
+        self.assertEqual(service.image.name, other.image.name)
+        self.assertRegex(service.image.name, BLOB_NAME)
+        self.assertEqual(self.stored_files(), [service.image.name])
+
+    def test_profile_upload_is_hashed_while_streaming(self):
+        upload = image_upload('me.png', (40, 40), mode='RGBA')
+        self.assertEqual(self.post_picture(upload), ['Profile updated successfully!'])
+        # Named from the sniffed type and the content, not the client's file name
+        self.assertRegex(self.user.profile_picture.name, r'^profile_pics/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(self.user.email, 'u@example.com')
+
+    def test_non_images_are_rejected(self):
+        upload = SimpleUploadedFile('me.jpg', b'#!/bin/sh\necho this is not a picture\n')
+        self.assertEqual(self.post_picture(upload), ['me.jpg is not a JPEG, PNG, GIF or WebP image'])
+        self.assertFalse(self.user.profile_picture)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_oversized_uploads_are_rejected_while_streaming(self):
+        upload = image_upload('big.jpg', (400, 400))
+        with override_settings(MAX_UPLOAD_SIZE=1024, FILE_UPLOAD_MAX_MEMORY_SIZE=512):
+            messages = self.post_picture(upload)
+        self.assertEqual(messages, ['big.jpg is larger than 1.0\xa0KB'])
+        self.assertFalse(self.user.profile_picture)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_only_image_views_reject_other_files(self):
+        def view(request):
+            return HttpResponse(','.join(request.FILES) + '|' + ';'.join(getattr(request, 'upload_errors', [])))
+
+        for wrapped, expected in ((view, b'notes|'), (image_uploads(view), b'|notes.txt is not a JPEG, PNG, GIF or WebP image')):
+            upload = SimpleUploadedFile('notes.txt', b'plain text, well over sixteen bytes long')
+            request = RequestFactory().post('/', {'notes': upload})
+            request._dont_enforce_csrf_checks = True
+            self.assertEqual(wrapped(request).content, expected)
+
+    def test_image_views_still_check_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(reverse('profile'), {'profile_picture': image_upload('me.jpg', (40, 40))})
+        self.assertEqual(response.status_code, 403)
+
+    def test_blobs_are_copied_where_hard_links_fail(self):
+        with mock.patch('washapp.uploads.os.link', side_effect=OSError(18, 'Invalid cross-device link')):
+            self.assertEqual(self.post_picture(image_upload('me.jpg', (40, 40))), ['Profile updated successfully!'])
+        self.assertEqual(self.stored_files(), [self.user.profile_picture.name])
+        with images.default_storage.open(self.user.profile_picture.name) as file:
+            self.assertEqual(file.read(3), b'\xff\xd8\xff')
+
+    def test_collect_garbage_removes_only_orphans(self):
+        self.post_picture(image_upload('old.jpg', (300, 300)))
+        old = self.user.profile_picture.name
+        self.post_picture(image_upload('new.jpg', (200, 200)))
+        new = self.user.profile_picture.name
+        self.assertTrue(os.path.isdir(images.default_storage.path(images.derivative_dir(old))))
+
+        self.assertEqual(collect_garbage(images.default_storage, {new}, min_age=3600), [])
+        self.assertEqual(collect_garbage(images.default_storage, {new}, min_age=0, dry_run=True), [old])
+        self.assertEqual(collect_garbage(images.default_storage, {new}, min_age=0), [old])
+        self.assertEqual(self.stored_files(), [new])
+        self.assertFalse(os.path.exists(images.default_storage.path(images.derivative_dir(old))))
+
+
+class CartCheckoutTests(TestCase):
+    PROVIDERS = 30
+
+    def setUp(self):
+        cache.clear()
+        self.wash, first = create_catalog()
+        self.wax = Service.objects.create(
+            category=self.wash.category, name='Wax', description='', price=Decimal('35.00'), duration=60,
+        )
+        first.services.add(self.wax)
+        for i in range(1, self.PROVIDERS):
+            # No password, hashing 30 of them would dominate the test
+            user = User.objects.create(username=f'fleet-provider-{i}', user_type='service_provider')
+            provider = ServiceProvider.objects.create(
+                user=user, company_name=f'Crew {i}', address='', phone='', email=f'crew{i}@example.com',
+            )
+            provider.services.add(self.wash, self.wax)
+        self.customer = User.objects.create_user(username='fleet', password='pass')
+        self.day = datetime.date.today() + datetime.timedelta(days=7)
+
+    def fill_cart(self, wash, wax):
+        Cart.objects.filter(user=self.customer).delete()
+        for service, quantity in ((self.wash, wash), (self.wax, wax)):
+            if quantity:
+                Cart.objects.create(user=self.customer, service=service, quantity=quantity)
+        return [f'FLEET-{i}' for i in range(wash + wax)]
+
+    def checkout(self, vehicles, time=datetime.time(9)):
+        return checkout(self.customer, self.day, time, 'Van', vehicles, payment_method='invoice')
+
+    def test_every_vehicle_gets_a_booking_slots_and_a_pending_payment(self):
+        bookings = self.checkout(self.fill_cart(wash=3, wax=2))
+        self.assertEqual(len(bookings), 5)
+        # Same time, so every vehicle needs its own provider
+        self.assertEqual(len({booking.service_provider_id for booking in bookings}), 5)
+        self.assertEqual(ProviderSlot.objects.filter(booking__in=bookings).count(), 3 * 2 + 2 * 4)
+        payments = Payment.objects.filter(booking__in=bookings)
+        self.assertEqual(sorted(payments.values_list('amount', flat=True)), [Decimal('20.00')] * 3 + [Decimal('35.00')] * 2)
+        self.assertEqual(set(payments.values_list('status', 'payment_method')), {('pending', 'invoice')})
+        self.assertFalse(Cart.objects.filter(user=self.customer).exists())
+        self.assertEqual(admin_totals()['pending_bookings'], 5)
+
+    def test_bookings_go_through_the_save_signals(self):
+        scheduler = Scheduler(horizon=datetime.timedelta(days=10))
+        scheduler.start()
+        self.checkout(self.fill_cart(wash=2, wax=1))
+        # Reminder timers are set by post_save, which bulk_create skipped
+        self.assertEqual(len(scheduler.timers), 3)
+
+    def test_past_time_today_is_rejected(self):
+        vehicles = self.fill_cart(wash=1, wax=0)
+        noon = timezone.make_aware(datetime.datetime(2030, 1, 1, 12))
+        with mock.patch('django.utils.timezone.now', return_value=noon):
+            with self.assertRaisesMessage(CheckoutError, 'That time slot has already passed'):
+                checkout(self.customer, noon.date(), datetime.time(11, 45), 'Van', vehicles)
+            bookings = checkout(self.customer, noon.date(), datetime.time(12, 15), 'Van', vehicles)
+        self.assertEqual(len(bookings), 1)
+
+    def test_cart_too_big_for_the_free_providers_books_nothing(self):
+        book_slot(
+            self.wash, self.day, datetime.time(9), customer=self.customer,
+            vehicle_type='Sedan', vehicle_number='X', total_amount=self.wash.price,
+        )
+        vehicles = self.fill_cart(wash=self.PROVIDERS, wax=0)
+        with self.assertRaisesMessage(CheckoutError, 'No provider is left for Basic Wash'):
+            self.checkout(vehicles)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(Cart.objects.get(user=self.customer).quantity, self.PROVIDERS)
+
+    def test_vehicle_numbers_must_match_the_cart(self):
+        self.fill_cart(wash=2, wax=1)
+        with self.assertRaisesMessage(CheckoutError, 'Please enter 3 vehicle numbers'):
+            self.checkout(['ONLY-ONE', ''])
+        self.assertFalse(Booking.objects.exists())
+
+    def test_checkout_view(self):
+        self.client.login(username='fleet', password='pass')
+        self.client.post(reverse('cart'), {'service_id': self.wash.id, 'quantity': 2})
+        self.client.post(reverse('cart'), {'service_id': self.wash.id, 'quantity': 1})
+        self.assertEqual(Cart.objects.get(user=self.customer).quantity, 3)
+
+        response = self.client.post(reverse('checkout_cart'), {
+            'booking_date': self.day.isoformat(), 'booking_time': '10:00',
+            'vehicle_type': 'Van', 'vehicle_numbers': 'A-1\nA-2\nA-3\n',
+        })
+        self.assertRedirects(response, reverse('my_bookings'), fetch_redirect_response=False)
+        self.assertEqual(
+            sorted(Booking.objects.filter(customer=self.customer).values_list('vehicle_number', flat=True)),
+            ['A-1', 'A-2', 'A-3'],
+        )
+        self.assertEqual(self.client.get(reverse('cart')).status_code, 200)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.service, self.provider = create_catalog()
+        self.wax = Service.objects.create(
+            category=self.service.category, name='Wax', description='Shine', price=Decimal('35.00'),
+        )
+        self.customer = User.objects.create_user(username='customer', password='pass')
+        seed_bookings(self.customer, self.service, self.provider, 5)
+        other = User.objects.create_user(username='other', password='pass')
+        seed_bookings(other, self.service, self.provider, 3)
+
+    def get(self, name, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse(name), params, **headers)
+
+    def test_services_with_default_and_selected_fields(self):
+        response = self.get('api_services')
+        self.assertEqual(response.json()['results'][0], {
+            'id': self.service.id, 'name': 'Basic Wash', 'price': '20.00', 'duration': 30,
+            'category': self.service.category_id,
+        })
+        response = self.get('api_services', fields='name,category_name,image')
+        self.assertEqual(response.json()['results'][1], {'name': 'Wax', 'category_name': 'Exterior', 'image': None})
+
+        response = self.get('api_services', fields='name,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown fields password', response.json()['error'])
+
+    def test_joined_fields_and_offered_services_change_the_etag(self):
+        etag = self.get('api_services', fields='id,category_name')['ETag']
+        self.assertEqual(self.get('api_services', etag=etag, fields='id,category_name').status_code, 304)
+        self.service.category.name = 'Outside'
+        self.service.category.save()
+        self.assertEqual(self.get('api_services', etag=etag, fields='id,category_name').status_code, 200)
+
+        etag = self.get('api_providers', service=self.wax.id)['ETag']
+        self.provider.services.add(self.wax)
+        response = self.get('api_providers', etag=etag, service=self.wax.id)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.wax.serviceprovider_set.clear()
+        self.assertEqual(self.get('api_providers', etag=etag, service=self.wax.id).status_code, 200)
+
+    def test_id_keyset_pages(self):
+        first = self.get('api_services', page_size=1, fields='name').json()
+        self.assertEqual(first['results'], [{'name': 'Basic Wash'}])
+        second = self.get('api_services', page_size=1, fields='name', cursor=first['next']).json()
+        self.assertEqual(second, {'results': [{'name': 'Wax'}], 'next': None})
+        self.assertEqual(self.get('api_services', cursor='forged').status_code, 400)
+
+    def test_unchanged_poll_gets_an_empty_304_from_one_query(self):
+        response = self.get('api_services')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        with self.assertNumQueries(1):
+            response = self.get('api_services', etag=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+
+        # A different selection is a different document
+        self.assertEqual(self.get('api_services', etag=etag, fields='name').status_code, 200)
+        self.wax.price = Decimal('40.00')
+        self.wax.save()
+        self.assertEqual(self.get('api_services', etag=etag).status_code, 200)
+
+    def test_bookings_are_the_callers_in_my_bookings_order(self):
+        self.assertEqual(self.get('api_bookings').status_code, 401)
+        self.client.login(username='customer', password='pass')
+        expected = list(booking_list(self.customer).values_list('id', flat=True))
+
+        ids, cursor = [], None
+        while True:
+            params = {'page_size': 2, 'fields': 'id,status'}
+            if cursor:
+                params['cursor'] = cursor
+            page = self.get('api_bookings', **params).json()
+            ids += [row['id'] for row in page['results']]
+            cursor = page['next']
+            if not cursor:
+                break
+        self.assertEqual(ids, expected)
+
+        response = self.get('api_bookings', tab='completed', fields='status')
+        self.assertEqual({row['status'] for row in response.json()['results']}, {'completed'})
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_booking_change_invalidates_the_etag(self):
+        self.client.login(username='customer', password='pass')
+        etag = self.get('api_bookings')['ETag']
+        self.assertEqual(self.get('api_bookings', etag=etag).status_code, 304)
+        booking = Booking.objects.filter(customer=self.customer).first()
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertEqual(self.get('api_bookings', etag=etag).status_code, 200)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.smtp = DebuggingSMTPServer(reject={'nobody@example.com'})
+        host, port = self.smtp.start()
+        self.addCleanup(self.smtp.server_close)
+        self.addCleanup(self.smtp.shutdown)
+        settings_override = override_settings(
+            EMAIL_BACKEND='washapp.jobs.QueuedEmailBackend',
+            JOBS_EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST=host, EMAIL_PORT=port, EMAIL_USE_TLS=False,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def work(self):
+        return jobs.work(threads=0, once=True)
+
+    def test_mail_is_queued_then_sent_in_a_batch_over_one_connection(self):
+        for i in range(5):
+            mail.send_mail(f'Reset {i}', 'Follow the link', 'site@example.com', [f'user{i}@example.com'])
+        self.assertEqual(Job.objects.filter(kind='send_email', status='queued').count(), 5)
+        self.assertEqual(self.smtp.messages, [])
+
+        self.assertEqual(self.work(), 5)
+        self.assertEqual([message['Subject'] for _, _, message in self.smtp.messages], [f'Reset {i}' for i in range(5)])
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(Job.objects.filter(status='done').count(), 5)
+
+    def test_a_refused_recipient_only_fails_its_own_job(self):
+        mail.send_mail('Hi', 'Body', 'site@example.com', ['nobody@example.com'])
+        mail.send_mail('Hi', 'Body', 'site@example.com', ['somebody@example.com'])
+        self.work()
+        self.assertEqual(len(self.smtp.messages), 1)
+        failed = Job.objects.get(status='queued')
+        self.assertEqual(failed.payload['to'], ['nobody@example.com'])
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('SMTPRecipientsRefused', failed.last_error)
+
+    def test_failing_job_backs_off_then_fails(self):
+        calls = []
+
+        def explode(payload):
+            calls.append(payload)
+            raise RuntimeError('boom')
+
+        with mock.patch.dict(jobs.HANDLERS, {'explode': (explode, False)}):
+            job = jobs.enqueue('explode', {'n': 1}, max_attempts=3)
+            previous_delay = datetime.timedelta(0)
+            for attempt in range(1, 4):
+                started = timezone.now()
+                self.assertEqual(self.work(), 1)
+                job.refresh_from_db()
+                self.assertEqual(job.attempts, attempt)
+                if attempt < 3:
+                    self.assertEqual(job.status, 'queued')
+                    # Not due yet, and waiting longer after each failure
+                    self.assertEqual(self.work(), 0)
+                    delay = job.run_at - started
+                    self.assertGreater(delay, previous_delay)
+                    previous_delay = delay
+                    Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertEqual(calls, [{'n': 1}] * 3)
+
+    def test_claimed_jobs_are_not_claimed_twice_until_stale(self):
+        for i in range(3):
+            mail.send_mail('Hi', 'Body', 'site@example.com', [f'user{i}@example.com'])
+        self.assertEqual(len(jobs.claim('worker-a', limit=2)), 2)
+        self.assertEqual(len(jobs.claim('worker-b')), 1)
+        self.assertEqual(jobs.claim('worker-b'), [])
+        Job.objects.filter(locked_by='worker-a').update(locked_at=timezone.now() - jobs.STALE_AFTER * 2)
+        self.assertEqual({job.locked_by for job in jobs.claim('worker-b')}, {'worker-b'})
+
+    def test_confirmation_of_a_booking_not_found_is_retried(self):
+        jobs.enqueue('booking_confirmation', {'booking_ids': [404]})
+        self.work()
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('DoesNotExist', job.last_error)
+
+    def test_new_bookings_queue_a_confirmation(self):
+        service, provider = create_catalog()
+        User.objects.create_user(username='customer', password='pass', email='customer@example.com')
+        self.client.login(username='customer', password='pass')
+        day = datetime.date.today() + datetime.timedelta(days=3)
+        self.client.post(reverse('book_service'), {
+            'service_id': service.id, 'booking_date': day.isoformat(), 'booking_time': '09:00',
+            'vehicle_type': 'Sedan', 'vehicle_number': 'JOB-1',
+        })
+        booking = Booking.objects.get(vehicle_number='JOB-1')
+        self.assertEqual(Job.objects.get(kind='booking_confirmation').payload, {'booking_ids': [booking.id]})
+
+        self.work()
+        (_, recipients, message), = self.smtp.messages
+        self.assertEqual(recipients, ['customer@example.com'])
+        self.assertIn('JOB-1', message.get_content())
+
+
+class ReminderSchedulerTests(TestCase):
+    def setUp(self):
+        self.service, self.provider = create_catalog()
+        self.customer = User.objects.create(username='customer', email='customer@example.com')
+        self.now = timezone.now().replace(second=0, microsecond=0)
+        self.scheduler = Scheduler()
+
+    def book(self, start, status='pending'):
+        return Booking.objects.create(
+            customer=self.customer, service=self.service, service_provider=self.provider,
+            booking_date=start.date(), booking_time=start.time(), vehicle_type='Sedan',
+            vehicle_number='REM-1', total_amount=self.service.price, status=status,
+        )
+
+    def notices(self):
+        return [
+            (job.payload['notice'], job.payload.get('hours'))
+            for job in Job.objects.filter(kind='booking_notice').order_by('id')
+        ]
+
+    def test_reminders_then_expiry_of_a_booking_never_confirmed(self):
+        start = self.now + datetime.timedelta(hours=30)
+        booking = self.book(start)
+        self.scheduler.start(self.now)
+        self.assertEqual(self.scheduler.tick(self.now), 0)
+
+        self.assertEqual(self.scheduler.tick(start - datetime.timedelta(hours=24)), 1)
+        self.assertEqual(self.scheduler.tick(start - datetime.timedelta(hours=2)), 0)
+        self.assertEqual(self.scheduler.tick(start - datetime.timedelta(hours=1)), 1)
+        booking.refresh_from_db()
+        self.assertEqual(booking.reminders_sent, 2)
+
+        self.assertEqual(self.scheduler.tick(start), 1)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'cancelled')
+        self.assertEqual(self.notices(), [('reminder', 24), ('reminder', 1), ('expired', None)])
+        self.assertEqual(len(self.scheduler.timers), 0)
+
+    def test_confirmed_booking_is_reminded_but_not_cancelled(self):
+        start = self.now + datetime.timedelta(hours=5)
+        booking = self.book(start)
+        self.scheduler.start(self.now)
+        booking.status = 'confirmed'
+        booking.save()
+        self.assertEqual(self.scheduler.tick(start - datetime.timedelta(hours=1)), 1)
+        self.assertEqual(self.scheduler.tick(start + datetime.timedelta(minutes=1)), 0)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'confirmed')
+        # Booked five hours ahead, so only the one-hour reminder
+        self.assertEqual(self.notices(), [('reminder', 1)])
+
+    def test_saves_in_this_process_move_the_timers_at_once(self):
+        self.scheduler.start(self.now)
+        start = self.now + datetime.timedelta(hours=3)
+        booking = self.book(start)
+        live = self.scheduler.timers.live
+        self.assertEqual(live[booking.id], (start - datetime.timedelta(hours=1), 'remind', 1))
+
+        later = start + datetime.timedelta(hours=2)
+        booking.booking_time = later.time()
+        booking.booking_date = later.date()
+        booking.save()
+        self.assertEqual(live[booking.id], (later - datetime.timedelta(hours=1), 'remind', 1))
+
+        booking.delete()
+        self.assertNotIn(booking.id, live)
+
+    def test_bookings_from_other_processes_and_downtime_are_picked_up(self):
+        overdue = self.book(self.now - datetime.timedelta(days=10))
+        far = self.book(self.now + datetime.timedelta(days=20))
+        self.scheduler.start(self.now)
+        self.assertNotIn(far.id, self.scheduler.timers.live)
+
+        # bulk_create sends no signals, the next tick finds it through updated_at
+        start = self.now + datetime.timedelta(hours=6)
+        bulk, = Booking.objects.bulk_create([Booking(
+            customer=self.customer, service=self.service, service_provider=self.provider,
+            booking_date=start.date(), booking_time=start.time(), vehicle_type='Van',
+            vehicle_number='BULK-1', total_amount=self.service.price,
+        )])
+        self.assertEqual(self.scheduler.tick(self.now), 1)
+        overdue.refresh_from_db()
+        self.assertEqual(overdue.status, 'cancelled')
+        self.assertIn(bulk.id, self.scheduler.timers.live)
+
+    def test_notices_are_emailed(self):
+        self.book(self.now + datetime.timedelta(hours=3))
+        self.scheduler.start(self.now)
+        self.scheduler.tick(self.now + datetime.timedelta(hours=2))
+        with override_settings(JOBS_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            jobs.work(threads=0, once=True)
+        self.assertEqual([message.subject for message in mail.outbox], ['Your car wash is in 1 hour'])
+
+
+@override_settings(SHARED_CACHE=True, SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class CachedUserTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create_user(username='customer', password='pass', phone='555-0001')
+        self.client.login(username='customer', password='pass')
+
+    def user_of(self, response):
+        user = response.wsgi_request.user
+        return user if user.is_authenticated else None
+
+    def test_cached_user_is_compact_and_refreshed_on_profile_save(self):
+        self.client.get(reverse('dashboard'))
+        with self.assertNumQueries(0):
+            user = self.user_of(self.client.get(reverse('dashboard')))
+            self.assertEqual((user.username, user.user_type, user.phone), ('customer', 'customer', '555-0001'))
+        self.assertTrue({'address', 'profile_picture', 'password'} <= user.get_deferred_fields())
+
+        self.client.post(reverse('profile'), {'email': 'new@example.com', 'phone': '555-0002', 'address': 'Here'})
+        user = self.user_of(self.client.get(reverse('dashboard')))
+        self.assertEqual((user.email, user.phone), ('new@example.com', '555-0002'))
+        self.assertEqual(User.objects.get(pk=self.customer.pk).address, 'Here')
+
+    def test_password_change_and_deactivation_end_cached_sessions(self):
+        self.client.get(reverse('dashboard'))
+        self.customer.set_password('changed')
+        self.customer.save()
+        self.assertIsNone(self.user_of(self.client.get(reverse('dashboard'))))
+
+        self.client.login(username='customer', password='changed')
+        self.client.get(reverse('dashboard'))
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertIsNone(self.user_of(self.client.get(reverse('dashboard'))))
+
+    def test_provider_registration_updates_the_cached_provider_id(self):
+        service, _ = create_catalog()
+        User.objects.create_user(username='newcrew', password='pass', user_type='service_provider')
+        self.client.login(username='newcrew', password='pass')
+        response = self.client.get(reverse('dashboard'))
+        self.assertIsNone(response.context['provider'])
+
+        self.client.post(reverse('provider_registration'), {
+            'company_name': 'New Crew', 'address': '', 'phone': '', 'services': [service.id],
+        })
+        crew = ServiceProvider.objects.get(company_name='New Crew')
+        self.client.get(reverse('dashboard'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['provider_id'], crew.id)
+        self.assertEqual(response.context['provider'].company_name, 'New Crew')
+
+    @override_settings(SHARED_CACHE=False, SESSION_ENGINE='django.contrib.sessions.backends.db')
+    def test_per_process_cache_is_not_trusted(self):
+        self.client.login(username='customer', password='pass')
+        self.client.get(reverse('dashboard'))
+        # Session and user from the database on every request, and the three stats queries
+        with self.assertNumQueries(5):
+            self.client.get(reverse('dashboard'))
 
-# Create your tests here.
@@ -0,0 +1,244 @@
+import hashlib
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+# Leading bytes of each accepted image type and the extension it is stored under
+SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+)
+# Enough of the head of a file to recognise its type
+SNIFF_BYTES = 16
+STAGING_DIR = '.staging'
+# A stored blob: <upload_to>/<first two hex digits>/<sha256>.<ext>
+BLOB_NAME = re.compile(r'(?:^|/)([0-9a-f]{2})/(\1[0-9a-f]{62})\.\w+$')
+
+
+def sniff_extension(head):
+    """Extension of an accepted image type from its first bytes, or None"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+
+def max_upload_size():
+    return getattr(settings, 'MAX_UPLOAD_SIZE', 5 * 1024 * 1024)
+
+
+def blob_name(name, digest, extension=None):
+    """Content-addressed name of an upload, keeping the directory from upload_to"""
+    extension = extension or posixpath.splitext(name)[1].lower()
+    return posixpath.join(posixpath.dirname(name), digest[:2], digest + extension)
+
+
+class HashedUploadedFile(TemporaryUploadedFile):
+    """Upload written to a temporary file, with its SHA-256 and sniffed extension"""
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        super().__init__(name, content_type, size, charset, content_type_extra)
+        self.sha256 = None
+        self.extension = None
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """Stream each uploaded file to disk in chunks, hashing it on the way.
+
+    Files larger than MAX_UPLOAD_SIZE or not a JPEG, PNG, GIF or WebP are
+    skipped as soon as that is known, the rest of them is read and dropped
+    without being buffered. The reasons go into ``request.upload_errors``
+    so views can report them.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.content_length = content_length
+        if not hasattr(self.request, 'upload_errors'):
+            self.request.upload_errors = []
+
+    def reject(self, message):
+        self.request.upload_errors.append(message)
+        self.file.close()
+        raise SkipFile()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = HashedUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.hash = hashlib.sha256()
+        self.head = b''
+        limit = max_upload_size()
+        if self.content_length and self.content_length > limit + 64 * 1024:
+            # The whole request is too big even counting the other fields generously
+            self.reject(f'{self.file_name} is larger than {filesizeformat(limit)}')
+
+    def receive_data_chunk(self, raw_data, start):
+        if len(self.head) < SNIFF_BYTES:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES and sniff_extension(self.head) is None:
+                self.reject(f'{self.file_name} is not a JPEG, PNG, GIF or WebP image')
+        if start + len(raw_data) > max_upload_size():
+            self.reject(f'{self.file_name} is larger than {filesizeformat(max_upload_size())}')
+        self.hash.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        extension = sniff_extension(self.head)
+        if extension is None:
+            # Shorter than SNIFF_BYTES, too late to skip, so just leave it out of FILES
+            self.request.upload_errors.append(f'{self.file_name} is not a JPEG, PNG, GIF or WebP image')
+            self.file.close()
+            return None
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hash.hexdigest()
+        self.file.extension = extension
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+
+
+def image_uploads(view):
+    """Stream the view's uploads through HashingUploadHandler, so only images get in.
+
+    The handler must be in place before anything reads request.POST, which
+    CsrfViewMiddleware does for form posts, so the CSRF check moves inside,
+    after the handler is added.
+    """
+    protected = csrf_protect(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers.insert(0, HashingUploadHandler(request))
+        return protected(request, *args, **kwargs)
+
+    return csrf_exempt(wrapper)
+
+
+def file_digest(content):
+    """SHA-256 of any Django File, read in chunks"""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File storage naming every file by the SHA-256 of its content.
+
+    Saving content that is already stored returns the existing name, so
+    identical uploads share one file. Files are staged next to their final
+    place and hard-linked into it, which cannot overwrite a blob another
+    upload of the same content just created; where hard links are not
+    available the file is copied and renamed into place instead. Files are
+    never deleted when a model drops them, `manage.py collect_blobs` removes
+    the unreferenced ones.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # _save names the file after its content, so the suggested name never collides
+        return name
+
+    def _save(self, name, content):
+        digest = getattr(content, 'sha256', None) or file_digest(content)
+        name = blob_name(name, digest, getattr(content, 'extension', None))
+        path = self.path(name)
+        if os.path.exists(path):
+            # Fresh again, so collect_blobs leaves it alone until this upload commits
+            os.utime(path)
+            return name
+
+        staging = self.path(STAGING_DIR)
+        os.makedirs(staging, exist_ok=True)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, staged = tempfile.mkstemp(dir=staging)
+        try:
+            if hasattr(content, 'temporary_file_path'):
+                os.close(fd)
+                file_move_safe(content.temporary_file_path(), staged, allow_overwrite=True)
+            else:
+                with os.fdopen(fd, 'wb') as file:
+                    for chunk in content.chunks():
+                        file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(staged, self.file_permissions_mode)
+            try:
+                os.link(staged, path)
+            except FileExistsError:
+                # Another upload of the same content got there first
+                pass
+            except OSError:
+                # No hard links here, e.g. across filesystems: copy next to the
+                # blob and rename it into place, replacing at worst the same bytes
+                fd, copied = tempfile.mkstemp(dir=os.path.dirname(path))
+                os.close(fd)
+                try:
+                    shutil.copyfile(staged, copied)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(copied, self.file_permissions_mode)
+                    os.replace(copied, path)
+                except BaseException:
+                    os.unlink(copied)
+                    raise
+        finally:
+            os.unlink(staged)
+        return name
+
+
+def stored_blobs(storage):
+    """Names of every blob in a ContentAddressedStorage, skipping staging and derivatives"""
+    for root, dirs, files in os.walk(storage.location):
+        relative = os.path.relpath(root, storage.location).replace(os.sep, '/')
+        if relative == '.':
+            dirs[:] = [d for d in dirs if d not in (STAGING_DIR, 'derivatives')]
+            continue
+        for filename in files:
+            name = f'{relative}/{filename}'
+            if BLOB_NAME.search(name):
+                yield name
+
+
+def collect_garbage(storage, referenced, min_age=3600, dry_run=False):
+    """Delete blobs not in ``referenced``, with their derivatives, and stale staging files.
+
+    Files younger than ``min_age`` seconds are kept, as their upload may not
+    have committed yet. Returns the names of the blobs removed.
+    """
+    from .images import derivative_dir
+
+    cutoff = time.time() - min_age
+    removed = []
+    for name in stored_blobs(storage):
+        if name in referenced or os.path.getmtime(storage.path(name)) > cutoff:
+            continue
+        removed.append(name)
+        if not dry_run:
+            storage.delete(name)
+            shutil.rmtree(storage.path(derivative_dir(name)), ignore_errors=True)
+
+    staging = storage.path(STAGING_DIR)
+    if not dry_run and os.path.isdir(staging):
+        for entry in os.scandir(staging):
+            if entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+    return removed
@@ -1,7 +1,7 @@
 # washapp/urls.py
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, async_views, views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -11,11 +11,24 @@ urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('profile/', views.profile, name='profile'),
     path('my-bookings/', views.my_bookings, name='my_bookings'),
+    path('my-bookings/<str:tab>/', views.my_bookings_tab, name='my_bookings_tab'),
+    # Async versions of the two heaviest pages, for ASGI deployments
+    path('async/dashboard/', async_views.dashboard, name='dashboard_async'),
+    path('async/my-bookings/', async_views.my_bookings, name='my_bookings_async'),
     path('book-service/', views.book_service, name='book_service'),
+    path('cart/', views.cart, name='cart'),
+    path('cart/checkout/', views.checkout_cart, name='checkout_cart'),
     path('services/', views.services_list, name='services_list'),
     path('about/', views.about, name='about'),
     path('contact/', views.contact, name='contact'),
     path('faq/', views.faq, name='faq'),
+    path('export/<str:name>/', views.export_data, name='export_data'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('api/services/', api.services, name='api_services'),
+    path('api/categories/', api.categories, name='api_categories'),
+    path('api/providers/', api.providers, name='api_providers'),
+    path('api/bookings/', api.bookings, name='api_bookings'),
+    path('metrics/cache/', views.cache_metrics, name='cache_metrics'),
     
     # Provider registration
     path('provider/registration/', views.provider_registration, name='provider_registration'),
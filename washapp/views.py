@@ -3,8 +3,24 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date, parse_time
+from django.utils.functional import SimpleLazyObject
 from .models import *
 from .forms import UserRegistrationForm  # You'll need to create this form
+from .accounts import provider_id
+from .catalog import catalog
+from .checkout import CheckoutError, cart_lines, checkout
+from .bookings import BOOKING_TABS, add_status_styles, booking_list, booking_page, page_size, tab_counts
+from .exports import EXPORT_FORMATS, EXPORTS, export_lines, filtered, parse_day
+from .rollups import admin_totals, rollup_tab_counts
+from .scheduling import SlotUnavailable, book_slot
+from .stats import cache_counters, customer_stats, provider_stats
+from .decorators import admin_required
+from .instrumentation import prometheus_text
+from .jobs import enqueue
+from .pagecache import render_cached
+from .uploads import image_uploads
 from datetime import date
 
 def register(request):
@@ -38,14 +54,77 @@ def register(request):
 def home(request):
     """Home page"""
     try:
-        services = Service.objects.all()[:6]
+        services = catalog().services[:6]
     except:
         services = []
     
-    return render(request, 'home.html', {
+    return render_cached(request, 'home.html', {
         'services': services
     })
 
+EMPTY_CUSTOMER_STATS = {
+    'recent_bookings': [], 'total_bookings': 0, 'upcoming_bookings': 0,
+    'completed_bookings': 0, 'total_spent': 0, 'next_booking': None,
+}
+EMPTY_PROVIDER_STATS = {
+    'total_bookings': 0, 'today_bookings': 0, 'pending_bookings': 0,
+    'completed_bookings': 0, 'avg_rating': 0.0, 'today_schedule': [],
+}
+
+def customer_dashboard_context(stats):
+    """Template context of the customer dashboard, shared with the async view"""
+    bookings = stats['recent_bookings']
+    next_booking = stats['next_booking']
+    
+    # Add status color and icon to bookings
+    add_status_styles(bookings)
+    if next_booking:
+        add_status_styles([next_booking])
+    
+    return {
+        'bookings': bookings,
+        'total_bookings': stats['total_bookings'],
+        'upcoming_bookings': stats['upcoming_bookings'],
+        'completed_bookings': stats['completed_bookings'],
+        'total_spent': stats['total_spent'],
+        'next_booking': next_booking,
+        'recent_bookings': bookings[:5],  # Show first 5 as recent
+    }
+
+def provider_dashboard_context(provider_pk, stats):
+    """Template context of the provider dashboard, shared with the async view.
+
+    ``provider`` is the ServiceProvider, None before registration; it is
+    only fetched if the template uses more than its id.
+    """
+    provider = None
+    if provider_pk is not None:
+        provider = SimpleLazyObject(lambda: ServiceProvider.objects.get(id=provider_pk))
+    return {
+        'provider': provider,
+        'provider_id': provider_pk,
+        'total_bookings': stats['total_bookings'],
+        'today_bookings': stats['today_bookings'],
+        'pending_bookings': stats['pending_bookings'],
+        'completed_bookings': stats['completed_bookings'],
+        'avg_rating': stats['avg_rating'],
+        'today_schedule': stats['today_schedule'],
+    }
+
+def admin_dashboard_context(totals, recent_bookings):
+    return {
+        'total_users': totals['total_users'],
+        'total_customers': totals['total_customers'],
+        'total_providers': totals['total_providers'],
+        'total_bookings': totals['total_bookings'],
+        'total_revenue': totals['total_revenue'],
+        'pending_bookings': totals['pending_bookings'],
+        'recent_bookings': add_status_styles(recent_bookings),
+    }
+
+def recent_bookings_query():
+    return Booking.objects.select_related('customer', 'service').order_by('-created_at')[:10]
+
 @login_required
 def dashboard(request):
     """Dashboard view"""
@@ -54,130 +133,32 @@ def dashboard(request):
     # Now user has user_type attribute from your custom User model
     if user.user_type == 'customer':
         try:
-            bookings = Booking.objects.filter(customer=user).order_by('-created_at')[:5]
-            total_bookings = Booking.objects.filter(customer=user).count()
-            upcoming_bookings = Booking.objects.filter(customer=user, status__in=['pending', 'confirmed']).count()
-            completed_bookings = Booking.objects.filter(customer=user, status='completed').count()
-            
-            # Calculate total spent
-            completed_booking_amounts = Booking.objects.filter(
-                customer=user, 
-                status='completed'
-            ).values_list('total_amount', flat=True)
-            total_spent = sum(completed_booking_amounts) if completed_booking_amounts else 0
-            
-            next_booking = Booking.objects.filter(
-                customer=user, 
-                status__in=['pending', 'confirmed']
-            ).order_by('booking_date', 'booking_time').first()
-            
+            # One aggregate query on a miss, nothing at all on a cache hit
+            stats = customer_stats(user.id)
         except Exception as e:
-            bookings = []
-            total_bookings = 0
-            upcoming_bookings = 0
-            completed_bookings = 0
-            total_spent = 0
-            next_booking = None
-        
-        # Add status color and icon to bookings
-        for booking in bookings:
-            if booking.status == 'completed':
-                booking.status_color = 'success'
-                booking.status_icon = 'check-circle'
-            elif booking.status == 'pending':
-                booking.status_color = 'warning'
-                booking.status_icon = 'clock'
-            elif booking.status == 'confirmed':
-                booking.status_color = 'info'
-                booking.status_icon = 'check'
-            elif booking.status == 'in_progress':
-                booking.status_color = 'primary'
-                booking.status_icon = 'spinner'
-            elif booking.status == 'cancelled':
-                booking.status_color = 'danger'
-                booking.status_icon = 'times-circle'
-            else:
-                booking.status_color = 'secondary'
-                booking.status_icon = 'question-circle'
+            stats = EMPTY_CUSTOMER_STATS
         
-        return render(request, 'customer_dashboard.html', {
-            'bookings': bookings,
-            'total_bookings': total_bookings,
-            'upcoming_bookings': upcoming_bookings,
-            'completed_bookings': completed_bookings,
-            'total_spent': total_spent,
-            'next_booking': next_booking,
-            'recent_bookings': bookings[:5],  # Show first 5 as recent
-        })
+        return render(request, 'customer_dashboard.html', customer_dashboard_context(stats))
     
     elif user.user_type == 'service_provider':
-        try:
-            provider = ServiceProvider.objects.get(user=user)
-            provider_bookings = Booking.objects.filter(service_provider=provider)
-            
-            # Provider stats
-            total_bookings = provider_bookings.count()
-            today = datetime.date.today()
-            today_bookings = provider_bookings.filter(booking_date=today).count()
-            pending_bookings = provider_bookings.filter(status='pending').count()
-            completed_bookings = provider_bookings.filter(status='completed').count()
-            
-            # Calculate rating
-            reviews = Review.objects.filter(booking__service_provider=provider)
-            avg_rating = reviews.aggregate(models.Avg('rating'))['rating__avg'] or 0.0
-            
-            # Today's schedule
-            today_schedule = provider_bookings.filter(
-                booking_date=today,
-                status__in=['pending', 'confirmed']
-            ).order_by('booking_time')
-            
-        except ServiceProvider.DoesNotExist:
-            provider = None
-            total_bookings = 0
-            today_bookings = 0
-            pending_bookings = 0
-            completed_bookings = 0
-            avg_rating = 0.0
-            today_schedule = []
+        # Comes with the cached user, so no lookup
+        provider_pk = provider_id(user)
+        if provider_pk is not None:
+            # Provider stats, cached per provider and day until a booking
+            # or review of this provider changes
+            stats = provider_stats(provider_pk)
+        else:
+            stats = EMPTY_PROVIDER_STATS
             messages.info(request, 'Please complete provider registration')
         
-        return render(request, 'provider_dashboard.html', {
-            'provider': provider,
-            'total_bookings': total_bookings,
-            'today_bookings': today_bookings,
-            'pending_bookings': pending_bookings,
-            'completed_bookings': completed_bookings,
-            'avg_rating': avg_rating,
-            'today_schedule': today_schedule,
-        })
+        return render(request, 'provider_dashboard.html', provider_dashboard_context(provider_pk, stats))
     
     elif user.user_type == 'admin':
-        # Admin stats
-        total_users = User.objects.count()
-        total_customers = User.objects.filter(user_type='customer').count()
-        total_providers = User.objects.filter(user_type='service_provider').count()
-        total_bookings = Booking.objects.count()
-        
-        # Revenue calculation
-        completed_bookings = Booking.objects.filter(status='completed')
-        total_revenue = sum(booking.total_amount for booking in completed_bookings)
+        # Admin stats, summed over the daily rollups instead of every booking
+        totals = admin_totals()
+        recent_bookings = list(recent_bookings_query())
         
-        # Pending bookings
-        pending_bookings = Booking.objects.filter(status='pending').count()
-        
-        # Recent bookings
-        recent_bookings = Booking.objects.all().order_by('-created_at')[:10]
-        
-        return render(request, 'admin_dashboard.html', {
-            'total_users': total_users,
-            'total_customers': total_customers,
-            'total_providers': total_providers,
-            'total_bookings': total_bookings,
-            'total_revenue': total_revenue,
-            'pending_bookings': pending_bookings,
-            'recent_bookings': recent_bookings,
-        })
+        return render(request, 'admin_dashboard.html', admin_dashboard_context(totals, recent_bookings))
     
     # Default fallback - should not reach here with valid user_type
     return render(request, 'dashboard.html')
@@ -207,23 +188,27 @@ def book_service(request):
             service_id = request.POST.get('service_id')
             service = get_object_or_404(Service, id=service_id)
 
-            provider = ServiceProvider.objects.filter(services=service).first()
-            if not provider:
-                messages.error(request, 'No available provider for this service')
+            booking_date = parse_date(request.POST.get('booking_date') or '')
+            booking_time = parse_time(request.POST.get('booking_time') or '')
+            if not booking_date or not booking_time:
+                messages.error(request, 'Please choose a valid date and time')
                 return redirect('book_service')
 
-            Booking.objects.create(
-                customer=request.user,
-                service=service,
-                service_provider=provider,
-                booking_date=request.POST.get('booking_date'),
-                booking_time=request.POST.get('booking_time'),
-                vehicle_type=request.POST.get('vehicle_type'),
-                vehicle_number=request.POST.get('vehicle_number'),
-                special_instructions=request.POST.get('special_instructions', ''),
-                total_amount=service.price,
-                status='pending'
-            )
+            # Least-loaded provider who is free for the whole service duration
+            try:
+                booking = book_slot(
+                    service, booking_date, booking_time,
+                    customer=request.user,
+                    vehicle_type=request.POST.get('vehicle_type'),
+                    vehicle_number=request.POST.get('vehicle_number'),
+                    special_instructions=request.POST.get('special_instructions', ''),
+                    total_amount=service.price,
+                    status='pending'
+                )
+            except SlotUnavailable:
+                messages.error(request, 'No available provider for this service at the selected time')
+                return redirect('book_service')
+            enqueue('booking_confirmation', {'booking_ids': [booking.id]})
 
             messages.success(request, 'Booking created successfully!')
             return redirect('my_bookings')
@@ -233,7 +218,7 @@ def book_service(request):
             return redirect('book_service')
 
     # GET request
-    services = Service.objects.all()
+    services = catalog().services
     today = date.today()
 
     return render(request, 'booking/book_service.html', {
@@ -242,65 +227,135 @@ def book_service(request):
     })
 
 
+@login_required
+def cart(request):
+    """Show the cart, and add or remove services"""
+    if request.method == 'POST':
+        action = request.POST.get('action', 'add')
+        if action == 'remove':
+            Cart.objects.filter(user=request.user, id=request.POST.get('line_id')).delete()
+            messages.info(request, 'Removed from your cart')
+            return redirect('cart')
+
+        service = get_object_or_404(Service, id=request.POST.get('service_id'))
+        try:
+            quantity = int(request.POST.get('quantity') or 1)
+        except ValueError:
+            quantity = 0
+        if quantity < 1:
+            messages.error(request, 'Please enter a quantity of at least 1')
+            return redirect('cart')
+        line, created = Cart.objects.get_or_create(
+            user=request.user, service=service, defaults={'quantity': quantity}
+        )
+        if not created:
+            line.quantity += quantity
+            line.save(update_fields=['quantity'])
+        messages.success(request, f'Added {quantity} x {service.name} to your cart')
+        return redirect('cart')
+
+    lines = cart_lines(request.user)
+    return render(request, 'booking/cart.html', {
+        'lines': lines,
+        'vehicles': sum(line.quantity for line in lines),
+        'total': sum((line.service.price * line.quantity for line in lines), 0),
+        'services': catalog().services,
+        'today': date.today(),
+    })
+
+
+@login_required
+def checkout_cart(request):
+    """Book every vehicle in the cart at once"""
+    if request.method != 'POST':
+        return redirect('cart')
+
+    booking_date = parse_date(request.POST.get('booking_date') or '')
+    booking_time = parse_time(request.POST.get('booking_time') or '')
+    if not booking_date or not booking_time:
+        messages.error(request, 'Please choose a valid date and time')
+        return redirect('cart')
+
+    try:
+        bookings = checkout(
+            request.user, booking_date, booking_time,
+            vehicle_type=request.POST.get('vehicle_type', ''),
+            vehicle_numbers=request.POST.get('vehicle_numbers', '').splitlines(),
+            special_instructions=request.POST.get('special_instructions', ''),
+            payment_method=request.POST.get('payment_method') or 'card',
+        )
+    except CheckoutError as e:
+        messages.error(request, str(e))
+        return redirect('cart')
+
+    messages.success(request, f'{len(bookings)} bookings created successfully!')
+    return redirect('my_bookings')
+
+
 @login_required
 def my_bookings(request):
     """View user's bookings"""
     user = request.user
+    active_tab = request.GET.get('tab', 'all')
+    if active_tab not in BOOKING_TABS:
+        active_tab = 'all'
+    size = page_size(request.GET.get('page_size'))
     
     try:
-        if user.user_type == 'customer':
-            bookings = Booking.objects.filter(customer=user).order_by('-booking_date', '-booking_time')
-        elif user.user_type == 'service_provider':
-            try:
-                provider = ServiceProvider.objects.get(user=user)
-                bookings = Booking.objects.filter(service_provider=provider).order_by('-booking_date', '-booking_time')
-            except ServiceProvider.DoesNotExist:
-                bookings = []
-                messages.error(request, 'Please complete provider registration first')
+        # Counts for every tab come from one aggregate; only the active tab
+        # is rendered here and the others are fetched when opened
+        bookings = booking_list(user)
+        if user.user_type == 'admin':
+            # Counting every booking would scan the whole table
+            tab_totals = rollup_tab_counts()
         else:
-            # Admin can see all bookings
-            bookings = Booking.objects.all().order_by('-booking_date', '-booking_time')
-        
-        # Add custom attributes for template
-        for booking in bookings:
-            # Status colors and icons
-            if booking.status == 'completed':
-                booking.status_color = 'success'
-                booking.status_icon = 'check-circle'
-            elif booking.status == 'pending':
-                booking.status_color = 'warning'
-                booking.status_icon = 'clock'
-            elif booking.status == 'confirmed':
-                booking.status_color = 'info'
-                booking.status_icon = 'check'
-            elif booking.status == 'in_progress':
-                booking.status_color = 'primary'
-                booking.status_icon = 'spinner'
-            elif booking.status == 'cancelled':
-                booking.status_color = 'danger'
-                booking.status_icon = 'times-circle'
-            else:
-                booking.status_color = 'secondary'
-                booking.status_icon = 'question-circle'
-            
-            # Check if review exists
-            try:
-                booking.review = Review.objects.get(booking=booking)
-            except Review.DoesNotExist:
-                booking.review = None
-                
+            tab_totals = tab_counts(bookings)
+        page, next_cursor = booking_page(bookings, active_tab, page_size=size)
+    except ServiceProvider.DoesNotExist:
+        tab_totals, page, next_cursor = dict.fromkeys(BOOKING_TABS, 0), [], None
+        messages.error(request, 'Please complete provider registration first')
     except Exception as e:
-        bookings = []
+        tab_totals, page, next_cursor = dict.fromkeys(BOOKING_TABS, 0), [], None
         messages.error(request, f'Error loading bookings: {str(e)}')
     
-    return render(request, 'my_bookings.html', {'bookings': bookings})
+    return render(request, 'my_bookings.html', {
+        'active_tab': active_tab,
+        'tab_counts': tab_totals,
+        'bookings': page,
+        'next_cursor': next_cursor,
+        'page_size': size,
+    })
+
+@login_required
+def my_bookings_tab(request, tab):
+    """One page of a my_bookings tab, loaded when the tab is opened"""
+    if tab not in BOOKING_TABS:
+        raise Http404('Unknown bookings tab')
+    
+    cursor = request.GET.get('cursor')
+    size = page_size(request.GET.get('page_size'))
+    try:
+        bookings, next_cursor = booking_page(booking_list(request.user), tab, cursor, size)
+    except ServiceProvider.DoesNotExist:
+        bookings, next_cursor = [], None
+    except ValueError:
+        return HttpResponseBadRequest('Invalid cursor')
+    
+    return render(request, 'booking/booking_rows.html', {
+        'tab': tab,
+        'bookings': bookings,
+        'next_cursor': next_cursor,
+        'page_size': size,
+        'first_page': not cursor,
+    })
 
 @login_required
 def services_list(request):
     """List services with categories"""
     try:
-        services = Service.objects.select_related('category').all()
-        categories = ServiceCategory.objects.all()
+        current = catalog()
+        services = current.services
+        categories = current.categories
     except:
         services = []
         categories = []
@@ -311,6 +366,7 @@ def services_list(request):
     })
 
 @login_required
+@image_uploads
 def profile(request):
     """User profile management"""
     user = request.user
@@ -321,12 +377,16 @@ def profile(request):
         user.phone = request.POST.get('phone', user.phone)
         user.address = request.POST.get('address', user.address)
         
-        # Handle profile picture upload
+        # Handle profile picture upload, already size and type checked while streaming in
         if 'profile_picture' in request.FILES:
             user.profile_picture = request.FILES['profile_picture']
         
         user.save()
-        messages.success(request, 'Profile updated successfully!')
+        upload_errors = getattr(request, 'upload_errors', [])
+        for error in upload_errors:
+            messages.error(request, error)
+        if not upload_errors:
+            messages.success(request, 'Profile updated successfully!')
         return redirect('profile')
     
     return render(request, 'profile.html', {'user': user})
@@ -338,13 +398,10 @@ def provider_registration(request):
         messages.error(request, 'This page is only for service providers')
         return redirect('dashboard')
     
-    try:
-        provider = ServiceProvider.objects.get(user=request.user)
+    if provider_id(request.user) is not None:
         # Provider already exists, redirect to dashboard
         messages.info(request, 'Provider registration already completed')
         return redirect('dashboard')
-    except ServiceProvider.DoesNotExist:
-        provider = None
     
     if request.method == 'POST':
         try:
@@ -369,7 +426,7 @@ def provider_registration(request):
     
     # GET request - show registration form
     try:
-        services = Service.objects.all()
+        services = catalog().services
     except:
         services = []
     
@@ -384,24 +441,23 @@ def update_booking_status(request, booking_id):
         messages.error(request, 'Only service providers can update booking status')
         return redirect('dashboard')
     
-    try:
-        provider = ServiceProvider.objects.get(user=request.user)
-        booking = get_object_or_404(Booking, id=booking_id, service_provider=provider)
-        
-        if request.method == 'POST':
-            new_status = request.POST.get('status')
-            if new_status in dict(Booking.STATUS_CHOICES):
-                booking.status = new_status
-                booking.save()
-                messages.success(request, f'Booking status updated to {booking.get_status_display()}')
-            else:
-                messages.error(request, 'Invalid status')
-        
-        return redirect('dashboard')
-        
-    except ServiceProvider.DoesNotExist:
+    provider = provider_id(request.user)
+    if provider is None:
         messages.error(request, 'Please complete provider registration first')
         return redirect('provider_registration')
+    
+    booking = get_object_or_404(Booking, id=booking_id, service_provider_id=provider)
+    
+    if request.method == 'POST':
+        new_status = request.POST.get('status')
+        if new_status in dict(Booking.STATUS_CHOICES):
+            booking.status = new_status
+            booking.save()
+            messages.success(request, f'Booking status updated to {booking.get_status_display()}')
+        else:
+            messages.error(request, 'Invalid status')
+    
+    return redirect('dashboard')
 
 @login_required
 def add_review(request, booking_id):
@@ -413,7 +469,7 @@ def add_review(request, booking_id):
             rating = request.POST.get('rating')
             comment = request.POST.get('comment', '')
             
-            # Create or update review
+            # Create or update review; signals fold it into the provider's rating
             review, created = Review.objects.update_or_create(
                 booking=booking,
                 defaults={
@@ -423,13 +479,6 @@ def add_review(request, booking_id):
                 }
             )
             
-            # Update provider rating
-            provider = booking.service_provider
-            provider_reviews = Review.objects.filter(booking__service_provider=provider)
-            avg_rating = provider_reviews.aggregate(models.Avg('rating'))['rating__avg'] or 0.0
-            provider.rating = avg_rating
-            provider.save()
-            
             messages.success(request, 'Review submitted successfully!')
             return redirect('my_bookings')
         
@@ -441,15 +490,49 @@ def add_review(request, booking_id):
 
 # Simple views for missing pages
 def about(request):
-    return render(request, 'about.html')
+    return render_cached(request, 'about.html')
 
 def contact(request):
-    return render(request, 'contact.html')
+    return render_cached(request, 'contact.html')
 
 def faq(request):
-    return render(request, 'faq.html')
+    return render_cached(request, 'faq.html')
 
 # Additional utility views
+@admin_required
+def cache_metrics(request):
+    """Hit and miss counters of the dashboard stats caches in this process"""
+    return JsonResponse(cache_counters())
+
+@admin_required
+def export_data(request, name):
+    """Stream bookings or payments as CSV or NDJSON, filtered by ?start=, ?end= and ?status="""
+    if name not in EXPORTS:
+        raise Http404('Unknown export')
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('Format must be csv or ndjson')
+    
+    try:
+        start = parse_day(request.GET.get('start'))
+        end = parse_day(request.GET.get('end'))
+    except ValueError:
+        return HttpResponseBadRequest('Dates must be YYYY-MM-DD')
+    statuses = [s for s in request.GET.get('status', '').split(',') if s]
+    
+    export = EXPORTS[name]
+    response = StreamingHttpResponse(
+        export_lines(export, filtered(export, start, end, statuses), fmt),
+        content_type=EXPORT_FORMATS[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    return response
+
+@admin_required
+def metrics(request):
+    """Per-view request histograms and cache counters in Prometheus text format"""
+    return HttpResponse(prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @login_required
 def booking_details(request, booking_id):
     """View booking details"""